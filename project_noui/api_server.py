@@ -1,7 +1,7 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-import mysql.connector
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import time
 from typing import Union
@@ -9,100 +9,176 @@ import json
 import os
 import sys
 from pathlib import Path
-import importlib.util
-import inspect
+import threading
 
 # 添加项目根目录到路径
 parent_dir = os.path.abspath(os.path.join(os.getcwd(), ".."))
 sys.path.append(parent_dir)
 
-# 简化导入，避免akshare依赖问题
-import mysql.connector
-from datetime import datetime, timedelta
-from vnpy.trader.constant import Interval
+# 导入数据库连接池
+from tools.db_pool import get_connection
 
-# 导入项目基础类
-from project_base import PROJECT_REGISTER, get_project, list_projects, register_project, ProjectBase
+# 导入标的目录
+from tools.symbol_catalog import SymbolCatalog
 
-# 导入技术指标工具
-from indicator_tools import calculate_indicators_from_bars
+# 导入周线/月线汇总表
+from tools.bar_rollup import INTERVAL_DAILY, ROLLUP_INTERVALS, parse_interval, rollup_table
 
+# 导入物化指标
+from tools.indicator_store import load_indicators
 
-app = Flask(__name__)
-CORS(app)  # 允许跨域请求
+# 导入项目基础类
+from project_base import (
+    ProjectBase, get_project, has_project, list_projects, register_project, set_local_result_store,
+    set_project_loader, unregister_project
+)
 
-# 全局数据对象，用于存储策略数据
-class Data:
-    def __init__(self):
-        self.tech_data_dict = {}
-        self.trade_data_dict = {}
-        self.start_date = None
-        self.end_date = None
+# 导入项目延迟加载器
+from project_loader import ProjectLoader
 
-data = Data()
+# 导入结果存储
+from result_store import ResultStore
 
-def auto_register_projects(directory: str,
-                      *,
-                      base_class: type | None = ProjectBase,   # 限定必须继承某个基类；None 表示不限制
-                      recursive: bool = True) -> None:
-    """
-    扫描目录 -> 动态导入模块 -> 找出类 -> 构造对象 -> 调用 register_project
-    """
-    if not directory:
-        directory = os.path.join(os.path.dirname(__file__), "projects")
-    
-    dir_path = Path(directory).resolve()
-    sys.path.insert(0, str(dir_path))
+# 导入K线缓存
+from bar_cache import BAR_COLUMNS, BarCache
 
-    pattern = "**/*.py" if recursive else "*.py"
-    for file in dir_path.glob(pattern):
-        if file.name.startswith("_"):
-            continue
+# 导入任务队列
+from job_manager import EVENT_END, JobManager, QueueFull
 
-        module_name = f"_auto_{file.stem}_{file.stat().st_ino}"
-        spec = importlib.util.spec_from_file_location(module_name, file)
-        if spec is None:
-            continue
-        module = importlib.util.module_from_spec(spec)
-        sys.modules[module_name] = module
+# 导入技术指标工具
+from indicator_tools import parse_indicator_spec, indicator_warmup_bars, compute_indicator_series
 
-        try:
-            assert isinstance(spec.loader, importlib.abc.Loader)
-            spec.loader.exec_module(module)
-        except Exception as e:
-            print(f"[WARN] 加载 {file} 失败: {e}")
-            continue
+# 导入降采样工具
+from downsample import parse_max_points, downsample_lines, aggregate_ohlc, aggregate_aligned, METHOD_LTTB
 
-        for _, cls in inspect.getmembers(module, inspect.isclass):
-            if cls.__module__ != module.__name__:
-                continue
-            if base_class is not None and not issubclass(cls, base_class):
-                print(f"[WARN] {cls} 不是 {base_class} 的子类, 跳过")
-                continue
-            try:
-                obj = cls()
-            except TypeError as e:
-                print(f"[WARN] 实例化 {cls} 失败: {e}")
-                continue
+# 导入请求指标
+from metrics import (
+    COUNTER, GAUGE, PHASE_DB, PHASE_DATAFRAME, PHASE_INDICATOR, PHASE_SERIALIZE, RequestMetrics
+)
+
+# 导入响应格式协商工具
+from response_formats import (
+    FORMAT_ROWS, FORMAT_COLUMNS, UnsupportedFormat, negotiate_format, df_times, json_response,
+    bars_columns, columns_payload, indicator_payload, make_bars_response, make_indicator_response
+)
 
-            try:
-                register_project(obj)
-            except Exception as e:
-                print(f"[WARN] register_project 调用失败: {e}")
 
-def select_target_bars_direct(symbol, start_date, end_date):
-    """直接查询数据库获取K线数据"""
+app = Flask(__name__)
+CORS(app)  # 允许跨域请求
+
+# 项目目录
+PROJECTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'projects')
+
+# 项目延迟加载器: 扫描时只解析源码, 项目第一次使用时才导入模块并实例化
+project_loader = ProjectLoader(PROJECTS_DIR, register_project, unregister_project, base_class=ProjectBase)
+set_project_loader(project_loader)
+
+# 项目运行结果存储, 同进程运行的项目直接发布到这里
+# 结果保存在磁盘上, 多进程部署时所有服务进程共享
+result_store = ResultStore()
+set_local_result_store(result_store)
+
+# 项目注册表版本文件, 任一服务进程重新加载项目后更新, 其他进程处理下一个请求前同步
+REGISTRY_VERSION_FILE = result_store.root_dir / '_projects.version'
+
+# K线数据缓存, 按(表名, 标的)缓存已查询的日期区间
+bar_cache = BarCache()
+
+# 请求指标, 各服务进程的快照写入共享目录, /api/metrics输出合并结果
+request_metrics = RequestMetrics(snapshot_dir=result_store.root_dir / '_metrics')
+request_metrics.init_app(app)
+
+request_metrics.define('bar_cache_requests_total', COUNTER, 'K线缓存请求数', ('result',))
+request_metrics.define('bar_cache_evictions_total', COUNTER, 'K线缓存淘汰次数')
+request_metrics.define('bar_cache_bytes', GAUGE, 'K线缓存占用内存(字节)')
+request_metrics.define('result_store_loads_total', COUNTER, '项目结果从磁盘加载次数')
+request_metrics.define('result_store_evictions_total', COUNTER, '项目结果淘汰次数')
+request_metrics.define('result_store_bytes', GAUGE, '已加载项目结果占用内存(字节)')
+
+def collect_cache_metrics():
+    """K线缓存和结果存储的统计, 抓取指标时读取"""
+    cache = bar_cache.stats()
+    store = result_store.stats()
+    return {
+        ('bar_cache_requests_total', ('hit',)): cache['hits'],
+        ('bar_cache_requests_total', ('partial_hit',)): cache['partial_hits'],
+        ('bar_cache_requests_total', ('miss',)): cache['misses'],
+        ('bar_cache_evictions_total', ()): cache['evictions'],
+        ('bar_cache_bytes', ()): cache['bytes'],
+        ('result_store_loads_total', ()): store['loads'],
+        ('result_store_evictions_total', ()): store['evictions'],
+        ('result_store_bytes', ()): store['bytes'],
+    }
+
+request_metrics.add_collector(collect_cache_metrics)
+
+def invalidate_symbol_bars(table, symbol):
+    """清理标的日线及周线/月线的K线缓存"""
+    bar_cache.invalidate(table, symbol)
+    for interval in ROLLUP_INTERVALS:
+        bar_cache.invalidate(rollup_table(table, interval), symbol)
+
+# 标的目录, 提供标的列表和标的所在的数据表; 导入工具更新标的后清理该标的的K线缓存
+symbol_catalog = SymbolCatalog(get_connection, ['daily_hfq', 'zh_index'], on_change=invalidate_symbol_bars)
+
+# 项目运行任务队列, 回测在独立进程中运行, 任务状态在服务进程间共享
+job_manager = JobManager(state_dir=result_store.root_dir / '_jobs')
+
+_registry_version = None
+_registry_lock = threading.Lock()
+
+def _read_registry_version():
     try:
-        connection = create_mysql_connection()
-        if not connection:
-            return None
+        return REGISTRY_VERSION_FILE.read_text(encoding='utf-8')
+    except FileNotFoundError:
+        return ''
 
-        table = None
-        if symbol.startswith('000') or symbol.startswith('399') or symbol.startswith('688') or symbol.startswith('60'):
-            table = 'daily_hfq'            
-        else:
-            table = 'zh_index'
-        
+def load_projects(publish: bool = False) -> int:
+    """
+    增量扫描项目目录, 只重新加载新增、修改和删除的项目文件
+
+    Args:
+        publish: 是否更新注册表版本, 通知其他服务进程重新扫描
+
+    Returns:
+        有变化的项目文件数
+    """
+    global _registry_version
+    with _registry_lock:
+        changed = project_loader.scan()
+        if publish:
+            tmp_file = REGISTRY_VERSION_FILE.with_name(f'.{REGISTRY_VERSION_FILE.name}.{os.getpid()}.tmp')
+            tmp_file.write_text(f'{time.time()}-{os.getpid()}', encoding='utf-8')
+            os.replace(tmp_file, REGISTRY_VERSION_FILE)
+        _registry_version = _read_registry_version()
+    return changed
+
+@app.before_request
+def sync_projects():
+    """其他服务进程重新加载了项目时, 本进程同步重新加载"""
+    if _registry_version is not None and _read_registry_version() != _registry_version:
+        load_projects()
+
+
+# 前端窗口类型到数据表的映射
+TYPE_TABLES = {'zh_stocks': 'daily_hfq', 'zh_indexs': 'zh_index'}
+
+# 预热K线数换算为自然日时, 每根K线对应的自然日数
+DAYS_PER_BAR = {'daily': 7 / 5, 'weekly': 7, 'monthly': 31}
+
+# 预热K线数换算为自然日时, 额外预留的节假日天数
+HOLIDAY_MARGIN_DAYS = 15
+
+# 数据不足预热K线数时, 最多向前扩展查询的次数
+WARMUP_EXTEND_TIMES = 2
+
+def warmup_start(start_dt, warmup_bars, interval=INTERVAL_DAILY):
+    """按预热K线数估算需要向前多取数据的开始时间"""
+    return start_dt - timedelta(days=int(warmup_bars * DAYS_PER_BAR[interval]) + HOLIDAY_MARGIN_DAYS)
+
+def query_bars(table, symbol, start_dt, end_dt):
+    """从数据库查询[start_dt, end_dt)区间的K线数据, 供bar_cache补查缺失区间"""
+    with request_metrics.phase(PHASE_DB), get_connection() as connection:
         cursor = connection.cursor()
         query = f"""
         SELECT datetime, open_price, high_price, low_price, close_price, volume, turnover
@@ -110,55 +186,133 @@ def select_target_bars_direct(symbol, start_date, end_date):
         WHERE symbol = %s AND datetime >= %s AND datetime < %s 
         ORDER BY datetime
         """
-        cursor.execute(query, (symbol, start_date, end_date))
-        
+        cursor.execute(query, (symbol, start_dt, end_dt))
         results = cursor.fetchall()
         cursor.close()
-        connection.close()
-        
-        if not results:
-            return None
-        
-        # 转换为DataFrame
-        df = pd.DataFrame(results, columns=['datetime', 'open_price', 'high_price', 'low_price', 'close_price', 'volume', 'turnover'])
+
+    # 转换为DataFrame, 数据库返回的Decimal统一转为float64
+    with request_metrics.phase(PHASE_DATAFRAME):
+        df = pd.DataFrame(results, columns=['datetime'] + BAR_COLUMNS)
+        df['datetime'] = pd.to_datetime(df['datetime'])
+        df.set_index('datetime', inplace=True)
+        return df.astype(np.float64)
+
+def query_bars_bulk(table, symbols, start_dt, end_dt):
+    """一次IN查询多个标的[start_dt, end_dt)区间的K线数据, 供bar_cache批量补查"""
+    placeholders = ', '.join(['%s'] * len(symbols))
+    with request_metrics.phase(PHASE_DB), get_connection() as connection:
+        cursor = connection.cursor()
+        query = f"""
+        SELECT symbol, datetime, open_price, high_price, low_price, close_price, volume, turnover
+        FROM `{table}` 
+        WHERE symbol IN ({placeholders}) AND datetime >= %s AND datetime < %s 
+        ORDER BY symbol, datetime
+        """
+        cursor.execute(query, (*symbols, start_dt, end_dt))
+        results = cursor.fetchall()
+        cursor.close()
+
+    with request_metrics.phase(PHASE_DATAFRAME):
+        df = pd.DataFrame(results, columns=['symbol', 'datetime'] + BAR_COLUMNS)
+        df['datetime'] = pd.to_datetime(df['datetime'])
         df.set_index('datetime', inplace=True)
+        df[BAR_COLUMNS] = df[BAR_COLUMNS].astype(np.float64)
+
+        grouped = {symbol: group[BAR_COLUMNS] for symbol, group in df.groupby('symbol', sort=False)}
+        empty = df[BAR_COLUMNS].iloc[0:0]
+        return {symbol: grouped.get(symbol, empty) for symbol in symbols}
+
+def select_target_bars(table, symbol, start_dt, end_dt):
+    """通过缓存获取K线数据"""
+    return bar_cache.get(table, symbol, start_dt, end_dt, query_bars)
+
+def select_table(symbol, target_type=None):
+    """
+    确定标的所在的数据表
+
+    Args:
+        symbol: 标的代码
+        target_type: 前端窗口类型(zh_stocks/zh_indexs), 为空时按标的目录查找
+
+    Returns:
+        表名, 未知的类型或标的返回None
+    """
+    if target_type:
+        return TYPE_TABLES.get(target_type)
+    return symbol_catalog.table_of(symbol)
+
+def select_target_bars_direct(symbol, start_date, end_date, target_type=None, interval=INTERVAL_DAILY):
+    """直接查询数据库获取K线数据, interval为weekly/monthly时查询汇总表"""
+    try:
+        table = select_table(symbol, target_type)
+        if not table:
+            return None
+        df = select_target_bars(rollup_table(table, interval), symbol, start_date, end_date)
+        if df.empty:
+            return None
         
         return df
     except Exception as e:
         print(f"查询数据失败: {e}")
         return None
 
-def create_mysql_connection():
-    """创建MySQL连接"""
+def select_bars_with_warmup(symbol, start_dt, end_dt, warmup_bars, target_type=None, interval=INTERVAL_DAILY):
+    """
+    获取K线数据, 并在start_dt之前多取warmup_bars根K线用于指标预热
+
+    节假日较多导致预热K线不足时向前扩展查询, 标的上市不久时以实际数据为准
+    """
+    load_start_dt = warmup_start(start_dt, warmup_bars, interval)
+    df = select_target_bars_direct(symbol, load_start_dt, end_dt, target_type, interval)
+    for _ in range(WARMUP_EXTEND_TIMES):
+        if df is None or df.index.searchsorted(pd.Timestamp(start_dt)) >= warmup_bars:
+            break
+        load_start_dt = warmup_start(load_start_dt, warmup_bars, interval)
+        extended = select_target_bars_direct(symbol, load_start_dt, end_dt, target_type, interval)
+        if extended is None or len(extended) == len(df):
+            break
+        df = extended
+    return df
+
+def load_stored_indicators(table, symbol, specs, start_dt, end_dt):
+    """
+    从物化指标读取日线指标
+
+    Returns:
+        与compute_indicator_series相同的结果, 物化数据未覆盖请求区间时返回None
+    """
+    entry = next((e for e in symbol_catalog.get(symbol) if e['table'] == table), None)
+    if entry is None:
+        return None
+    last_bar = datetime.strptime(entry['last_date'], '%Y-%m-%d') if entry['last_date'] else None
     try:
-        connection = mysql.connector.connect(
-            host='localhost',
-            port=3306,
-            user='root',
-            password='123456',
-            database='ASTOCK'
-        )
-        return connection
-    except mysql.connector.Error as e:
-        print(f"连接MySQL失败: {e}")
+        with request_metrics.phase(PHASE_DB), get_connection() as connection:
+            result = load_indicators(connection, table, symbol, specs, start_dt, end_dt, last_bar)
+    except Exception as e:
+        print(f"⚠️ 读取物化指标失败: {e}")
         return None
+    if result is None or len(result[0]) == 0:
+        return None
+    return result
+
+def compute_target_indicators(df, specs, start_dt, end_dt):
+    """计算K线DataFrame上请求的指标"""
+    with request_metrics.phase(PHASE_INDICATOR):
+        return compute_indicator_series(
+            df_times(df),
+            df['close_price'].to_numpy(dtype=np.float64),
+            specs,
+            high=df['high_price'].to_numpy(dtype=np.float64),
+            low=df['low_price'].to_numpy(dtype=np.float64),
+            start_time=start_dt.timestamp(),
+            end_time=end_dt.timestamp()
+        )
 
 @app.route('/api/zh_stocks', methods=['GET'])
 def get_zh_stocks():
     """获取所有可用的股票列表"""
     try:
-        connection = create_mysql_connection()
-        if not connection:
-            return jsonify({'error': '数据库连接失败'}), 500
-        
-        cursor = connection.cursor()
-        cursor.execute("SELECT DISTINCT symbol FROM daily_hfq ORDER BY symbol")
-        stocks = [row[0] for row in cursor.fetchall()]
-        
-        cursor.close()
-        connection.close()
-        
-        return jsonify({'symbols': stocks})
+        return jsonify({'symbols': symbol_catalog.symbols('daily_hfq')})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -166,18 +320,18 @@ def get_zh_stocks():
 def get_zh_indexs():
     """获取所有可用的指数列表"""
     try:
-        connection = create_mysql_connection()
-        if not connection:
-            return jsonify({'error': '数据库连接失败'}), 500
-        
-        cursor = connection.cursor()
-        cursor.execute("SELECT DISTINCT symbol FROM zh_index ORDER BY symbol")
-        indexs = [row[0] for row in cursor.fetchall()]
-        
-        cursor.close()
-        connection.close()
-        
-        return jsonify({'symbols': indexs})
+        return jsonify({'symbols': symbol_catalog.symbols('zh_index')})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/symbols/<symbol>', methods=['GET'])
+def get_symbol_info(symbol):
+    """获取标的所在的数据表、交易所、首末K线日期和K线数量"""
+    try:
+        entries = symbol_catalog.get(symbol)
+        if not entries:
+            return jsonify({'error': f'标的 {symbol} 不存在'}), 404
+        return jsonify({'symbol': symbol, 'tables': entries})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -192,42 +346,21 @@ def get_zh_stocks_bars():
         if not symbol or not start_date or not end_date:
             return jsonify({'error': '缺少必要参数'}), 400
         
+        fmt = negotiate_format(request)
+        max_points = parse_max_points(request.args.get('max_points'))
+        interval = parse_interval(request.args.get('interval'))
+        
         # 转换日期格式
         start_dt = datetime.strptime(start_date, '%Y-%m-%d')
         end_dt = datetime.strptime(end_date, '%Y-%m-%d')
         
-        connection = create_mysql_connection()
-        if not connection:
-            return None
-        
-        cursor = connection.cursor()
-        query = """
-        SELECT datetime, open_price, high_price, low_price, close_price, volume, turnover
-        FROM daily_hfq 
-        WHERE symbol = %s AND datetime >= %s AND datetime < %s 
-        ORDER BY datetime
-        """
-        cursor.execute(query, (symbol, start_dt, end_dt))
-        results = cursor.fetchall()
-        cursor.close()
-        connection.close()
-        
-        # 转换为DataFrame
-        df = pd.DataFrame(results, columns=['datetime', 'open_price', 'high_price', 'low_price', 'close_price', 'volume', 'turnover'])
-        df.set_index('datetime', inplace=True)
-        
-        bars_data = []
-        for index, row in df.iterrows():
-            bars_data.append({
-                'time': int(index.timestamp()),
-                'open': float(row['open_price']),
-                'high': float(row['high_price']),
-                'low': float(row['low_price']),
-                'close': float(row['close_price']),
-                'volume': float(row['volume'])
-        })
-
-        return jsonify({'bars': bars_data})
+        df = select_target_bars(rollup_table('daily_hfq', interval), symbol, start_dt, end_dt)
+        with request_metrics.phase(PHASE_SERIALIZE):
+            return make_bars_response(df, fmt, max_points)
+    except UnsupportedFormat as e:
+        return jsonify({'error': str(e)}), 406
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -242,38 +375,105 @@ def get_zh_indexs_bars():
         if not symbol or not start_date or not end_date:
             return jsonify({'error': '缺少必要参数'}), 400
         
+        fmt = negotiate_format(request)
+        max_points = parse_max_points(request.args.get('max_points'))
+        interval = parse_interval(request.args.get('interval'))
+        
         # 转换日期格式
         start_dt = datetime.strptime(start_date, '%Y-%m-%d')
         end_dt = datetime.strptime(end_date, '%Y-%m-%d')
         
-        connection = create_mysql_connection()
-        if not connection:
-            return None
-        
-        cursor = connection.cursor()
-        query = """
-        SELECT datetime, open_price, high_price, low_price, close_price, volume, turnover
-        FROM zh_index 
-        WHERE symbol = %s AND datetime >= %s AND datetime < %s 
-        ORDER BY datetime
-        """
-        cursor.execute(query, (symbol, start_dt, end_dt))
-        
-        
-        bars_data = []
-        for row in cursor.fetchall():
-            bars_data.append({
-                'time': int(row[0].timestamp()),
-                'open': float(row[1]),
-                'high': float(row[2]),
-                'low': float(row[3]),
-                'close': float(row[4]),
-                'volume': float(row[5])
-        })
+        df = select_target_bars(rollup_table('zh_index', interval), symbol, start_dt, end_dt)
+        with request_metrics.phase(PHASE_SERIALIZE):
+            return make_bars_response(df, fmt, max_points)
+    except UnsupportedFormat as e:
+        return jsonify({'error': str(e)}), 406
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        cursor.close()
-        connection.close()        
-        return jsonify({'bars': bars_data})
+@app.route('/api/bars/batch', methods=['GET', 'POST'])
+def get_bars_batch():
+    """
+    批量获取多个标的的K线数据(及技术指标), 多窗口布局一次请求加载所有窗口
+
+    POST JSON: {"targets": [{"type": "zh_stocks", "symbol": "000001"}, ...],
+                "start_date": "2024-01-01", "end_date": "2024-12-31", "indicator": "all_ma"}
+    GET: ?symbols=000001,sz399300&start_date=...&end_date=...&indicator=all_ma
+    可选max_points: 每个标的最多返回的K线数, 超出时合并相邻K线
+    可选interval: daily(默认)/weekly/monthly
+    """
+    try:
+        if request.method == 'POST':
+            params = request.get_json() or {}
+            targets = params.get('targets', [])
+        else:
+            params = request.args
+            targets = [{'symbol': symbol} for symbol in params.get('symbols', '').split(',') if symbol]
+        start_date = params.get('start_date')
+        end_date = params.get('end_date')
+        indicator = params.get('indicator')
+        max_points = parse_max_points(params.get('max_points'))
+        interval = parse_interval(params.get('interval'))
+
+        if not targets or not start_date or not end_date:
+            return jsonify({'error': '缺少必要参数'}), 400
+
+        fmt = negotiate_format(request)
+        if fmt not in (FORMAT_ROWS, FORMAT_COLUMNS):
+            raise UnsupportedFormat(f'批量接口不支持{fmt}格式')
+
+        start_dt = datetime.strptime(start_date, '%Y-%m-%d')
+        end_dt = datetime.strptime(end_date, '%Y-%m-%d')
+        specs = parse_indicator_spec(indicator) if indicator else None
+        load_start_dt = warmup_start(start_dt, indicator_warmup_bars(specs), interval) if specs else start_dt
+
+        # 按数据表分组, 每张表一次查询
+        tables = {}
+        for target in targets:
+            target_type = target.get('type')
+            table = select_table(target['symbol'], target_type)
+            if not table:
+                if target_type:
+                    return jsonify({'error': f'不支持的标的类型: {target_type}'}), 400
+                return jsonify({'error': f'标的 {target["symbol"]} 不存在'}), 404
+            table = rollup_table(table, interval)
+            target['table'] = table
+            tables.setdefault(table, []).append(target['symbol'])
+
+        frames = {}
+        for table, symbols in tables.items():
+            for symbol, df in bar_cache.get_many(table, symbols, load_start_dt, end_dt, query_bars_bulk).items():
+                frames[(table, symbol)] = df
+
+        series_list = []
+        for target in targets:
+            df = frames[(target['table'], target['symbol'])]
+            bars_df = df.iloc[df.index.searchsorted(pd.Timestamp(start_dt)):]
+            bars = bars_columns(bars_df)
+            merged = aggregate_ohlc(bars, max_points) if max_points else bars
+            with request_metrics.phase(PHASE_SERIALIZE):
+                item = {
+                    'type': target.get('type'),
+                    'symbol': target['symbol'],
+                    'bars': columns_payload(merged, fmt)
+                }
+            if specs:
+                times, series, single = compute_target_indicators(df, specs, start_dt, end_dt)
+                if max_points:
+                    # 指标与合并后的K线对齐
+                    times, series = aggregate_aligned(times, series, bars['time'], max_points)
+                with request_metrics.phase(PHASE_SERIALIZE):
+                    item['indicator'] = indicator_payload(times, series, fmt, single)
+            series_list.append(item)
+
+        with request_metrics.phase(PHASE_SERIALIZE):
+            return json_response({'series': series_list})
+    except UnsupportedFormat as e:
+        return jsonify({'error': str(e)}), 406
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -281,47 +481,29 @@ def get_zh_indexs_bars():
 def get_trades_symbol_list(project_name):
     """获取交易数据"""
     try:
-        project = get_project(project_name)
-        if not project:
+        if not has_project(project_name):
             return jsonify({'error': f'项目 {project_name} 不存在'}), 404
         
-        trades_data = data.trade_data_dict.get(project_name, [])
-        trades_symbol_list = set()
-        for rec in trades_data:
-            trades_symbol_list.add(rec['symbol'])
-
-        return jsonify({'trades_symbol_list': list(trades_symbol_list)})
+        trades_symbol_list = result_store.get_trade_index(project_name).symbol_list
+        return jsonify({'trades_symbol_list': trades_symbol_list})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/trades/<project_name>/data', methods=['GET'])
 def get_trades_data(project_name):
-    """获取交易数据"""
+    """获取交易数据, 可用start_time/end_time(秒)限定时间范围"""
     try:
         symbol = request.args.get('symbol')
         if not symbol:
             return jsonify({'error': '缺少标的代码参数'}), 400
         
-        project = get_project(project_name)
-        if not project:
+        if not has_project(project_name):
             return jsonify({'error': f'项目 {project_name} 不存在'}), 404
                 
-        # 从全局数据对象获取交易数据
-        trade_data = data.trade_data_dict.get(project_name, [])
-        
-        if not trade_data:
-            return jsonify({'trades': []})
-        
-        symbol_trades_data = [rec for rec in trade_data if rec['symbol'] == symbol]
-        result = []
-        for rec in symbol_trades_data:
-            result.append({
-                'time': int(rec['time']),
-                'price': float(rec['price']),
-                'volume': float(rec['volume']),
-                'direction': str(rec['direction']),
-                'offset': str(rec['offset'])
-            })
+        # 按标的索引和时间范围查询交易数据
+        start_time = request.args.get('start_time', type=int)
+        end_time = request.args.get('end_time', type=int)
+        result = result_store.get_trade_index(project_name).query(symbol, start_time, end_time)
         
         return jsonify({'trades': result})
     except Exception as e:
@@ -337,24 +519,10 @@ def update_strategy_data():
         trade_data = request_data.get('trade_data', [])
         
         if project_name:
-            project = get_project(project_name)
-            if not project:
+            if not has_project(project_name):
                 return jsonify({'error': f'项目 {project_name} 不存在'}), 404
             
-            # 更新技术数据
-            if tech_data:
-                data.tech_data_dict[project_name] = tech_data
-            
-            # 更新交易数据
-            if trade_data:
-                trade_df = pd.DataFrame(trade_data)
-                if not trade_df.empty:
-                    trade_df['datetime'] = pd.to_datetime(trade_df['time'], unit='s')
-                    trade_df.set_index('datetime', inplace=True)
-                    
-            for rec, dt in zip(trade_data, trade_df.index):
-                rec['datetime'] = str(dt)
-            data.trade_data_dict[project_name] = trade_data
+            result_store.publish(project_name, tech_data or None, trade_data)
         
         return jsonify({'success': True})
     except Exception as e:
@@ -369,102 +537,54 @@ def get_target_indicators():
         symbol = request.args.get('symbol')
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
-        indicator = request.args.get('indicator', 'ma5')  # ma5, ma10, ma20, ma60, rsi, macd等
-        
-        print(f"🔍 技术指标请求: symbol={symbol}, start_date={start_date}, end_date={end_date}, indicator={indicator}")
+        indicator = request.args.get('indicator', 'ma5')  # ma:30, rsi:6, macd:8,21,5, boll:20,2, atr:14, 多个用分号分隔
         
         if not symbol or not start_date or not end_date:
             return jsonify({'error': '缺少必要参数'}), 400
         
+        fmt = negotiate_format(request)
+        
+        try:
+            specs = parse_indicator_spec(indicator)
+            interval = parse_interval(request.args.get('interval'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # 转换日期格式
         start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-        init_dt = start_dt - timedelta(days=200)
         end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-        print(f"📅 日期转换: start_dt={start_dt}, end_dt={end_dt}")
-        
-        # 获取K线数据
-        bars_df = select_target_bars_direct(symbol, init_dt, end_dt)
+        warmup_bars = indicator_warmup_bars(specs)
+        
+        # 日线指标优先读取物化结果, 未物化或未覆盖请求区间时从K线计算
+        # 按请求路径确定数据表, 如/api/zh_stocks/indicators
+        target_type = request.path.split('/')[2]
+        table = select_table(symbol, target_type)
+        stored = None
+        if interval == INTERVAL_DAILY and table:
+            stored = load_stored_indicators(table, symbol, specs, start_dt, end_dt)
+        if stored is not None:
+            times, series, single = stored
+            with request_metrics.phase(PHASE_SERIALIZE):
+                return make_indicator_response(times, series, fmt, single=single)
+        
+        # 获取K线数据, 只多取指标需要的预热数据
+        bars_df = select_bars_with_warmup(symbol, start_dt, end_dt, warmup_bars, target_type, interval)
         
         if bars_df is None or bars_df.empty:
-            print(f"❌ 未找到K线数据: symbol={symbol}")
             return jsonify({'error': '未找到数据'}), 404
         
-        print(f"✅ 获取到K线数据: {len(bars_df)} 条")
-        
-        # 转换DataFrame为bars_data格式
-        bars_data = []
-        for index, row in bars_df.iterrows():
-            try:
-                bars_data.append({
-                    'time': int(index.timestamp()),
-                    'open': float(row['open_price']),
-                    'high': float(row['high_price']),
-                    'low': float(row['low_price']),
-                    'close': float(row['close_price']),
-                    'volume': int(row['volume'])
-                })
-            except Exception as e:
-                print(f"❌ 转换数据行失败: {e}, row={row}")
-                continue
-        
-        print(f"✅ 转换数据完成: {len(bars_data)} 条")
-        
-        if len(bars_data) == 0:
-            return jsonify({'error': '数据转换失败'}), 500
-        
-        # 计算所有技术指标
+        # 只计算请求的指标
         try:
-            all_indicators = calculate_indicators_from_bars(bars_data)
-            clean_all_indicators = {}
-            end_timestamp = end_dt.timestamp()
-            
-            for key in all_indicators.keys():
-                clean_all_indicators[key] = [daily_value for daily_value in all_indicators[key] if daily_value['time'] < end_timestamp and daily_value['time'] >= start_dt.timestamp()]
-
-            print(f"✅ 计算指标完成: {list(clean_all_indicators.keys())}")
-            
-            # 打印过滤后的数据统计
-            for key, data in clean_all_indicators.items():
-                print(f"   {key}: {len(data)} 条数据")
-                    
+            times, series, single = compute_target_indicators(bars_df, specs, start_dt, end_dt)
         except Exception as e:
-            print(f"❌ 计算指标失败: {e}")
             return jsonify({'error': f'计算指标失败: {str(e)}'}), 500
         
-        # 根据请求的指标类型返回数据
-        if indicator == 'all_ma':
-            ma_results = {
-                'ma5': clean_all_indicators['ma5'],
-                'ma10': clean_all_indicators['ma10'],
-                'ma20': clean_all_indicators['ma20'],
-                'ma60': clean_all_indicators['ma60']
-            }
-            print(f"✅ 返回MA数据: MA={len(ma_results)}")
-            return jsonify({'indicator': ma_results})
-        elif indicator == 'macd':
-            # MACD返回多个系列
-            if 'macd' in clean_all_indicators.keys() and 'signal' in clean_all_indicators.keys() and 'histogram' in clean_all_indicators.keys():
-                result = {
-                    'macd': clean_all_indicators['macd'],
-                    'signal': clean_all_indicators['signal'],
-                    'histogram': clean_all_indicators['histogram']
-                }
-                print(f"✅ 返回MACD数据: MACD={len(result['macd'])}, Signal={len(result['signal'])}, Histogram={len(result['histogram'])}")
-                return jsonify({'indicator': result})
-            else:
-                return jsonify({'error': 'MACD数据不可用'}), 500
-        elif indicator in clean_all_indicators.keys():
-            indicator_data = clean_all_indicators[indicator]
-            print(f"✅ 返回指标数据: {indicator}, 数据条数: {len(indicator_data)}")
-            return jsonify({'indicator': indicator_data})
-        else:
-            print(f"❌ 不支持的指标类型: {indicator}")
-            return jsonify({'error': f'不支持的指标类型: {indicator}'}), 400
+        with request_metrics.phase(PHASE_SERIALIZE):
+            return make_indicator_response(times, series, fmt, single=single)
         
+    except UnsupportedFormat as e:
+        return jsonify({'error': str(e)}), 406
     except Exception as e:
-        import traceback
-        print(f"❌ 技术指标API异常: {e}")
-        print(f"详细错误: {traceback.format_exc()}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/health', methods=['GET'])
@@ -472,6 +592,16 @@ def health_check():
     """健康检查接口"""
     return jsonify({'status': 'ok', 'message': 'API服务器运行正常'})
 
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """获取K线缓存和结果存储统计"""
+    return jsonify({'bar_cache': bar_cache.stats(), 'result_store': result_store.stats()})
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus文本格式的请求耗时、阶段耗时、响应体积、错误数和缓存统计"""
+    return request_metrics.response()
+
 @app.route('/api/projects', methods=['GET'])
 def get_projects():
     """获取所有注册的项目"""
@@ -485,47 +615,68 @@ def get_projects():
 def get_project_summary(project_name):
     """获取指定项目的数据"""
     try:
-        project = get_project(project_name)
-        if not project:
+        if not has_project(project_name):
             return jsonify({'error': f'项目 {project_name} 不存在'}), 404
         
-        summary = project.get_summary()
+        # 结果存储中的摘要由最近一次发布写入, 不论由哪个服务进程运行; 没有结果时才加载项目
+        summary = result_store.get_summary(project_name)
+        if not summary:
+            project = get_project(project_name)
+            if not project:
+                return jsonify({'error': f'项目 {project_name} 加载失败'}), 500
+            summary = project.get_summary()
         return jsonify({'project': summary})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/project/<project_name>/data', methods=['GET'])
 def get_project_data(project_name):
-    """获取指定项目的策略数据"""
+    """
+    获取指定项目的策略数据
+
+    可选max_points限制时序数据的点数, downsample选择降采样方法(lttb/minmax, 默认lttb)
+    """
     try:
+        max_points = parse_max_points(request.args.get('max_points'))
+        
+        tech_data = result_store.get_tech_data(project_name)
+        if tech_data is None:
+            return jsonify({'error': f'项目 {project_name} 暂无运行结果'}), 404
+        
+        if max_points:
+            tech_data = downsample_lines(
+                np.asarray(tech_data['time'], dtype=np.int64),
+                {key: np.asarray(tech_data[key], dtype=np.float64) for key in ['daily_pnl', 'balance', 'drawdown']},
+                max_points,
+                request.args.get('downsample', METHOD_LTTB)
+            )
         
         # 返回策略数据
-        print(f"data.tech_data_dict[project_name]: {data.tech_data_dict[project_name]}")
         strategy_data = {
-            'time': data.tech_data_dict[project_name]['time'],
-            'daily_pnl': data.tech_data_dict[project_name]['daily_pnl'],
-            'balance': data.tech_data_dict[project_name]['balance'],
-            'trades': data.trade_data_dict[project_name],
-            'drawdown': data.tech_data_dict[project_name]['drawdown']
+            'time': tech_data['time'],
+            'daily_pnl': tech_data['daily_pnl'],
+            'balance': tech_data['balance'],
+            'trades': result_store.get_trades(project_name),
+            'drawdown': tech_data['drawdown']
         }
         
-        return jsonify({'strategy_data': strategy_data})
+        with request_metrics.phase(PHASE_SERIALIZE):
+            return json_response({'strategy_data': strategy_data})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"❌ 获取项目数据失败: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/run_project', methods=['POST'])
 def run_project():
-    """运行指定项目"""
+    """提交项目运行任务, 立即返回任务ID"""
     try:
         data = request.get_json()
         project_name = data.get('project_name')
         start_date = data.get('start_date')
         end_date = data.get('end_date')
         
-        print(f"🚀 开始运行项目 {project_name}")
-        print(f"📅 时间范围: {start_date} 到 {end_date}")
-        
         if not project_name or not start_date or not end_date:
             return jsonify({'error': '缺少必要参数'}), 400
         
@@ -533,44 +684,100 @@ def run_project():
         if not project:
             return jsonify({'error': f'项目 {project_name} 不存在'}), 404
         
-        print(f"✅ 找到项目: {project_name}")
-        
-        # 运行项目
-        record_df, summary = project.run(start_date, end_date)
-        date_list = record_df.index.tolist()
-        timestamp_list = [int(time.mktime(date.timetuple())) for date in date_list]
-        project.end_balance = summary['end_balance'].item()
-        project.max_drawdown = summary['max_drawdown'].item()
-        project.max_drawdown_duration = summary['max_drawdown_duration'].item()
-        project.total_net_pnl = summary['total_net_pnl'].item()
-        project.sharpe_ratio = summary['sharpe_ratio'].item()
-        project.time = timestamp_list
-        project.daily_pnl = record_df['net_pnl'].tolist()
-        project.balance = (record_df['net_pnl'].cumsum() + project.initial_capital).tolist()
-        project.drawdown = record_df['drawdown'].tolist()
-        project.upload_data()
-        
-        print(f"🎉 项目 {project_name} 运行完成")
-        return jsonify({'success': True, 'message': f'项目 {project_name} 运行完成'})
+        job = job_manager.submit(project, start_date, end_date)
+        print(f"🚀 提交项目 {project_name} 运行任务 {job.job_id}, 时间范围: {start_date} 到 {end_date}")
+        return jsonify({'success': True, 'job_id': job.job_id, 'job': job.to_dict()}), 202
+    except QueueFull as e:
+        return jsonify({'error': str(e)}), 429
     except Exception as e:
-        print(f"❌ 运行项目失败: {e}")
+        print(f"❌ 提交项目运行失败: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+def on_job_finished(job, result):
+    """任务完成后更新项目数据并上传"""
+    project = get_project(job.project_name)
+    if not project:
+        raise KeyError(f'项目 {job.project_name} 不存在')
+
+    project.start_time = datetime.strptime(job.start_date, '%Y-%m-%d')
+    project.end_time = datetime.strptime(job.end_date, '%Y-%m-%d')
+    project.trades = result['trades']
+    project.apply_run_result(result['record_df'], result['summary'])
+    project.publish_data()
+    print(f"🎉 项目 {job.project_name} 运行完成")
+
+job_manager.on_finished = on_job_finished
+
+@app.route('/api/jobs', methods=['GET'])
+def get_jobs():
+    """获取所有运行任务"""
+    return jsonify({'jobs': job_manager.list_jobs()})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """获取运行任务状态和进度"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': f'任务 {job_id} 不存在'}), 404
+    return jsonify({'job': job.to_dict()})
+
+# SSE心跳间隔(秒), 避免代理断开长时间没有数据的连接
+SSE_HEARTBEAT = 15
+
+@app.route('/api/jobs/<job_id>/stream', methods=['GET'])
+def stream_job(job_id):
+    """
+    以SSE推送运行任务的进度、中间结果(资金曲线、回撤、新成交)和结束状态
+
+    事件类型为progress/partial/end, 收到end后服务器关闭连接;
+    断线重连时浏览器通过Last-Event-ID请求头从断点继续, 也可以用after参数指定
+    """
+    if not job_manager.get(job_id):
+        return jsonify({'error': f'任务 {job_id} 不存在'}), 404
+    try:
+        after = int(request.headers.get('Last-Event-ID') or request.args.get('after', 0))
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID和after必须为整数'}), 400
+
+    def generate():
+        last_id = after
+        while True:
+            events = job_manager.get_events(job_id, last_id, timeout=SSE_HEARTBEAT)
+            if events is None:
+                return
+            if not events:
+                yield ': keep-alive\n\n'
+                continue
+            for event in events:
+                last_id = event['id']
+                data = json.dumps(event['data'], ensure_ascii=False)
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+                if event['type'] == EVENT_END:
+                    return
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消运行任务"""
+    job = job_manager.cancel(job_id)
+    if not job:
+        return jsonify({'error': f'任务 {job_id} 不存在'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
 @app.route('/api/reload_projects', methods=['POST'])
 def reload_projects():
     """重新加载所有项目"""
     try:
-        # 清空现有注册表
-        PROJECT_REGISTER.clear()
-        
-        # 重新注册项目
-        auto_register_projects()
+        # 只重新加载有变化的项目文件, 并通知其他服务进程
+        changed = load_projects(publish=True)
         
         return jsonify({
             'success': True,
-            'message': '项目重新加载成功',
+            'message': f'项目重新加载成功, {changed}个文件有变化',
             'projects': list_projects()
         })
     except Exception as e:
@@ -579,6 +786,7 @@ def reload_projects():
 if __name__ == '__main__':
     print("🚀 启动API服务器 (端口8800)...")
     
-    auto_register_projects(directory = 'projects')
+    load_projects()
     
+    # 开发模式, 生产环境使用wsgi.py启动多进程服务
     app.run(debug=True, host='0.0.0.0', port=8800) 
\ No newline at end of file
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+回测K线预加载
+BacktestingEngine.load_data每次回测按时间分段查询数据库, 策略on_init中的load_bar还要再查询一次预热K线,
+一次多年的逐月回测会产生数百次数据库查询。
+
+BarStore用少量IN查询批量取出候选标的在各自回测区间(含预热回看)内的日线,
+按标的以numpy数组保存在内存中; PreloadedBacktestingEngine的load_data和load_bar直接从中切片,
+请求的区间未被预加载覆盖时回退到vnpy的数据库查询, 结果与逐次查询一致。
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from vnpy.trader.constant import Exchange, Interval
+from vnpy.trader.database import DB_TZ
+from vnpy.trader.object import BarData
+from vnpy.trader.utility import extract_vt_symbol
+from vnpy_ctastrategy.backtesting import BacktestingEngine, INTERVAL_DELTA_MAP
+
+
+# 每次IN查询的标的数
+QUERY_CHUNK = 500
+
+
+# 按列保存的K线字段, 与BarData的同名属性对应
+BAR_FIELDS = ('volume', 'turnover', 'open_interest', 'open_price', 'high_price', 'low_price', 'close_price')
+
+
+class BarStore:
+    """
+    按标的保存在内存中的日线
+
+    K线按列保存为numpy数组, 读取时才构建BarData; 每个标的记录已加载的时间范围,
+    查询范围超出时返回None, 由调用方回退到数据库
+    """
+
+    def __init__(self, table: str = 'daily'):
+        """
+        Args:
+            table: vnpy日线所在的表
+        """
+        self.table = table
+        # (标的代码, 交易所) -> (时间数组, K线数组(行为K线, 列为BAR_FIELDS), 已加载的开始时间, 已加载的结束时间)
+        self._bars: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray, datetime, datetime]] = {}
+        self.query_count = 0
+
+    def load(self, connection, symbols: Iterable[str], start: datetime, end: datetime) -> int:
+        """
+        批量加载[start, end]区间内标的的日线, 每QUERY_CHUNK个标的一次查询
+
+        Args:
+            connection: 数据库连接
+            symbols: 标的代码(不含交易所)
+            start: 开始时间
+            end: 结束时间(包含)
+
+        Returns:
+            加载的K线数
+        """
+        symbols = sorted(set(symbols))
+        loaded = {}
+        count = 0
+        for i in range(0, len(symbols), QUERY_CHUNK):
+            chunk = symbols[i:i + QUERY_CHUNK]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cursor = connection.cursor()
+            cursor.execute(
+                f"SELECT symbol, exchange, datetime, volume, turnover, open_interest, "
+                f"open_price, high_price, low_price, close_price FROM `{self.table}` "
+                f"WHERE symbol IN ({placeholders}) AND datetime >= %s AND datetime <= %s "
+                f"ORDER BY symbol, datetime",
+                (*chunk, start, end),
+            )
+            rows = cursor.fetchall()
+            cursor.close()
+            self.query_count += 1
+            count += len(rows)
+
+            for symbol, exchange, dt, *values in rows:
+                times, records = loaded.setdefault((symbol, exchange), ([], []))
+                times.append(dt)
+                records.append(values)
+
+        for key, (times, records) in loaded.items():
+            # 与vnpy数据库驱动一致, 成交量等缺失时为0
+            values = np.array([[float(v or 0) for v in record] for record in records], dtype=np.float64)
+            self._bars[key] = (np.array(times, dtype='datetime64[us]'), values, start, end)
+        return count
+
+    def load_ranges(self, connection, ranges: Dict[str, Tuple[datetime, datetime]]) -> int:
+        """
+        按标的加载各自的[start, end]区间, 区间相同的标的合并为一次load
+
+        Args:
+            connection: 数据库连接
+            ranges: 标的代码 -> (开始时间, 结束时间(包含))
+
+        Returns:
+            加载的K线数
+        """
+        groups: Dict[Tuple[datetime, datetime], List[str]] = {}
+        for symbol, span in ranges.items():
+            groups.setdefault(span, []).append(symbol)
+        return sum(self.load(connection, symbols, start, end) for (start, end), symbols in sorted(groups.items()))
+
+    def _slice(self, symbol: str, exchange: str, start: datetime, end: datetime):
+        entry = self._bars.get((symbol, exchange))
+        if entry is None:
+            return None
+        times, values, loaded_start, loaded_end = entry
+        if start < loaded_start or end > loaded_end:
+            return None
+        left = np.searchsorted(times, np.datetime64(start, 'us'), side='left')
+        right = np.searchsorted(times, np.datetime64(end, 'us'), side='right')
+        return times[left:right], values[left:right]
+
+    def bars(self, symbol: str, exchange: str, start: datetime, end: datetime) -> Optional[List[BarData]]:
+        """
+        [start, end]区间内的K线, 与vnpy的load_bar_data相同包含两端
+
+        Returns:
+            K线列表, 标的未加载或区间超出已加载范围时返回None
+        """
+        result = self._slice(symbol, exchange, start, end)
+        if result is None:
+            return None
+        times, values = result
+        exchange = Exchange(exchange)
+        # 与vnpy数据库驱动一致, 时间带上数据库时区
+        return [
+            BarData(symbol=symbol, exchange=exchange, datetime=dt.replace(tzinfo=DB_TZ), interval=Interval.DAILY,
+                    gateway_name="DB", **dict(zip(BAR_FIELDS, row)))
+            for dt, row in zip(times.tolist(), values.tolist())
+        ]
+
+    def subset(self, symbol: str, exchange: str, start: datetime, end: datetime) -> 'BarStore':
+        """
+        只包含一个标的[start, end]区间的BarStore, 随回测任务传给工作进程
+
+        标的未加载或区间超出已加载范围时返回空的BarStore, 回测回退到数据库查询
+        """
+        store = BarStore(self.table)
+        result = self._slice(symbol, exchange, start, end)
+        if result is not None:
+            store._bars[(symbol, exchange)] = result + (start, end)
+        return store
+
+
+def _naive(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=None) if dt.tzinfo else dt
+
+
+class PreloadedBacktestingEngine(BacktestingEngine):
+    """从BarStore读取回测数据和预热K线的回测引擎"""
+
+    def __init__(self, bar_store: BarStore):
+        super().__init__()
+        self.bar_store = bar_store
+
+    def load_data(self) -> None:
+        """从BarStore读取[start, end]区间的K线, 未覆盖时按原方式查询数据库"""
+        if not self.end:
+            self.end = datetime.now()
+        bars = None
+        if self.start < self.end:
+            bars = self.bar_store.bars(self.symbol, self.exchange.value, _naive(self.start), _naive(self.end))
+        if bars is None:
+            super().load_data()
+            return
+
+        self.history_data = list(bars)
+        self.output(f"从预加载数据读取历史数据，数据量：{len(self.history_data)}")
+
+    def load_bar(self, vt_symbol: str, days: int, interval: Interval, callback, use_database: bool) -> List[BarData]:
+        """从BarStore读取策略初始化的预热K线, 未覆盖时按原方式查询数据库"""
+        init_end = self.start - INTERVAL_DELTA_MAP[interval]
+        init_start = self.start - timedelta(days=days)
+        symbol, exchange = extract_vt_symbol(vt_symbol)
+        bars = self.bar_store.bars(symbol, exchange.value, _naive(init_start), _naive(init_end))
+        if bars is None:
+            return super().load_bar(vt_symbol, days, interval, callback, use_database)
+
+        self.callback = callback
+        return list(bars)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+vnpy回测进程池
+把互相独立的BacktestingEngine回测分发到多个进程并行运行, 结果按提交顺序返回,
+合并结果与逐个串行运行完全一致。
+
+项目模块由加载器以生成的模块名导入, 子进程无法按名称找到其中的函数,
+回测在本模块的run_backtest_task中执行, 策略类需定义在可导入的模块中(如strategies包)。
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+
+# 本进程中BacktestPool的默认进程数, None表示CPU核数; 任务进程由JobManager按分到的CPU核数设置
+_default_max_workers: Optional[int] = None
+
+
+def set_default_max_workers(max_workers: Optional[int]) -> None:
+    """
+    设置本进程中BacktestPool的默认进程数
+
+    JobManager在每个任务进程启动时调用, 同时运行的任务各用CPU核数/任务进程数个回测进程,
+    避免每个任务都按CPU核数启动回测进程
+    """
+    global _default_max_workers
+    _default_max_workers = max_workers
+
+
+class BacktestTask:
+    """一次回测的参数, 可以跨进程传递"""
+
+    def __init__(self, vt_symbol: str, start: datetime, end: datetime, capital: float,
+                 strategy_class: type, setting: Dict[str, Any], bar_store=None, **parameters):
+        """
+        Args:
+            vt_symbol: 合约代码, 如000001.SZSE
+            start: 回测开始时间
+            end: 回测结束时间
+            capital: 回测资金
+            strategy_class: 策略类
+            setting: 策略参数
+            bar_store: 预加载的K线(backtest_bars.BarStore), 为空时回测引擎查询数据库
+            **parameters: BacktestingEngine.set_parameters的其他参数(interval、rate、slippage等)
+        """
+        self.vt_symbol = vt_symbol
+        self.start = start
+        self.end = end
+        self.capital = capital
+        self.strategy_class = strategy_class
+        self.setting = setting
+        self.bar_store = bar_store
+        self.parameters = parameters
+
+
+class BacktestResult:
+    """一次回测的逐日结果、统计指标和成交记录"""
+
+    def __init__(self, daily_df, statistics: Dict[str, Any], trades: List[Any]):
+        self.daily_df = daily_df
+        self.statistics = statistics
+        self.trades = trades
+
+
+def run_backtest_task(task: BacktestTask) -> BacktestResult:
+    """运行一次回测, 在工作进程或当前进程中执行"""
+    if task.bar_store is not None:
+        from backtest_bars import PreloadedBacktestingEngine
+        engine = PreloadedBacktestingEngine(task.bar_store)
+    else:
+        from vnpy_ctastrategy.backtesting import BacktestingEngine
+        engine = BacktestingEngine()
+    engine.set_parameters(
+        vt_symbol=task.vt_symbol,
+        start=task.start,
+        end=task.end,
+        capital=task.capital,
+        **task.parameters
+    )
+    engine.add_strategy(task.strategy_class, task.setting)
+    engine.load_data()
+    engine.run_backtesting()
+    daily_df = engine.calculate_result()
+    statistics = engine.calculate_statistics(output=False)
+    return BacktestResult(daily_df, statistics, engine.get_all_trades())
+
+
+class BacktestPool:
+    """
+    回测进程池
+
+    max_workers为1时在当前进程中串行运行, 便于调试; 进程池在第一次提交时启动,
+    离开with语句时关闭。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        """
+        Args:
+            max_workers: 并行运行的进程数, 默认为set_default_max_workers的设置, 未设置时为CPU核数
+        """
+        self.max_workers = max(1, max_workers or _default_max_workers or os.cpu_count() or 1)
+        self._executor = None
+
+    def __enter__(self) -> 'BacktestPool':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.shutdown()
+
+    def run(self, tasks: List[BacktestTask]) -> List[BacktestResult]:
+        """
+        并行运行一组回测
+
+        Returns:
+            与tasks顺序一致的结果; 任一回测失败时抛出其异常
+        """
+        if self.max_workers == 1 or len(tasks) <= 1:
+            return [run_backtest_task(task) for task in tasks]
+
+        if self._executor is None:
+            # 与任务队列一致使用spawn, 避免fork继承数据库连接和线程锁
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return list(self._executor.map(run_backtest_task, tasks))
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
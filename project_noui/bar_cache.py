@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+K线数据缓存
+按(表名, 标的)缓存已查询过的连续日期区间, 重叠或相邻的区间自动合并,
+子区间直接从内存返回, 只向数据库补查缺失的两端。
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# K线DataFrame的列, loader返回的DataFrame和缓存的空结果都使用这组列
+BAR_COLUMNS = ['open_price', 'high_price', 'low_price', 'close_price', 'volume', 'turnover']
+
+# loader(table, symbol, start, end) -> 以datetime为索引的DataFrame, 区间为[start, end)
+BarLoader = Callable[[str, str, datetime, datetime], pd.DataFrame]
+
+# bulk_loader(table, symbols, start, end) -> {symbol: DataFrame}, 一次查询多个标的, 每个标的都要有对应的DataFrame
+BulkBarLoader = Callable[[str, List[str], datetime, datetime], Dict[str, pd.DataFrame]]
+
+
+class _Segment:
+    """一段已完整覆盖的查询区间[start, end)及其数据"""
+
+    __slots__ = ('start', 'end', 'df')
+
+    def __init__(self, start: datetime, end: datetime, df: pd.DataFrame):
+        self.start = start
+        self.end = end
+        self.df = df
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.df.memory_usage(index=True, deep=False).sum())
+
+
+class BarCache:
+    """
+    区间感知的K线缓存
+
+    每个(表名, 标的)维护一组互不重叠、按时间排序的区间。
+    以(表名, 标的)为单位做LRU淘汰, 总内存不超过max_bytes。
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        """
+        初始化缓存
+
+        Args:
+            max_bytes: 缓存数据占用内存上限(字节)
+        """
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Tuple[str, str], List[_Segment]]' = OrderedDict()
+        self._nbytes: Dict[Tuple[str, str], int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0           # 完全命中
+        self.partial_hits = 0   # 部分命中, 只补查了缺失区间
+        self.misses = 0         # 完全未命中
+        self.evictions = 0
+        self.rows_loaded = 0    # 从数据库加载的总行数
+
+    def get(self, table: str, symbol: str, start: datetime, end: datetime,
+            loader: BarLoader) -> pd.DataFrame:
+        """
+        获取[start, end)区间的K线数据, 缺失部分通过loader补查
+
+        Args:
+            table: 数据表名
+            symbol: 标的代码
+            start: 开始时间(包含)
+            end: 结束时间(不包含)
+            loader: 数据库查询函数
+
+        Returns:
+            以datetime为索引的DataFrame
+        """
+        key = (table, symbol)
+        if start >= end:
+            return self._slice(self._empty_like(key), start, end)
+
+        with self._lock:
+            segments = self._entries.get(key, [])
+            gaps = self._find_gaps(segments, start, end)
+            if not gaps:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._slice(self._covering(segments, start).df, start, end)
+
+        # 查询数据库时不持有锁, 避免阻塞其他请求
+        loaded = [(gap_start, gap_end, loader(table, symbol, gap_start, gap_end)) for gap_start, gap_end in gaps]
+
+        with self._lock:
+            if len(gaps) == 1 and gaps[0] == (start, end):
+                self.misses += 1
+            else:
+                self.partial_hits += 1
+
+            segments = list(self._entries.get(key, []))
+            for gap_start, gap_end, df in loaded:
+                self.rows_loaded += len(df)
+                segments = self._insert(segments, _Segment(gap_start, gap_end, df))
+
+            self._store(key, segments)
+            return self._slice(self._covering(segments, start).df, start, end)
+
+    def get_many(self, table: str, symbols: List[str], start: datetime, end: datetime,
+                 bulk_loader: BulkBarLoader) -> Dict[str, pd.DataFrame]:
+        """
+        批量获取同一张表中多个标的[start, end)区间的K线数据
+
+        所有未完全命中的标的合并为一次bulk_loader查询, 查询区间取各标的缺失区间的并集。
+
+        Args:
+            table: 数据表名
+            symbols: 标的代码列表
+            start: 开始时间(包含)
+            end: 结束时间(不包含)
+            bulk_loader: 批量数据库查询函数
+
+        Returns:
+            标的代码 -> 以datetime为索引的DataFrame
+        """
+        result = {}
+        missing = []
+        fetch_start, fetch_end = end, start
+        with self._lock:
+            for symbol in dict.fromkeys(symbols):
+                key = (table, symbol)
+                segments = self._entries.get(key, [])
+                gaps = self._find_gaps(segments, start, end)
+                if not gaps:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    result[symbol] = self._slice(self._covering(segments, start).df, start, end)
+                else:
+                    missing.append(symbol)
+                    fetch_start = min(fetch_start, gaps[0][0])
+                    fetch_end = max(fetch_end, gaps[-1][1])
+
+        if not missing:
+            return result
+
+        loaded = bulk_loader(table, missing, fetch_start, fetch_end)
+
+        with self._lock:
+            for symbol in missing:
+                key = (table, symbol)
+                segments = list(self._entries.get(key, []))
+                if segments:
+                    self.partial_hits += 1
+                else:
+                    self.misses += 1
+
+                df = loaded[symbol]
+                self.rows_loaded += len(df)
+                segments = self._insert(segments, _Segment(fetch_start, fetch_end, df))
+                self._store(key, segments)
+                result[symbol] = self._slice(self._covering(segments, start).df, start, end)
+        return result
+
+    def invalidate(self, table: str = None, symbol: str = None) -> None:
+        """
+        使缓存失效
+
+        Args:
+            table: 表名, None表示所有表
+            symbol: 标的代码, None表示该表所有标的
+        """
+        with self._lock:
+            for key in list(self._entries.keys()):
+                if (table is None or key[0] == table) and (symbol is None or key[1] == symbol):
+                    self._drop(key, count_eviction=False)
+
+    def stats(self) -> Dict[str, float]:
+        """返回缓存命中统计"""
+        with self._lock:
+            requests = self.hits + self.partial_hits + self.misses
+            return {
+                'hits': self.hits,
+                'partial_hits': self.partial_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'evictions': self.evictions,
+                'rows_loaded': self.rows_loaded,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    @staticmethod
+    def _find_gaps(segments: List[_Segment], start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """找出[start, end)中未被已有区间覆盖的部分"""
+        gaps = []
+        cursor = start
+        for seg in segments:
+            if seg.end <= cursor:
+                continue
+            if seg.start >= end:
+                break
+            if seg.start > cursor:
+                gaps.append((cursor, seg.start))
+            cursor = max(cursor, seg.end)
+            if cursor >= end:
+                break
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    @staticmethod
+    def _covering(segments: List[_Segment], start: datetime) -> _Segment:
+        """返回包含start的区间"""
+        for seg in segments:
+            if seg.start <= start < seg.end:
+                return seg
+        raise KeyError(start)
+
+    @staticmethod
+    def _insert(segments: List[_Segment], new: _Segment) -> List[_Segment]:
+        """插入新区间, 与重叠或相邻的区间合并"""
+        merged_start, merged_end = new.start, new.end
+        frames = [new.df]
+        result = []
+        for seg in segments:
+            if seg.end < merged_start or seg.start > merged_end:
+                result.append(seg)
+            else:
+                merged_start = min(merged_start, seg.start)
+                merged_end = max(merged_end, seg.end)
+                frames.append(seg.df)
+
+        frames = [df for df in frames if not df.empty] or frames[:1]
+        if len(frames) == 1:
+            df = frames[0]
+        else:
+            df = pd.concat(frames)
+            df = df[~df.index.duplicated(keep='first')].sort_index()
+
+        result.append(_Segment(merged_start, merged_end, df))
+        result.sort(key=lambda seg: seg.start)
+        return result
+
+    @staticmethod
+    def _slice(df: pd.DataFrame, start: datetime, end: datetime) -> pd.DataFrame:
+        """按[start, end)截取有序索引的DataFrame"""
+        left = df.index.searchsorted(pd.Timestamp(start), side='left')
+        right = df.index.searchsorted(pd.Timestamp(end), side='left')
+        return df.iloc[left:right]
+
+    def _empty_like(self, key: Tuple[str, str]) -> pd.DataFrame:
+        with self._lock:
+            segments = self._entries.get(key)
+            if segments:
+                return segments[0].df.iloc[0:0]
+        return pd.DataFrame(columns=BAR_COLUMNS, index=pd.DatetimeIndex([], name='datetime'), dtype=np.float64)
+
+    def _store(self, key: Tuple[str, str], segments: List[_Segment]) -> None:
+        """保存区间并按LRU淘汰超出内存上限的条目, 调用方需持有锁"""
+        self._drop(key, count_eviction=False)
+        nbytes = sum(seg.nbytes for seg in segments)
+        self._entries[key] = segments
+        self._nbytes[key] = nbytes
+        self._total_bytes += nbytes
+
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    def _drop(self, key: Tuple[str, str], count_eviction: bool = True) -> None:
+        """移除一个条目, 调用方需持有锁"""
+        if key not in self._entries:
+            return
+        del self._entries[key]
+        self._total_bytes -= self._nbytes.pop(key)
+        if count_eviction:
+            self.evictions += 1
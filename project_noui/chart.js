@@ -15,13 +15,29 @@ let projectData = {};
 // API基础URL
 const API_BASE_URL = 'http://localhost:8800/api';
 
+// 项目资金曲线最多请求的点数, 超出时由服务端降采样
+const PERFORMANCE_MAX_POINTS = 2000;
+
 // 时间框架选项
 const timeframes = [
     { value: '1m', label: '1分钟' },
     { value: '5m', label: '5分钟' },
-    { value: '1d', label: '日线' }
+    { value: '1d', label: '日线' },
+    { value: '1w', label: '周线' },
+    { value: '1M', label: '月线' }
 ];
 
+// 时间框架到后端K线周期的映射, 分钟线暂未提供, 按日线加载
+const timeframeIntervals = {
+    '1d': 'daily',
+    '1w': 'weekly',
+    '1M': 'monthly'
+};
+
+function timeframeInterval(timeframe) {
+    return timeframeIntervals[timeframe] || 'daily';
+}
+
 // 技术指标选项
 const indicators = [
     { value: 'rsi', label: 'RSI(14)' },
@@ -82,10 +98,89 @@ async function loadTargetList(window) {
     }
 }
 
-function updateAllWindows() {
+// 一次批量请求加载所有窗口的K线和均线数据
+async function updateAllWindows() {
+    const startDate = document.getElementById('startDate').value;
+    const endDate = document.getElementById('endDate').value;
+
+    const targetWindows = [];
     windows.forEach((window, windowId) => {
-        loadTargetData(window);
+        const selector = document.getElementById(`symbolSelector_${windowId}`);
+        if (selector && selector.value) {
+            targetWindows.push(window);
+        }
+    });
+
+    if (targetWindows.length === 0 || !startDate || !endDate) {
+        return;
+    }
+
+    currentStartDate = startDate;
+    currentEndDate = endDate;
+
+    // 相同K线周期的窗口合并为一次批量请求
+    const groups = new Map();
+    targetWindows.forEach(window => {
+        const interval = timeframeInterval(window.timeframe);
+        if (!groups.has(interval)) {
+            groups.set(interval, []);
+        }
+        groups.get(interval).push(window);
+    });
+
+    try {
+        for (const [interval, groupWindows] of groups) {
+            const response = await fetch(`${API_BASE_URL}/bars/batch`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    targets: groupWindows.map(window => ({
+                        type: window.type,
+                        symbol: document.getElementById(`symbolSelector_${window.windowId}`).value
+                    })),
+                    start_date: startDate,
+                    end_date: endDate,
+                    indicator: 'all_ma',
+                    interval: interval
+                })
+            });
+            const data = await response.json();
+            if (!data.series) {
+                throw new Error(data.error);
+            }
+
+            data.series.forEach((item, i) => {
+                applyTargetData(groupWindows[i], item.bars, item.indicator);
+            });
+        }
+    } catch (error) {
+        console.error('批量加载标的数据失败:', error);
+        showMessage('加载标的数据失败', 'error');
+    }
+}
+
+// 将K线和均线数据更新到窗口
+function applyTargetData(window, bars, indicator) {
+    if (bars) {
+        updateBarsData(window, bars, indicator);
+        updateVolumeData(window, bars);
+    }
+    requestAnimationFrame(() => {
+        if (window.candleChart && window.candlestickSeries) {
+            window.candleChart.timeScale().fitContent();
+        }
+        if (window.volumeChart && window.volumeSeries) {
+            window.volumeChart.timeScale().fitContent();
+        }
+        if (window.indicatorChart && window.indicatorSeries) {
+            window.indicatorChart.timeScale().fitContent();
+        }
+
     });
+
+    registerWindowsEvent(window);
 }
 
 // 加载标的数据
@@ -104,9 +199,10 @@ async function loadTargetData(window) {
         return;
     }
     const type = window.type;
-    const url = `${API_BASE_URL}/${type}/bars?symbol=${symbol}&start_date=${startDate}&end_date=${endDate}`;
+    const interval = timeframeInterval(window.timeframe);
+    const url = `${API_BASE_URL}/${type}/bars?symbol=${symbol}&start_date=${startDate}&end_date=${endDate}&interval=${interval}`;
 
-    const indicator_url = `${API_BASE_URL}/${type}/indicators?symbol=${currentProject}&start_date=${currentStartDate}&end_date=${currentEndDate}&indicator=all_ma`;
+    const indicator_url = `${API_BASE_URL}/${type}/indicators?symbol=${currentProject}&start_date=${currentStartDate}&end_date=${currentEndDate}&indicator=all_ma&interval=${interval}`;
     
     if (!symbol || !startDate || !endDate) {
         showMessage('请选择标的和日期范围', 'error');
@@ -124,29 +220,13 @@ async function loadTargetData(window) {
             console.log(`窗口 ${windowId} 不存在`);
             return;
         }
-        if (barsData.bars) {
-            updateBarsData(window, barsData.bars, indicatorData.indicator);
-            updateVolumeData(window, barsData.bars);
-        }
-        requestAnimationFrame(() => {
-            if (window.candleChart && window.candlestickSeries) {
-                window.candleChart.timeScale().fitContent();
-            }
-            if (window.volumeChart && window.volumeSeries) {
-                window.volumeChart.timeScale().fitContent();
-            }
-            if (window.indicatorChart && window.indicatorSeries) {
-                window.indicatorChart.timeScale().fitContent();
-            }
-
-        });
+        applyTargetData(window, barsData.bars, indicatorData.indicator);
         
     } catch (error) {
         console.error('加载标的数据失败:', error);
         showMessage('加载标的数据失败', 'error');
+        registerWindowsEvent(window);
     }
-
-    registerWindowsEvent(window);
 }
 
 // 更新窗口数据
@@ -812,7 +892,7 @@ async function selectProject(projectName) {
         }
         
         // 加载项目策略数据
-        const strategyResponse = await fetch(`${API_BASE_URL}/project/${projectName}/data`);
+        const strategyResponse = await fetch(`${API_BASE_URL}/project/${projectName}/data?max_points=${PERFORMANCE_MAX_POINTS}`);
         const strategyData = await strategyResponse.json();
         
         if (strategyData.strategy_data) {
@@ -967,6 +1047,96 @@ function onProjectSelect() {
     }
 }
 
+// 轮询运行任务直到结束, 期间显示进度
+async function waitForJob(jobId, interval = 1000) {
+    while (true) {
+        const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`);
+        const data = await response.json();
+        if (!data.job) {
+            throw new Error(data.error);
+        }
+        const job = data.job;
+        if (job.status === 'finished' || job.status === 'failed' || job.status === 'cancelled') {
+            return job;
+        }
+        const percent = Math.round(job.progress * 100);
+        showMessage(`项目运行中 ${percent}% ${job.message || ''}`, 'info');
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
+// 清空资金曲线、回撤和每日盈亏图表, 准备接收运行中的中间结果
+function clearPerformanceCharts() {
+    ['balanceSeries', 'drawdownSeries', 'daily_pnlSeries'].forEach(name => {
+        const series = projectCharts.get(name);
+        if (series) {
+            series.setData([]);
+        }
+    });
+}
+
+// 把运行中推送的中间结果追加到图表和交易记录
+function appendPartialResult(projectName, partial, trades) {
+    const columns = {
+        balanceSeries: partial.balance,
+        drawdownSeries: partial.drawdown,
+        daily_pnlSeries: partial.daily_pnl
+    };
+    Object.entries(columns).forEach(([name, values]) => {
+        const series = projectCharts.get(name);
+        if (!series) return;
+        for (let i = 0; i < partial.time.length; i++) {
+            series.update({ time: partial.time[i], value: values[i] });
+        }
+    });
+
+    if (partial.trades.length > 0 && projectData[projectName]) {
+        trades.push(...partial.trades);
+        updateProjectSummary(projectName);
+        addTradeRecordsToDetails(projectName, trades);
+    }
+}
+
+// 通过SSE订阅运行任务, 实时显示进度和中间结果; 不支持SSE或连接失败时改为轮询
+function streamJob(jobId, projectName) {
+    if (typeof EventSource === 'undefined') {
+        return waitForJob(jobId);
+    }
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`${API_BASE_URL}/jobs/${jobId}/stream`);
+        const trades = [];
+        let received = false;
+        let chartsCleared = false;
+
+        source.addEventListener('progress', (event) => {
+            received = true;
+            const job = JSON.parse(event.data);
+            const percent = Math.round(job.progress * 100);
+            showMessage(`项目运行中 ${percent}% ${job.message || ''}`, 'info');
+        });
+        source.addEventListener('partial', (event) => {
+            received = true;
+            if (currentProject !== projectName) return;
+            if (!chartsCleared) {
+                clearPerformanceCharts();
+                chartsCleared = true;
+            }
+            appendPartialResult(projectName, JSON.parse(event.data), trades);
+        });
+        source.addEventListener('end', (event) => {
+            source.close();
+            resolve(JSON.parse(event.data));
+        });
+        source.onerror = () => {
+            // 断线后EventSource会带上Last-Event-ID自动重连; 从未收到事件说明服务器不可用, 改为轮询
+            if (!received) {
+                source.close();
+                waitForJob(jobId).then(resolve, reject);
+            }
+        };
+    });
+}
+
 // 执行项目运行
 async function executeRunProject() {
     const projectName = document.getElementById('projectSelector').value;
@@ -996,9 +1166,16 @@ async function executeRunProject() {
         const data = await response.json();
         
         if (data.success) {
-            showMessage(`项目 ${projectName} 运行成功`, 'success');
-            if (currentProject === projectName) {
-                selectProject(projectName);
+            const job = await streamJob(data.job_id, projectName);
+            if (job.status === 'finished') {
+                showMessage(`项目 ${projectName} 运行成功`, 'success');
+                if (currentProject === projectName) {
+                    selectProject(projectName);
+                }
+            } else if (job.status === 'cancelled') {
+                showMessage(`项目 ${projectName} 已取消`, 'info');
+            } else {
+                showMessage(`项目运行失败: ${job.error}`, 'error');
             }
         } else {
             showMessage(`项目运行失败: ${data.error}`, 'error');
@@ -1598,6 +1775,10 @@ function changeTimeframe(windowId, newTimeframe) {
 
     window.timeframe = newTimeframe;
     
+    const selector = document.getElementById(`symbolSelector_${windowId}`);
+    if (selector && selector.value) {
+        loadTargetData(window);
+    }
     updateWindowStatus(windowId, '时间框架已更新');
 }
 
@@ -1622,7 +1803,7 @@ async function updateIndicator(windowId, indicatorType) {
     const window = windows.get(windowId);
     if (!window) return;
     const type = window.type;
-    const url = `${API_BASE_URL}/${type}/indicators?symbol=${currentProject}&start_date=${currentStartDate}&end_date=${currentEndDate}&indicator=${indicatorType}`;
+    const url = `${API_BASE_URL}/${type}/indicators?symbol=${currentProject}&start_date=${currentStartDate}&end_date=${currentEndDate}&indicator=${indicatorType}&interval=${timeframeInterval(window.timeframe)}`;
     
 
     try {
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+全市场截面指标
+把整个标的池的日线加载为 标的×日期 的二维数组(停牌、未上市和退市的位置为NaN),
+沿时间轴一次向量化计算全部标的的滚动指标, 供选股和策略研究使用。
+
+停牌日没有K线, 计算前把每个标的的有效K线向左压紧, 结果与逐个标的读取K线计算一致,
+计算完成后再放回原来的日期位置。EMA、RSI、MACD、ATR等递推指标按时间逐步递推,
+每一步同时更新全部标的; 均线和布林带用累加和一次算出。
+
+标的按批加载和计算, 控制内存占用, 并记录每批的加载和计算耗时:
+    python cross_section.py rsi:14 2015-01-01 2025-01-01
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from indicator_tools import IndicatorSpec, assemble_series, indicator_warmup_bars, parse_indicator_spec
+
+
+# 与api_server的预热估算一致: 每根日线约7/5个自然日, 另加节假日余量
+DAYS_PER_BAR = 7 / 5
+HOLIDAY_MARGIN_DAYS = 15
+
+# 每批加载和计算的标的数
+DEFAULT_BATCH_SIZE = 1000
+
+# 与talib判断浮点数为零的阈值一致
+_TA_EPSILON = 1e-8
+
+
+def _compact_order(values: np.ndarray):
+    """
+    把每行的有效值按原顺序移到行首、NaN移到行尾的列顺序
+
+    Returns:
+        (压紧后每个位置来自的原列号, 每行的有效值数量)
+    """
+    missing = np.isnan(values)
+    return np.argsort(missing, axis=1, kind='stable'), (~missing).sum(axis=1)
+
+
+def _expand(compact: np.ndarray, order: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """把压紧计算的结果放回原来的列, 行尾的无效位置为NaN"""
+    compact = np.where(np.arange(compact.shape[1]) < counts[:, None], compact, np.nan)
+    result = np.empty_like(compact)
+    np.put_along_axis(result, order, compact, axis=1)
+    return result
+
+
+class _TimeMajor:
+    """
+    一批标的压紧后的数据, 按 日期×标的 存放, 逐日递推时每一步读写连续内存
+
+    行尾无效位置为NaN, 各指标与_SeriesCache一样缓存共用的均线和EMA
+    """
+
+    def __init__(self, close: np.ndarray, high: np.ndarray, low: np.ndarray):
+        self.close = close
+        self.high = high
+        self.low = low
+        self._cache = {}
+
+    def _get(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    @staticmethod
+    def _rolling_sum(x: np.ndarray, window: int) -> np.ndarray:
+        """窗口内的和, 窗口不满时为NaN"""
+        result = np.full_like(x, np.nan)
+        if len(x) < window:
+            return result
+        total = np.cumsum(x, axis=0)
+        result[window - 1] = total[window - 1]
+        result[window:] = total[window:] - total[:-window]
+        return result
+
+    def _offset(self) -> np.ndarray:
+        """每个标的第一根K线的收盘价, 累加前减去以减小舍入误差"""
+        return self._get('offset', lambda: np.nan_to_num(self.close[0]) if len(self.close) else 0.0)
+
+    def sma(self, window: int) -> np.ndarray:
+        offset = self._offset()
+        return self._get(('sma', window),
+                         lambda: self._rolling_sum(self.close - offset, window) / window + offset)
+
+    @staticmethod
+    def _ema(x: np.ndarray, window: int) -> np.ndarray:
+        """前window个值的简单平均作为初值, 与talib.EMA一致"""
+        result = np.full_like(x, np.nan)
+        if len(x) < window:
+            return result
+        k = 2.0 / (window + 1)
+        value = x[:window].mean(axis=0)
+        result[window - 1] = value
+        for t in range(window, len(x)):
+            value = (x[t] - value) * k + value
+            result[t] = value
+        return result
+
+    def ema(self, window: int) -> np.ndarray:
+        return self._get(('ema', window), lambda: self._ema(self.close, window))
+
+    @staticmethod
+    def _wilder(x: np.ndarray, window: int) -> np.ndarray:
+        """x[1:window+1]的平均值作为初值, 之后按Wilder方法平滑, 与talib.RSI/ATR一致"""
+        result = np.full_like(x, np.nan)
+        if len(x) <= window:
+            return result
+        value = x[1:window + 1].mean(axis=0)
+        result[window] = value
+        for t in range(window + 1, len(x)):
+            value = (value * (window - 1) + x[t]) / window
+            result[t] = value
+        return result
+
+    def rsi(self, window: int) -> np.ndarray:
+        def compute():
+            change = np.diff(self.close, axis=0, prepend=np.nan)
+            gain = self._wilder(np.where(change > 0, change, 0.0), window)
+            loss = self._wilder(np.where(change < 0, -change, 0.0), window)
+            total = gain + loss
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = np.where(np.abs(total) > _TA_EPSILON, 100.0 * gain / total, 0.0)
+            return np.where(np.isnan(total), np.nan, result)
+        return self._get(('rsi', window), compute)
+
+    def atr(self, window: int) -> np.ndarray:
+        def compute():
+            prev_close = np.roll(self.close, 1, axis=0)
+            true_range = np.maximum.reduce([
+                self.high - self.low,
+                np.abs(self.high - prev_close),
+                np.abs(self.low - prev_close),
+            ])
+            return self._wilder(true_range, window)
+        return self._get(('atr', window), compute)
+
+    def macd(self, fast: int, slow: int, signal: int) -> Dict[str, np.ndarray]:
+        def compute():
+            macd_line = self.ema(fast) - self.ema(slow)
+            signal_line = np.full_like(macd_line, np.nan)
+            valid = slow - 1
+            if len(macd_line) > valid:
+                signal_line[valid:] = self._ema(macd_line[valid:], signal)
+            return {'macd': macd_line, 'signal': signal_line, 'histogram': macd_line - signal_line}
+        return self._get(('macd', fast, slow, signal), compute)
+
+    def boll(self, window: int, dev: float) -> Dict[str, np.ndarray]:
+        def compute():
+            middle = self.sma(window)
+            # 方差与平移无关, 减去首个收盘价后按talib.STDDEV的方式计算
+            shifted = self.close - self._offset()
+            mean = self._rolling_sum(shifted, window) / window
+            variance = self._rolling_sum(shifted * shifted, window) / window - mean * mean
+            std = np.where(variance > _TA_EPSILON, np.sqrt(np.maximum(variance, 0.0)), 0.0)
+            std = np.where(np.isnan(variance), np.nan, std)
+            return {'upper': middle + dev * std, 'middle': middle, 'lower': middle - dev * std}
+        return self._get(('boll', window, dev), compute)
+
+    def compute(self, spec: IndicatorSpec):
+        """计算指标, 单输出指标返回数组, 多输出指标返回分量字典"""
+        if spec.name == 'ma':
+            return self.sma(int(spec.params[0]))
+        if spec.name == 'ema':
+            return self.ema(int(spec.params[0]))
+        if spec.name == 'rsi':
+            return self.rsi(int(spec.params[0]))
+        if spec.name == 'atr':
+            return self.atr(int(spec.params[0]))
+        if spec.name == 'macd':
+            return self.macd(*(int(p) for p in spec.params))
+        return self.boll(int(spec.params[0]), spec.params[1])
+
+
+def compute_cross_section(close: np.ndarray, specs: List[IndicatorSpec],
+                          high: Optional[np.ndarray] = None,
+                          low: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """
+    在 标的×日期 的二维数组上计算指标
+
+    每个标的开头不足预热K线数的位置为NaN, 与compute_indicator_series的预热处理一致。
+
+    Args:
+        close: 收盘价数组, 没有K线的位置为NaN
+        specs: parse_indicator_spec的结果
+        high: 最高价数组, ATR需要, 为空时使用收盘价
+        low: 最低价数组, ATR需要, 为空时使用收盘价
+
+    Returns:
+        输出字段名 -> 与close同形状的指标数组, 字段名与compute_indicator_series相同
+    """
+    close = np.asarray(close, dtype=np.float64)
+    order, counts = _compact_order(close)
+
+    def time_major(values):
+        values = np.take_along_axis(np.asarray(values, dtype=np.float64), order, axis=1)
+        return np.ascontiguousarray(values.T)
+
+    data = _TimeMajor(time_major(close),
+                      time_major(close if high is None else high),
+                      time_major(close if low is None else low))
+    columns = np.arange(close.shape[1])
+
+    values = []
+    for spec in specs:
+        warm = columns < spec.warmup_bars
+        result = data.compute(spec)
+        if isinstance(result, dict):
+            values.append({key: _expand(np.where(warm, np.nan, array.T), order, counts)
+                           for key, array in result.items()})
+        else:
+            values.append(_expand(np.where(warm, np.nan, result.T), order, counts))
+    return assemble_series(specs, values)
+
+
+class CrossSection:
+    """全市场截面指标的计算结果"""
+
+    def __init__(self, symbols: List[str], dates: np.ndarray, series: Dict[str, np.ndarray],
+                 timings: List[Dict]):
+        """
+        Args:
+            symbols: 标的代码, 对应数组的行
+            dates: 交易日(datetime64), 对应数组的列
+            series: 输出字段名 -> 标的×日期的指标数组
+            timings: 每批的标的数、K线数和加载/计算耗时(秒)
+        """
+        self.symbols = symbols
+        self.dates = dates
+        self.series = series
+        self.timings = timings
+
+    def frame(self, key: str) -> pd.DataFrame:
+        """一个指标的DataFrame, 行为日期, 列为标的"""
+        return pd.DataFrame(self.series[key].T, index=pd.DatetimeIndex(self.dates), columns=self.symbols)
+
+    def latest(self, key: str) -> pd.Series:
+        """各标的最后一个有效的指标值, 供选股使用"""
+        values = self.series[key]
+        valid = ~np.isnan(values)
+        last = values.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+        latest = np.where(valid.any(axis=1), values[np.arange(len(values)), last], np.nan)
+        return pd.Series(latest, index=self.symbols)
+
+
+def _list_symbols(connection, table: str) -> List[str]:
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT DISTINCT symbol FROM `{table}` ORDER BY symbol")
+    symbols = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return symbols
+
+
+def load_universe(connection, symbols: Sequence[str], start: datetime, end: datetime,
+                  table: str = 'daily_hfq', fields: Sequence[str] = ('close_price',)):
+    """
+    一次查询加载一批标的[start, end)区间的日线, 转换为 标的×日期 的二维数组
+
+    Returns:
+        (交易日数组, 字段名 -> 标的×日期数组, K线数), 没有K线的位置为NaN
+    """
+    placeholders = ", ".join(["%s"] * len(symbols))
+    cursor = connection.cursor()
+    cursor.execute(
+        f"SELECT symbol, datetime, {', '.join(fields)} FROM `{table}` "
+        f"WHERE symbol IN ({placeholders}) AND datetime >= %s AND datetime < %s",
+        (*symbols, start, end),
+    )
+    rows = cursor.fetchall()
+    cursor.close()
+
+    df = pd.DataFrame(rows, columns=['symbol', 'datetime', *fields])
+    times = pd.to_datetime(df['datetime']).values
+    dates = np.unique(times)
+    row_index = pd.Index(symbols).get_indexer(df['symbol'])
+    col_index = np.searchsorted(dates, times)
+
+    arrays = {}
+    for field in fields:
+        array = np.full((len(symbols), len(dates)), np.nan)
+        array[row_index, col_index] = df[field].to_numpy(dtype=np.float64)
+        arrays[field] = array
+    return dates, arrays, len(df)
+
+
+def compute_universe_indicators(connection, indicator: str, start: datetime, end: datetime,
+                                table: str = 'daily_hfq', symbols: Optional[Sequence[str]] = None,
+                                batch_size: int = DEFAULT_BATCH_SIZE, verbose: bool = True) -> CrossSection:
+    """
+    计算整个标的池[start, end)区间的指标
+
+    每批标的一次查询加载(向前多取预热所需的K线), 在二维数组上一次计算全部指标,
+    各批的结果按交易日合并。
+
+    Args:
+        connection: 数据库连接
+        indicator: 指标参数, 格式与/api/indicators相同, 如rsi:14;ma:20
+        start: 开始日期
+        end: 结束日期
+        table: 日线表名
+        symbols: 标的列表, None表示表中的全部标的
+        batch_size: 每批的标的数
+        verbose: 是否打印每批耗时
+
+    Returns:
+        CrossSection
+    """
+    specs = parse_indicator_spec(indicator)
+    fields = ['close_price']
+    if any(spec.name == 'atr' for spec in specs):
+        fields += ['high_price', 'low_price']
+    load_start = start - timedelta(days=int(indicator_warmup_bars(specs) * DAYS_PER_BAR) + HOLIDAY_MARGIN_DAYS)
+
+    if symbols is None:
+        symbols = _list_symbols(connection, table)
+    symbols = list(symbols)
+    batches = [symbols[i:i + batch_size] for i in range(0, len(symbols), batch_size)]
+
+    results = []
+    timings = []
+    for number, batch in enumerate(batches, 1):
+        started = time.perf_counter()
+        dates, arrays, bar_count = load_universe(connection, batch, load_start, end, table, fields)
+        loaded = time.perf_counter()
+        series = compute_cross_section(arrays['close_price'], specs,
+                                       arrays.get('high_price'), arrays.get('low_price'))
+        computed = time.perf_counter()
+
+        results.append((dates, series))
+        timing = {'batch': number, 'symbols': len(batch), 'bars': bar_count,
+                  'load': loaded - started, 'compute': computed - loaded}
+        timings.append(timing)
+        if verbose:
+            print(f"批次 {number}/{len(batches)}: {len(batch)} 个标的, {bar_count} 根K线, "
+                  f"加载 {timing['load']:.2f}s, 计算 {timing['compute']:.2f}s")
+
+    # 各批的交易日可能不同, 合并到共同的日期轴上, 只保留start之后的部分
+    if not results:
+        return CrossSection(symbols, np.array([], dtype='datetime64[ns]'),
+                            compute_cross_section(np.empty((0, 0)), specs), timings)
+    all_dates = np.unique(np.concatenate([dates for dates, _ in results]))
+    all_dates = all_dates[all_dates >= np.datetime64(start)]
+    series = {key: np.full((len(symbols), len(all_dates)), np.nan) for key in results[0][1]}
+
+    row = 0
+    for dates, batch_series in results:
+        count = next(iter(batch_series.values())).shape[0]
+        keep = dates >= np.datetime64(start)
+        columns = np.searchsorted(all_dates, dates[keep])
+        for key, values in batch_series.items():
+            series[key][row:row + count, columns] = values[:, keep]
+        row += count
+
+    return CrossSection(symbols, all_dates, series, timings)
+
+
+def main():
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+    from tools.db_pool import get_connection
+
+    if len(sys.argv) < 4:
+        print("用法: python cross_section.py <指标> <开始日期> <结束日期> [日线表]")
+        return
+    indicator, start, end = sys.argv[1:4]
+    table = sys.argv[4] if len(sys.argv) > 4 else 'daily_hfq'
+
+    started = time.perf_counter()
+    with get_connection() as connection:
+        result = compute_universe_indicators(connection, indicator, datetime.strptime(start, '%Y-%m-%d'),
+                                             datetime.strptime(end, '%Y-%m-%d'), table)
+    load = sum(timing['load'] for timing in result.timings)
+    compute = sum(timing['compute'] for timing in result.timings)
+    print(f"完成: {len(result.symbols)} 个标的 × {len(result.dates)} 个交易日, "
+          f"加载 {load:.2f}s, 计算 {compute:.2f}s, 总计 {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
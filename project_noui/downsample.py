@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+长序列降采样
+多年的日线数据超过图表像素数时在服务端降采样, 控制响应体积和前端渲染时间:
+
+- 折线(资金曲线、回撤等): LTTB或每桶最小/最大值, 保留曲线形状和极值
+- K线: 相邻K线按桶合并为更粗的K线(开盘取首根、最高取最大、最低取最小、收盘取末根、成交量求和)
+"""
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+METHOD_LTTB = 'lttb'
+METHOD_MINMAX = 'minmax'
+
+# 降采样后至少保留的点数
+MIN_POINTS = 3
+
+
+def parse_max_points(value: Optional[str]) -> Optional[int]:
+    """
+    解析max_points参数
+
+    Raises:
+        ValueError: 参数不是不小于MIN_POINTS的整数
+    """
+    if value in (None, ''):
+        return None
+    try:
+        max_points = int(value)
+    except ValueError:
+        raise ValueError(f'max_points必须为整数: {value}')
+    if max_points < MIN_POINTS:
+        raise ValueError(f'max_points不能小于{MIN_POINTS}')
+    return max_points
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets降采样, 返回保留点的下标
+
+    首尾两点固定保留, 中间每个桶选取与前一个选中点、下一个桶均值构成的三角形面积最大的点。
+    """
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = np.where(np.isnan(y), 0.0, y.astype(np.float64))
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    selected = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[selected] - avg_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (avg_y - y[selected])
+        )
+        selected = start + int(np.argmax(area))
+        indices[i + 1] = selected
+    return indices
+
+
+def minmax_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """每个桶保留最小值和最大值所在的点, 首尾两点固定保留, 返回有序下标"""
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+
+    buckets = max(1, (max_points - 2) // 2)
+    starts = np.linspace(1, n - 1, buckets + 1).astype(np.int64)
+    filled = np.where(np.isnan(y), np.nanmean(y) if not np.isnan(y).all() else 0.0, y)
+
+    selected = [0, n - 1]
+    for start, end in zip(starts[:-1], starts[1:]):
+        if end <= start:
+            continue
+        bucket = filled[start:end]
+        selected.append(start + int(np.argmin(bucket)))
+        selected.append(start + int(np.argmax(bucket)))
+    return np.unique(selected)
+
+
+def downsample_lines(times: np.ndarray, series: Dict[str, np.ndarray], max_points: int,
+                     method: str = METHOD_LTTB) -> Dict[str, np.ndarray]:
+    """
+    对共用时间轴的多条折线降采样
+
+    每条折线分得max_points / 折线数的点数, 选中点的并集作为共同的时间轴,
+    总点数不超过max_points。
+
+    Args:
+        times: 时间戳数组
+        series: 名称 -> 值数组, 与times等长
+        max_points: 最多保留的点数
+        method: lttb或minmax
+
+    Returns:
+        包含'time'和各折线的列数组
+    """
+    times = np.asarray(times)
+    n = len(times)
+    if n <= max_points or not series:
+        return {'time': times, **{key: np.asarray(values) for key, values in series.items()}}
+
+    if method not in (METHOD_LTTB, METHOD_MINMAX):
+        raise ValueError(f'不支持的降采样方法: {method}')
+
+    budget = max(MIN_POINTS, max_points // len(series))
+    selected = []
+    for values in series.values():
+        values = np.asarray(values, dtype=np.float64)
+        if method == METHOD_LTTB:
+            selected.append(lttb_indices(times, values, budget))
+        else:
+            selected.append(minmax_indices(values, budget))
+    indices = np.unique(np.concatenate(selected))
+
+    columns = {'time': times[indices]}
+    for key, values in series.items():
+        columns[key] = np.asarray(values)[indices]
+    return columns
+
+
+def bucket_starts(n: int, max_points: int) -> np.ndarray:
+    """把n根K线按顺序等分为不超过max_points个桶, 返回每个桶的起始下标"""
+    size = -(-n // max_points)
+    return np.arange(0, n, size, dtype=np.int64)
+
+
+def aggregate_ohlc(columns: Dict[str, np.ndarray], max_points: int) -> Dict[str, np.ndarray]:
+    """
+    相邻K线合并为更粗的K线, 合并后的时间取桶内第一根K线的时间
+
+    Args:
+        columns: bars_columns格式的列数组(time/open/high/low/close/volume)
+        max_points: 最多保留的K线数
+
+    Returns:
+        相同字段的列数组
+    """
+    n = len(columns['time'])
+    if n <= max_points:
+        return columns
+
+    starts = bucket_starts(n, max_points)
+    ends = np.append(starts[1:], n) - 1
+    return {
+        'time': columns['time'][starts],
+        'open': columns['open'][starts],
+        'high': np.maximum.reduceat(columns['high'], starts),
+        'low': np.minimum.reduceat(columns['low'], starts),
+        'close': columns['close'][ends],
+        'volume': np.add.reduceat(columns['volume'], starts),
+    }
+
+
+def aggregate_aligned(times: np.ndarray, series: Dict[str, np.ndarray],
+                      bar_times: np.ndarray, max_points: int) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    按aggregate_ohlc的分桶方式对齐指标序列
+
+    每个桶取桶内最后一根K线对应的指标值, 时间取桶的起始时间, 与合并后的K线对齐。
+    指标缺少某个桶最后一根K线的值时(预热期)跳过该桶。
+
+    Args:
+        times: 指标时间戳数组, 为bar_times的子集
+        series: 指标名 -> 指标值数组
+        bar_times: 合并前的K线时间戳数组
+        max_points: 与aggregate_ohlc相同的max_points
+
+    Returns:
+        (时间戳数组, 指标名 -> 指标值数组)
+    """
+    n = len(bar_times)
+    if n <= max_points:
+        return times, series
+
+    starts = bucket_starts(n, max_points)
+    last_times = bar_times[np.append(starts[1:], n) - 1]
+    positions = np.searchsorted(times, last_times)
+    found = positions < len(times)
+    found[found] = times[positions[found]] == last_times[found]
+    positions = positions[found]
+    return bar_times[starts][found], {key: values[positions] for key, values in series.items()}
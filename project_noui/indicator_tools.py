@@ -1,141 +1,286 @@
 #!/usr/bin/env python3
 """
 技术指标工具
-基于vnpy_ctastrategy的ArrayManager和BarData实现
+批量接口直接在numpy数组上调用talib; IndicatorCalculator逐根K线流式更新,
+每根新K线的计算量与历史长度无关, 结果与批量计算一致
 """
 
-from typing import List, Dict, Any
+import math
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple
 import pandas as pd
 import numpy as np
+import talib
 from datetime import datetime
 
-# 导入vnpy相关模块
-try:
-    from vnpy_ctastrategy import ArrayManager
-    from vnpy.trader.object import BarData
-    from vnpy.trader.constant import Interval, Exchange
-except ImportError as e:
-    print(f"导入vnpy模块失败: {e}")
-    print("请确保已安装vnpy_ctastrategy")
+
+# talib判断浮点数为零的阈值
+_TA_EPSILON = 1e-8
+
+
+class StreamingSMA:
+    """简单移动平均, 维护窗口内的滚动和, 与talib.SMA的累加方式一致"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._values = deque()
+        self._total = 0.0
+        self.value = None
+
+    def update(self, x: float) -> Optional[float]:
+        self._values.append(x)
+        self._total += x
+        if len(self._values) < self.window:
+            return None
+        total = self._total
+        self._total -= self._values.popleft()
+        self.value = total / self.window
+        return self.value
+
+
+class StreamingEMA:
+    """指数移动平均, 前window个值的简单平均作为初值, 与talib.EMA一致"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._k = 2.0 / (window + 1)
+        self._count = 0
+        self._total = 0.0
+        self.value = None
+
+    def update(self, x: float) -> Optional[float]:
+        self._count += 1
+        if self._count < self.window:
+            self._total += x
+            return None
+        if self._count == self.window:
+            self.value = (self._total + x) / self.window
+        else:
+            self.value = (x - self.value) * self._k + self.value
+        return self.value
+
+
+class StreamingRSI:
+    """RSI, 前window个涨跌幅的平均值作为初值, 之后按Wilder方法平滑, 与talib.RSI一致"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._prev_close = None
+        self._count = 0
+        self._gain = 0.0
+        self._loss = 0.0
+        self.value = None
+
+    def update(self, x: float) -> Optional[float]:
+        prev_close, self._prev_close = self._prev_close, x
+        if prev_close is None:
+            return None
+
+        change = x - prev_close
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+        self._count += 1
+        if self._count < self.window:
+            self._gain += gain
+            self._loss += loss
+            return None
+        if self._count == self.window:
+            self._gain = (self._gain + gain) / self.window
+            self._loss = (self._loss + loss) / self.window
+        else:
+            self._gain = (self._gain * (self.window - 1) + gain) / self.window
+            self._loss = (self._loss * (self.window - 1) + loss) / self.window
+
+        total = self._gain + self._loss
+        self.value = 100.0 * (self._gain / total) if abs(total) > _TA_EPSILON else 0.0
+        return self.value
+
+
+class StreamingMACD:
+    """MACD, 快慢EMA之差为macd线, 慢线有效后对macd线求EMA得到信号线, 与批量计算一致"""
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self._fast = StreamingEMA(fast)
+        self._slow = StreamingEMA(slow)
+        self._signal = StreamingEMA(signal)
+        self.value = None
+
+    def update(self, x: float) -> Optional[Dict[str, float]]:
+        fast = self._fast.update(x)
+        slow = self._slow.update(x)
+        if fast is None or slow is None:
+            return None
+        macd = fast - slow
+        signal = self._signal.update(macd)
+        if signal is None:
+            return None
+        self.value = {'macd': macd, 'signal': signal, 'histogram': macd - signal}
+        return self.value
+
+
+class StreamingBoll:
+    """布林带, 维护窗口内的和与平方和, 标准差算法与talib.STDDEV一致"""
+
+    def __init__(self, window: int = 20, dev: float = 2.0):
+        self.window = window
+        self.dev = dev
+        self._values = deque()
+        self._total = 0.0
+        self._total2 = 0.0
+        self.value = None
+
+    def update(self, x: float) -> Optional[Dict[str, float]]:
+        self._values.append(x)
+        self._total += x
+        self._total2 += x * x
+        if len(self._values) < self.window:
+            return None
+
+        mean = self._total / self.window
+        variance = self._total2 / self.window - mean * mean
+        old = self._values.popleft()
+        self._total -= old
+        self._total2 -= old * old
+
+        std = math.sqrt(variance) if variance > _TA_EPSILON else 0.0
+        self.value = {'upper': mean + self.dev * std, 'middle': mean, 'lower': mean - self.dev * std}
+        return self.value
+
+
+# 支持流式更新的指标
+STREAMING_INDICATORS = {
+    'ma': StreamingSMA,
+    'ema': StreamingEMA,
+    'rsi': StreamingRSI,
+    'macd': StreamingMACD,
+    'boll': StreamingBoll,
+}
+
+
+def new_streaming_indicator(spec: 'IndicatorSpec'):
+    """
+    创建指标的流式状态, update()返回值与批量计算一致
+
+    Raises:
+        ValueError: 该指标不支持流式更新
+    """
+    if spec.name not in STREAMING_INDICATORS:
+        raise ValueError(f'{spec.name}不支持流式计算')
+    return STREAMING_INDICATORS[spec.name](*spec.params)
+
 
 class IndicatorCalculator:
     """
     技术指标计算器
-    基于ArrayManager实现各种技术指标
+    逐根K线流式更新SMA、EMA、RSI、MACD和布林带, 每根K线的计算量与历史长度无关。
+
+    某组参数的指标第一次被读取时用已有的收盘价重放一次建立状态,
+    之后每根新K线只更新状态; 数据不足以计算指标时返回None。
     """
-    
+
     def __init__(self):
         """初始化指标计算器"""
-        self.am = ArrayManager(100)  # 足够大的窗口来支持所有指标
         self.bars_data = []
-        
-    def add_bar(self, bar: BarData) -> None:
+        self._closes = []
+        self._states = {}
+
+    def add_bar(self, bar) -> None:
         """
         添加K线数据
-        
+
         Args:
-            bar: BarData对象
+            bar: BarData对象, 或具有datetime和OHLCV属性的对象
         """
-        self.am.update_bar(bar)
-        self.bars_data.append({
-            'time': int(bar.datetime.timestamp()),
-            'open': bar.open_price,
-            'high': bar.high_price,
-            'low': bar.low_price,
-            'close': bar.close_price,
-            'volume': bar.volume,
-            'datetime': bar.datetime
-        })
-    
+        self._append(bar.datetime, bar.open_price, bar.high_price, bar.low_price, bar.close_price, bar.volume)
+
     def add_bars_from_dataframe(self, df: pd.DataFrame) -> None:
         """
         从DataFrame添加K线数据
-        
+
         Args:
             df: 包含OHLCV数据的DataFrame
-        """            
-        for _, row in df.iterrows():
-            # 创建BarData对象
-            bar = BarData(
-                symbol="",
-                exchange=Exchange.LOCAL,  # 使用LOCAL交易所
-                datetime=row['datetime'] if 'datetime' in row else pd.to_datetime(row['date']),
-                interval=Interval.DAILY,
-                volume=row['volume'],
-                open_price=row['open'],
-                high_price=row['high'],
-                low_price=row['low'],
-                close_price=row['close'],
-                gateway_name=""
-            )
-            self.add_bar(bar)
-    
-    def get_ma_data(self, window: int) -> List[Dict[str, Any]]:
         """
-        获取移动平均线数据
-        
+        dates = df['datetime'] if 'datetime' in df.columns else pd.to_datetime(df['date'])
+        for dt, open_price, high, low, close, volume in zip(
+                dates, df['open'], df['high'], df['low'], df['close'], df['volume']):
+            self._append(dt, open_price, high, low, close, volume)
+
+    def _append(self, dt: datetime, open_price: float, high: float, low: float,
+                close: float, volume: float) -> None:
+        close = float(close)
+        self.bars_data.append({
+            'time': int(dt.timestamp()),
+            'open': open_price,
+            'high': high,
+            'low': low,
+            'close': close,
+            'volume': volume,
+            'datetime': dt
+        })
+        self._closes.append(close)
+        for state in self._states.values():
+            state.update(close)
+
+    def _state(self, key: Tuple, factory):
+        """获取指标状态, 第一次使用时用已有收盘价重放建立"""
+        state = self._states.get(key)
+        if state is None:
+            state = factory()
+            for close in self._closes:
+                state.update(close)
+            self._states[key] = state
+        return state
+
+    def get_ma_data(self, window: int) -> Optional[float]:
+        """
+        获取最新的移动平均值
+
         Args:
             window: 移动平均窗口
-            
+
         Returns:
-            包含时间和MA值的列表
+            最新K线的MA值, 数据不足时返回None
         """
-        if not self.am.inited:
-            return []
-        
-        ma_value = self.am.sma(window)
-        
-        return ma_value
-    
-    def get_rsi_data(self, window: int = 14) -> List[Dict[str, Any]]:
+        return self._state(('ma', window), lambda: StreamingSMA(window)).value
+
+    def get_ema_data(self, window: int) -> Optional[float]:
+        """获取最新的指数移动平均值, 数据不足时返回None"""
+        return self._state(('ema', window), lambda: StreamingEMA(window)).value
+
+    def get_rsi_data(self, window: int = 14) -> Optional[float]:
         """
-        获取RSI数据
-        
+        获取最新的RSI值
+
         Args:
             window: RSI计算窗口，默认14
-            
+
         Returns:
-            包含时间和RSI值的列表
+            最新K线的RSI值, 数据不足时返回None
         """
-        if not self.am.inited:
-            return []
-        
-        rsi_value = self.am.rsi(window)        
-        return rsi_value
-            
-    def get_macd_data(self, fast_window: int = 12, slow_window: int = 26, signal_window: int = 9) -> Dict[str, List[Dict[str, Any]]]:
+        return self._state(('rsi', window), lambda: StreamingRSI(window)).value
+
+    def get_macd_data(self, fast_window: int = 12, slow_window: int = 26, signal_window: int = 9) -> Dict[str, List[float]]:
         """
         获取MACD数据
-        
+
         Args:
             fast_window: 快线窗口，默认12
             slow_window: 慢线窗口，默认26
             signal_window: 信号线窗口，默认9
-            
+
         Returns:
-            包含MACD、信号线和柱状图的字典
+            包含MACD、信号线和柱状图最新值的字典, 数据不足时各列表为空
         """
-        if not self.am.inited:
-            return {
-                'macd': [],
-                'signal': [],
-                'histogram': []
-            }
-        
-        macd_line, signal_line, histogram = self.am.macd(fast_window, slow_window, signal_window)
-        
-        result = {
-            'macd': [],
-            'signal': [],
-            'histogram': []
-        }
-        
-        result['macd'].append(macd_line)
-        result['signal'].append(signal_line)
-        result['histogram'].append(histogram)
-        
-        return result
-    
+        value = self._state(('macd', fast_window, slow_window, signal_window),
+                            lambda: StreamingMACD(fast_window, slow_window, signal_window)).value
+        if value is None:
+            return {'macd': [], 'signal': [], 'histogram': []}
+        return {key: [v] for key, v in value.items()}
+
+    def get_boll_data(self, window: int = 20, dev: float = 2.0) -> Optional[Dict[str, float]]:
+        """获取最新的布林带上轨、中轨和下轨, 数据不足时返回None"""
+        return self._state(('boll', window, dev), lambda: StreamingBoll(window, dev)).value
+
     def _calculate_ema(self, data: np.ndarray, window: int) -> np.ndarray:
         """
         计算指数移动平均线
@@ -158,87 +303,369 @@ class IndicatorCalculator:
         
     def clear_data(self) -> None:
         """清除所有数据"""
-        self.am = ArrayManager(100)
         self.bars_data = []
+        self._closes = []
+        self._states = {}
+
+
+# 与原ArrayManager(100)实现保持一致: 前100根K线作为预热期, 不输出指标
+INDICATOR_WARMUP_BARS = 100
+
+
+def _to_series(times: np.ndarray, values: np.ndarray) -> List[Dict[str, Any]]:
+    """将时间数组和指标数组组装为[{'time': ..., 'value': ...}]格式"""
+    return [{'time': t, 'value': v} for t, v in zip(times.tolist(), values.tolist())]
+
+
+INDICATOR_KEYS = ['ma5', 'ma10', 'ma20', 'ma60', 'rsi', 'macd', 'signal', 'histogram']
+
+
+def calculate_indicator_arrays(times: np.ndarray, close: np.ndarray,
+                               start_time: Optional[float] = None,
+                               end_time: Optional[float] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    向量化计算全序列技术指标
+
+    直接在numpy数组上一次性调用talib, 不再逐根K线构造BarData和ArrayManager。
+    SMA结果与逐根计算完全一致; RSI和MACD使用全序列平滑, 与100根窗口计算
+    的结果仅在平滑初值的残余影响上有微小差异。
+
+    Args:
+        times: 时间戳数组(秒)
+        close: 收盘价数组
+        start_time: 只输出time >= start_time的数据, None表示不限制
+        end_time: 只输出time < end_time的数据, None表示不限制
+
+    Returns:
+        (输出时间戳数组, 指标名 -> 指标值数组)
+    """
+    times = np.asarray(times, dtype=np.int64)
+    close = np.asarray(close, dtype=np.float64)
+
+    if len(close) <= INDICATOR_WARMUP_BARS:
+        return times[:0], {key: close[:0] for key in INDICATOR_KEYS}
+
+    macd_line, signal_line, histogram = talib.MACD(close, 12, 26, 9)
+    series = {
+        'ma5': talib.SMA(close, 5),
+        'ma10': talib.SMA(close, 10),
+        'ma20': talib.SMA(close, 20),
+        'ma60': talib.SMA(close, 60),
+        'rsi': talib.RSI(close, 14),
+        'macd': macd_line,
+        'signal': signal_line,
+        'histogram': histogram
+    }
+
+    # times有序, 用二分查找确定输出区间
+    begin = INDICATOR_WARMUP_BARS
+    end = len(times)
+    if start_time is not None:
+        begin = max(begin, int(np.searchsorted(times, start_time, side='left')))
+    if end_time is not None:
+        end = int(np.searchsorted(times, end_time, side='left'))
+
+    return times[begin:end], {key: values[begin:end] for key, values in series.items()}
+
+
+# 参数化指标: 名称 -> (默认参数, 输出分量); 单输出指标的分量为None
+INDICATOR_DEFS = {
+    'ma': ((20,), None),
+    'ema': ((20,), None),
+    'rsi': ((14,), None),
+    'atr': ((14,), None),
+    'macd': ((12, 26, 9), ('macd', 'signal', 'histogram')),
+    'boll': ((20, 2), ('upper', 'middle', 'lower')),
+}
+
+# 旧版指标名 -> (指标规格, 只返回的分量)
+LEGACY_INDICATORS = {
+    'ma5': ('ma:5', None),
+    'ma10': ('ma:10', None),
+    'ma20': ('ma:20', None),
+    'ma60': ('ma:60', None),
+    'rsi': ('rsi:14', None),
+    'macd': ('macd:12,26,9', None),
+    'signal': ('macd:12,26,9', 'signal'),
+    'histogram': ('macd:12,26,9', 'histogram'),
+}
+
+LEGACY_GROUPS = {
+    'all_ma': ['ma5', 'ma10', 'ma20', 'ma60'],
+}
+
+# EMA类指标平滑初值的残余影响按exp(-STABLE_PERIODS)估计, 预热K线数按此放大
+STABLE_PERIODS = 6
+
+# 指标算法版本, 修改某个指标的算法或预热规则时递增, 物化的指标数据随之重建
+INDICATOR_VERSIONS = {
+    'ma': 1,
+    'ema': 1,
+    'rsi': 1,
+    'atr': 1,
+    'macd': 1,
+    'boll': 1,
+}
+
+
+class IndicatorSpec:
+    """
+    一个参数化指标, 如ma:30、macd:8,21,5、boll:20,2
+
+    key为输出字段名: 旧版指标名保持原样(ma5、rsi), 其余为请求中的写法
+    """
+
+    def __init__(self, name: str, params: Tuple[float, ...], key: str, component: Optional[str] = None):
+        self.name = name
+        self.params = params
+        self.key = key
+        self.component = component
+        self.legacy = False
+
+    @property
+    def components(self) -> Optional[Tuple[str, ...]]:
+        """输出的分量, 单输出指标为None"""
+        if self.component:
+            return (self.component,)
+        return INDICATOR_DEFS[self.name][1]
+
+    @property
+    def warmup_bars(self) -> int:
+        """输出第一个稳定值之前需要的K线数"""
+        if self.name in ('ma', 'boll'):
+            return int(self.params[0]) - 1
+        if self.name == 'ema':
+            return int(self.params[0]) - 1 + STABLE_PERIODS * (int(self.params[0]) + 1) // 2
+        if self.name in ('rsi', 'atr'):
+            return int(self.params[0]) * (1 + STABLE_PERIODS)
+        fast, slow, signal = (int(p) for p in self.params)
+        return slow + signal - 2 + STABLE_PERIODS * (slow + signal + 2) // 2
+
+    @property
+    def first_output_bar(self) -> int:
+        """第一个输出值的K线序号: 旧版指标名与calculate_indicator_arrays一致, 固定从第100根开始"""
+        return INDICATOR_WARMUP_BARS if self.legacy else self.warmup_bars
+
+    @property
+    def canonical(self) -> str:
+        """规范写法, 如ma:5、macd:12,26,9, 旧版名称和不同写法的同一指标相同"""
+        return f"{self.name}:{','.join(format(p, 'g') for p in self.params)}"
+
+    @property
+    def version(self) -> str:
+        """指标定义版本, 规范写法或算法版本变化时物化数据需要重建"""
+        return f"{self.canonical}#v{INDICATOR_VERSIONS[self.name]}"
+
+
+def _parse_one(text: str) -> IndicatorSpec:
+    """解析单个指标规格"""
+    if text in LEGACY_INDICATORS:
+        spec_text, component = LEGACY_INDICATORS[text]
+        spec = _parse_one(spec_text)
+        spec.key = text
+        spec.component = component
+        spec.legacy = True
+        return spec
+
+    name, _, param_text = text.partition(':')
+    if name not in INDICATOR_DEFS:
+        raise ValueError(f'不支持的指标类型: {text}')
+    defaults = INDICATOR_DEFS[name][0]
+    try:
+        params = tuple(float(p) for p in param_text.split(',')) if param_text else defaults
+    except ValueError:
+        raise ValueError(f'指标参数错误: {text}')
+    if len(params) != len(defaults):
+        raise ValueError(f'{name}需要{len(defaults)}个参数: {text}')
+
+    # 除布林带倍数外都是正整数窗口
+    windows = params[:1] if name == 'boll' else params
+    if any(p < 1 or p != int(p) for p in windows):
+        raise ValueError(f'指标窗口必须为正整数: {text}')
+    if name == 'macd' and params[0] >= params[1]:
+        raise ValueError(f'MACD快线窗口必须小于慢线窗口: {text}')
+    params = tuple(int(p) if i < len(windows) else p for i, p in enumerate(params))
+    return IndicatorSpec(name, params, text)
+
+
+def parse_indicator_spec(text: str) -> List[IndicatorSpec]:
+    """
+    解析指标请求, 多个指标用分号分隔
+
+    Examples:
+        'ma:30'                  30日均线
+        'rsi:6;macd:8,21,5'      RSI(6)和MACD(8,21,5)
+        'boll:20,2'              布林带
+        'all_ma'、'ma5'、'macd'   旧版指标名
+
+    Raises:
+        ValueError: 指标名称或参数不正确
+    """
+    specs = []
+    for part in text.split(';'):
+        part = part.strip().lower()
+        if not part:
+            continue
+        for item in LEGACY_GROUPS.get(part, [part]):
+            specs.append(_parse_one(item))
+    if not specs:
+        raise ValueError('缺少指标类型')
+    return specs
+
+
+def indicator_warmup_bars(specs: List[IndicatorSpec]) -> int:
+    """一组指标需要的预热K线数, 同时满足稳定值和第一个输出值的位置"""
+    return max(max(spec.warmup_bars, spec.first_output_bar) for spec in specs)
+
+
+class _SeriesCache:
+    """一次计算内共享的中间结果, 如多个指标共用的均线和EMA"""
+
+    def __init__(self, high: np.ndarray, low: np.ndarray, close: np.ndarray):
+        self.high = high
+        self.low = low
+        self.close = close
+        self._cache = {}
+
+    def _get(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def sma(self, window: int) -> np.ndarray:
+        return self._get(('sma', window), lambda: talib.SMA(self.close, window))
+
+    def ema(self, window: int) -> np.ndarray:
+        return self._get(('ema', window), lambda: talib.EMA(self.close, window))
+
+    def macd(self, fast: int, slow: int, signal: int) -> Dict[str, np.ndarray]:
+        def compute():
+            macd_line = self.ema(fast) - self.ema(slow)
+            signal_line = np.full_like(macd_line, np.nan)
+            valid = slow - 1
+            if len(macd_line) > valid:
+                signal_line[valid:] = talib.EMA(macd_line[valid:], signal)
+            return {'macd': macd_line, 'signal': signal_line, 'histogram': macd_line - signal_line}
+        return self._get(('macd', fast, slow, signal), compute)
+
+    def compute(self, spec: IndicatorSpec):
+        """计算指标, 单输出指标返回数组, 多输出指标返回分量字典"""
+        if spec.name == 'ma':
+            return self.sma(spec.params[0])
+        if spec.name == 'ema':
+            return self.ema(spec.params[0])
+        if spec.name == 'rsi':
+            return self._get(('rsi',) + spec.params, lambda: talib.RSI(self.close, spec.params[0]))
+        if spec.name == 'atr':
+            return self._get(('atr',) + spec.params,
+                             lambda: talib.ATR(self.high, self.low, self.close, spec.params[0]))
+        if spec.name == 'macd':
+            return self.macd(*spec.params)
+
+        window, dev = spec.params
+        middle = self.sma(window)
+        std = self._get(('std', window), lambda: talib.STDDEV(self.close, window, 1))
+        return {'upper': middle + dev * std, 'middle': middle, 'lower': middle - dev * std}
+
+
+def compute_indicator_series(times: np.ndarray, close: np.ndarray, specs: List[IndicatorSpec],
+                             high: Optional[np.ndarray] = None, low: Optional[np.ndarray] = None,
+                             start_time: Optional[float] = None,
+                             end_time: Optional[float] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray], Optional[str]]:
+    """
+    只计算请求的指标, 共用的均线/EMA只计算一次
+
+    数据开头不足预热K线数的部分不输出; 旧版指标名固定跳过前100根, 与calculate_indicator_arrays一致。
+
+    Args:
+        times: 时间戳数组(秒)
+        close: 收盘价数组
+        specs: parse_indicator_spec的结果
+        high: 最高价数组, ATR需要
+        low: 最低价数组, ATR需要
+        start_time: 只输出time >= start_time的数据, None表示不限制
+        end_time: 只输出time < end_time的数据, None表示不限制
+
+    Returns:
+        (输出时间戳数组, 输出字段名 -> 指标值数组, 只有一个输出序列时的字段名或None)
+    """
+    times = np.asarray(times, dtype=np.int64)
+    close = np.asarray(close, dtype=np.float64)
+    high = close if high is None else np.asarray(high, dtype=np.float64)
+    low = close if low is None else np.asarray(low, dtype=np.float64)
+
+    cache = _SeriesCache(high, low, close)
+    series = assemble_series(specs, [cache.compute(spec) for spec in specs])
+
+    begin = max(spec.first_output_bar for spec in specs)
+    end = len(times)
+    if start_time is not None:
+        begin = max(begin, int(np.searchsorted(times, start_time, side='left')))
+    if end_time is not None:
+        end = int(np.searchsorted(times, end_time, side='left'))
+    begin = min(begin, end)
+
+    single = next(iter(series)) if len(series) == 1 else None
+    return times[begin:end], {key: values[begin:end] for key, values in series.items()}, single
+
+
+def assemble_series(specs: List[IndicatorSpec], values: List[Any]) -> Dict[str, np.ndarray]:
+    """
+    按请求的指标组装输出字段
+
+    单个多输出指标沿用旧版格式{'macd': ..., 'signal': ..., 'histogram': ...},
+    多个指标时多输出指标的字段名为'规格.分量'
+
+    Args:
+        specs: parse_indicator_spec的结果
+        values: 与specs对应的计算结果, 单输出指标为数组, 多输出指标为分量字典
+    """
+    series = {}
+    for spec, value in zip(specs, values):
+        components = spec.components
+        if components is None:
+            series[spec.key] = value
+        elif len(specs) == 1:
+            for component in components:
+                series[component] = value[component]
+        else:
+            for component in components:
+                series[f'{spec.key}.{component}'] = value[component]
+    return series
+
+
+def calculate_indicators(times: np.ndarray, close: np.ndarray,
+                         start_time: Optional[float] = None,
+                         end_time: Optional[float] = None) -> Dict[str, Any]:
+    """
+    向量化计算全序列技术指标, 返回[{'time': ..., 'value': ...}]格式
+
+    Args:
+        times: 时间戳数组(秒)
+        close: 收盘价数组
+        start_time: 只输出time >= start_time的数据, None表示不限制
+        end_time: 只输出time < end_time的数据, None表示不限制
+
+    Returns:
+        包含所有指标的字典, 格式与calculate_indicators_from_bars相同
+    """
+    out_times, series = calculate_indicator_arrays(times, close, start_time, end_time)
+    return {key: _to_series(out_times, values) for key, values in series.items()}
 
 
 def calculate_indicators_from_bars(bars_data: List[Dict[str, Any]]) -> Dict[str, Any]:
     """
     从K线数据计算技术指标
-    
+
     Args:
         bars_data: K线数据列表，格式为[{'time': timestamp, 'open': float, 'high': float, 'low': float, 'close': float, 'volume': int}, ...]
-        
+
     Returns:
         包含所有指标的字典
     """
-
-    result = {
-            'ma5': [],
-            'ma10': [],
-            'ma20': [],
-            'ma60': [],
-            'rsi': [],
-            'macd': [],
-            'signal': [],
-            'histogram': []
-        }
-    calculator = IndicatorCalculator()
-    
-    # 将数据转换为BarData对象
-    for i in range(len(bars_data)):
-        bar_data = bars_data[i]
-        bar = BarData(
-            symbol="",
-            exchange=Exchange.LOCAL,  # 使用LOCAL交易所
-            datetime=datetime.fromtimestamp(bar_data['time']),
-            interval=Interval.DAILY,
-            volume=bar_data.get('volume', 0),
-            open_price=bar_data['open'],
-            high_price=bar_data['high'],
-            low_price=bar_data['low'],
-            close_price=bar_data['close'],
-            gateway_name=""
-        )
-        calculator.add_bar(bar)
-
-        if i >= 100:
-            result['ma5'].append({
-                'time': bar_data['time'],
-                'value': calculator.get_ma_data(5)
-            })
-            result['ma10'].append({
-                'time': bar_data['time'],
-                'value': calculator.get_ma_data(10) 
-            })
-            result['ma20'].append({
-                'time': bar_data['time'],
-                'value': calculator.get_ma_data(20)
-            })
-            result['ma60'].append({
-                'time': bar_data['time'],
-                'value': calculator.get_ma_data(60)
-            })
-            result['rsi'].append({
-                'time': bar_data['time'],
-                'value': calculator.get_rsi_data(14)
-            })
-
-            macd_dict = calculator.get_macd_data()
-            result['macd'].append({
-                'time': bar_data['time'],
-                'value': macd_dict['macd']
-            })
-            result['signal'].append({
-                'time': bar_data['time'],
-                'value': macd_dict['signal']
-            })
-            result['histogram'].append({
-                'time': bar_data['time'],
-                'value': macd_dict['histogram']
-            })
-
-    return result
+    times = np.fromiter((bar['time'] for bar in bars_data), dtype=np.int64, count=len(bars_data))
+    close = np.fromiter((bar['close'] for bar in bars_data), dtype=np.float64, count=len(bars_data))
+    return calculate_indicators(times, close)
 
 
 # 示例使用
@@ -272,4 +699,4 @@ if __name__ == "__main__":
     print(f"MA20: {len(indicators['ma20'])} 条数据")
     print(f"MA60: {len(indicators['ma60'])} 条数据")
     print(f"RSI: {len(indicators['rsi'])} 条数据")
-    print(f"MACD: {len(indicators['macd']['macd'])} 条数据") 
\ No newline at end of file
+    print(f"MACD: {len(indicators['macd'])} 条数据") 
\ No newline at end of file
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+项目运行任务队列
+在独立的进程池中异步运行项目回测, 提供进度查询和取消功能,
+避免长时间回测阻塞Flask工作线程
+
+多进程部署时每个服务进程各有一个任务管理器, 任务状态写入共享目录,
+任何进程都能查询和取消其他进程提交的任务。
+
+运行过程中的进度、中间结果和结束状态按顺序编号记录为任务事件,
+供前端通过SSE实时订阅; 事件同时追加到共享目录中的<job_id>.events文件。
+"""
+
+import importlib.util
+import inspect
+import json
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from backtest_pool import set_default_max_workers
+
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_FINISHED = 'finished'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+FINAL_STATES = (JOB_FINISHED, JOB_FAILED, JOB_CANCELLED)
+
+# 已结束任务的状态文件保留时间(秒)
+JOB_STATE_TTL = 24 * 3600
+
+# 任务事件类型
+EVENT_PROGRESS = 'progress'  # 状态和进度
+EVENT_PARTIAL = 'partial'    # 中间结果: 新确定的资金曲线、回撤和新成交
+EVENT_END = 'end'            # 任务结束, 数据为最终的任务状态
+
+# 读取其他进程任务事件文件的轮询间隔(秒)
+EVENT_POLL_INTERVAL = 0.5
+
+
+class JobCancelled(Exception):
+    """任务被取消"""
+    pass
+
+
+class QueueFull(Exception):
+    """排队任务数已达上限"""
+    pass
+
+
+class Job:
+    """一次项目运行任务"""
+
+    def __init__(self, project_name: str, start_date: str, end_date: str):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.project_name = project_name
+        self.start_date = start_date
+        self.end_date = end_date
+        self.status = JOB_QUEUED
+        self.progress = 0.0
+        self.message = ''
+        self.error = None
+        self.submit_time = time.time()
+        self.start_time = None
+        self.end_time = None
+
+        self.future = None
+        self.cancel_event = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Job':
+        """由状态文件还原任务, 用于查询其他进程提交的任务"""
+        job = cls(data['project_name'], data['start_date'], data['end_date'])
+        for key, value in data.items():
+            setattr(job, key, value)
+        return job
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.job_id,
+            'project_name': self.project_name,
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'error': self.error,
+            'submit_time': self.submit_time,
+            'start_time': self.start_time,
+            'end_time': self.end_time
+        }
+
+
+def _load_project(source_file: str, class_name: str):
+    """在工作进程中根据源文件重新导入项目类并实例化"""
+    file = Path(source_file)
+    module_name = f"_job_{file.stem}_{file.stat().st_ino}"
+    spec = importlib.util.spec_from_file_location(module_name, file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, class_name)()
+
+
+def _run_project_job(job_id: str, source_file: str, class_name: str,
+                     start_date: str, end_date: str, events, cancel_event,
+                     cancel_file: Optional[str] = None) -> Dict[str, Any]:
+    """
+    工作进程入口: 运行项目并返回结果
+
+    进度和中间结果通过events队列发回主进程, 每次上报进度时检查取消标志;
+    cancel_file存在表示其他服务进程请求取消该任务
+    """
+    def is_cancelled() -> bool:
+        return cancel_event.is_set() or (cancel_file is not None and os.path.exists(cancel_file))
+
+    if is_cancelled():
+        raise JobCancelled()
+    events.put((job_id, EVENT_PROGRESS, {'status': JOB_RUNNING, 'progress': 0.0, 'message': '开始运行'}))
+
+    def progress_callback(done: int, total: int, message: str = '') -> None:
+        if is_cancelled():
+            raise JobCancelled()
+        events.put((job_id, EVENT_PROGRESS, {
+            'status': JOB_RUNNING,
+            'progress': done / total if total else 0.0,
+            'message': message
+        }))
+
+    def partial_callback(payload: Dict[str, Any]) -> None:
+        events.put((job_id, EVENT_PARTIAL, payload))
+
+    project = _load_project(source_file, class_name)
+    project.progress_callback = progress_callback
+    project.partial_callback = partial_callback
+    record_df, summary = project.run(start_date, end_date)
+
+    return {
+        'record_df': record_df,
+        'summary': summary,
+        'trades': project.trades
+    }
+
+
+class JobManager:
+    """
+    项目运行任务管理器
+
+    任务在max_workers个进程中并行运行, 超出的任务排队等待,
+    排队任务数超过max_queue时拒绝新任务。
+    """
+
+    def __init__(self, max_workers: int = None, max_queue: int = 16,
+                 on_finished: Callable[[Job, Dict[str, Any]], None] = None,
+                 state_dir: str = None):
+        """
+        初始化任务管理器
+
+        Args:
+            max_workers: 并行运行的进程数, 默认为CPU核数的一半
+            max_queue: 最多排队的任务数
+            on_finished: 任务成功完成后在主进程中调用的回调, 参数为(job, result)
+            state_dir: 任务状态共享目录, None表示只在本进程内可见
+        """
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) // 2)
+        # 每个任务内BacktestPool的默认进程数
+        self.backtest_workers = max(1, (os.cpu_count() or 1) // self.max_workers)
+        self.max_queue = max_queue
+        self.on_finished = on_finished
+        self.state_dir = Path(state_dir) if state_dir else None
+        if self.state_dir:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+
+        self.jobs: Dict[str, Job] = {}
+        # 本进程任务的事件记录, 事件序号为下标+1
+        self._event_logs: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._event_cond = threading.Condition(self._lock)
+        self._executor = None
+        self._manager = None
+        self._events = None
+        self._listener = None
+
+    def _ensure_started(self) -> None:
+        """首次提交任务时再启动进程池, 避免只提供行情接口时的启动开销"""
+        if self._executor is not None:
+            return
+
+        context = multiprocessing.get_context('spawn')
+        if self._manager is None:
+            self._manager = context.Manager()
+            self._events = self._manager.Queue()
+            self._listener = threading.Thread(target=self._listen_events, daemon=True)
+            self._listener.start()
+        # 工作进程异常退出后进程池不可用, 下次提交时重建;
+        # 任务内的回测进程池按任务进程数分摊CPU核数, 总进程数不超过CPU核数
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                             initializer=set_default_max_workers,
+                                             initargs=(self.backtest_workers,))
+
+    def _listen_events(self) -> None:
+        """接收工作进程上报的进度和中间结果"""
+        while True:
+            try:
+                job_id, event_type, data = self._events.get()
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                job = self.jobs.get(job_id)
+                if not job or job.status in FINAL_STATES:
+                    continue
+                if event_type == EVENT_PROGRESS:
+                    if job.status == JOB_QUEUED:
+                        job.start_time = time.time()
+                    job.status = data['status']
+                    job.progress = data['progress']
+                    job.message = data['message']
+                    self._save_state(job)
+                self._add_event(job_id, event_type, data)
+
+    def _add_event(self, job_id: str, event_type: str, data: Dict[str, Any]) -> None:
+        """记录任务事件并唤醒等待的订阅者, 调用方需持有锁"""
+        log = self._event_logs.setdefault(job_id, [])
+        event = {'id': len(log) + 1, 'type': event_type, 'data': data}
+        log.append(event)
+        if self.state_dir:
+            with open(self.state_dir / f'{job_id}.events', 'a', encoding='utf-8') as f:
+                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+        self._event_cond.notify_all()
+
+    def submit(self, project, start_date: str, end_date: str) -> Job:
+        """
+        提交项目运行任务
+
+        Args:
+            project: 已注册的项目对象
+            start_date: 开始日期 (YYYY-MM-DD)
+            end_date: 结束日期 (YYYY-MM-DD)
+
+        Returns:
+            新建的任务
+        """
+        with self._lock:
+            self._ensure_started()
+            pending = sum(1 for job in self.jobs.values() if job.status == JOB_QUEUED)
+            if pending >= self.max_queue:
+                raise QueueFull(f'排队任务已达上限 {self.max_queue}')
+
+            job = Job(project.name, start_date, end_date)
+            job.cancel_event = self._manager.Event()
+            job.future = self._executor.submit(
+                _run_project_job, job.job_id, inspect.getfile(type(project)), type(project).__name__,
+                start_date, end_date, self._events, job.cancel_event, self._cancel_file(job.job_id)
+            )
+            self.jobs[job.job_id] = job
+            self._save_state(job)
+            self._add_event(job.job_id, EVENT_PROGRESS, {
+                'status': job.status, 'progress': job.progress, 'message': job.message
+            })
+            self._prune_states()
+
+        job.future.add_done_callback(lambda future, job=job: self._on_done(job, future))
+        return job
+
+    def _on_done(self, job: Job, future) -> None:
+        """任务结束回调, 在进程池的管理线程中执行"""
+        try:
+            self._finish(job, future)
+        finally:
+            with self._lock:
+                self._save_state(job)
+                self._add_event(job.job_id, EVENT_END, job.to_dict())
+
+    def _finish(self, job: Job, future) -> None:
+        """根据future结果设置任务最终状态, 成功时调用on_finished"""
+        result = None
+        with self._lock:
+            job.end_time = time.time()
+            if future.cancelled():
+                job.status = JOB_CANCELLED
+                job.message = '任务已取消'
+                return
+
+            exc = future.exception()
+            if isinstance(exc, JobCancelled):
+                job.status = JOB_CANCELLED
+                job.message = '任务已取消'
+                return
+            if exc is not None:
+                job.status = JOB_FAILED
+                job.error = ''.join(traceback.format_exception_only(type(exc), exc)).strip()
+                if isinstance(exc, BrokenProcessPool):
+                    self._executor = None
+                return
+            result = future.result()
+
+        try:
+            if self.on_finished:
+                self.on_finished(job, result)
+        except Exception as e:
+            traceback.print_exc()
+            with self._lock:
+                job.status = JOB_FAILED
+                job.error = str(e)
+            return
+
+        with self._lock:
+            job.status = JOB_FINISHED
+            job.progress = 1.0
+            job.message = '运行完成'
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        取消任务: 排队中的任务直接移除, 运行中的任务在下一次上报进度时停止
+
+        其他服务进程提交的任务通过共享目录中的取消标记通知
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                job = self._load_state(job_id)
+                if job and job.status not in FINAL_STATES:
+                    Path(self._cancel_file(job_id)).touch()
+                    job.message = '正在取消'
+                return job
+            if job.status in FINAL_STATES:
+                return job
+            job.cancel_event.set()
+            job.message = '正在取消'
+            self._save_state(job)
+
+        # future.cancel()会同步触发done回调, 不能持有锁
+        job.future.cancel()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id) or self._load_state(job_id)
+
+    def get_events(self, job_id: str, after: int = 0, timeout: float = 0.0) -> Optional[List[Dict[str, Any]]]:
+        """
+        读取任务序号大于after的事件, 暂时没有新事件时最多等待timeout秒
+
+        本进程的任务从内存读取并在有新事件时立即返回,
+        其他进程的任务按EVENT_POLL_INTERVAL轮询共享目录中的事件文件
+
+        Args:
+            job_id: 任务ID
+            after: 已收到的最后一个事件序号
+            timeout: 最长等待时间(秒)
+
+        Returns:
+            事件列表, 每个事件包含id/type/data; 任务不存在时返回None
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._event_cond:
+                log = self._event_logs.get(job_id)
+                if log is not None:
+                    while len(log) <= after and time.monotonic() < deadline:
+                        self._event_cond.wait(deadline - time.monotonic())
+                    return log[after:]
+
+            log = self._read_events(job_id)
+            if log is None:
+                return None
+            remaining = deadline - time.monotonic()
+            if len(log) > after or remaining <= 0:
+                return log[after:]
+            time.sleep(min(EVENT_POLL_INTERVAL, remaining))
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = {job_id: job.to_dict() for job_id, job in self.jobs.items()}
+            if self.state_dir:
+                for path in self.state_dir.glob('*.json'):
+                    if path.stem not in jobs:
+                        job = self._load_state(path.stem)
+                        if job:
+                            jobs[path.stem] = job.to_dict()
+        return sorted(jobs.values(), key=lambda job: job['submit_time'])
+
+    def _cancel_file(self, job_id: str) -> Optional[str]:
+        if not self.state_dir:
+            return None
+        return str(self.state_dir / f'{job_id}.cancel')
+
+    def _save_state(self, job: Job) -> None:
+        """写入任务状态文件, 先写临时文件再替换, 调用方需持有锁"""
+        if not self.state_dir:
+            return
+        path = self.state_dir / f'{job.job_id}.json'
+        tmp_path = self.state_dir / f'.{job.job_id}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _load_state(self, job_id: str) -> Optional[Job]:
+        """读取其他进程提交的任务状态"""
+        if not self.state_dir:
+            return None
+        try:
+            with open(self.state_dir / f'{job_id}.json', encoding='utf-8') as f:
+                return Job.from_dict(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _read_events(self, job_id: str) -> Optional[List[Dict[str, Any]]]:
+        """读取其他进程任务的事件文件, 忽略正在写入的最后一行"""
+        if not self.state_dir:
+            return None
+        try:
+            with open(self.state_dir / f'{job_id}.events', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return [] if self._load_state(job_id) else None
+        return [json.loads(line) for line in lines if line.endswith('\n')]
+
+    def _prune_states(self) -> None:
+        """删除过期的已结束任务状态文件和事件记录, 调用方需持有锁"""
+        deadline = time.time() - JOB_STATE_TTL
+        for job_id, job in self.jobs.items():
+            if job.status in FINAL_STATES and (job.end_time or 0) < deadline:
+                self._event_logs.pop(job_id, None)
+        if not self.state_dir:
+            return
+        for path in self.state_dir.glob('*.json'):
+            job = self._load_state(path.stem)
+            if job and job.status in FINAL_STATES and (job.end_time or 0) < deadline:
+                path.unlink(missing_ok=True)
+                Path(self._cancel_file(path.stem)).unlink(missing_ok=True)
+                (self.state_dir / f'{path.stem}.events').unlink(missing_ok=True)
+
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+请求级性能指标
+按路由记录请求耗时、各阶段(数据库查询、DataFrame转换、指标计算、序列化)耗时、
+响应体积、错误数和并发请求数, 以Prometheus文本格式输出, 用于定位行情图表的延迟来源
+
+多进程部署时每个服务进程定期把自己的指标快照写入共享目录,
+输出时合并所有存活进程的快照, 无论哪个进程处理抓取请求结果都一致。
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import Flask, Response, g, has_request_context, request
+
+
+# 耗时直方图的分桶上界(秒)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 响应体积直方图的分桶上界(字节)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# 请求阶段
+PHASE_DB = 'db'
+PHASE_DATAFRAME = 'dataframe'
+PHASE_INDICATOR = 'indicator'
+PHASE_SERIALIZE = 'serialize'
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# 写入共享目录快照的最小间隔(秒)
+FLUSH_INTERVAL = 5.0
+
+PROMETHEUS_MIME = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Metric:
+    """一个指标及其各标签组合的取值"""
+
+    def __init__(self, name: str, kind: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = ()):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # 标签值 -> 计数器/仪表为数值, 直方图为[各桶计数..., 总和, 总数]
+        self.samples: Dict[Tuple[str, ...], object] = {}
+
+    def inc(self, label_values: Tuple[str, ...], amount: float = 1.0) -> None:
+        self.samples[label_values] = self.samples.get(label_values, 0.0) + amount
+
+    def observe(self, label_values: Tuple[str, ...], value: float) -> None:
+        sample = self.samples.get(label_values)
+        if sample is None:
+            sample = self.samples[label_values] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                sample[i] += 1
+        sample[-2] += value
+        sample[-1] += 1
+
+
+def _merge_sample(old, new):
+    """合并两个进程的同一样本, 计数器、仪表和直方图都按进程求和"""
+    if old is None:
+        return list(new) if isinstance(new, list) else new
+    if isinstance(new, list):
+        return [a + b for a, b in zip(old, new)]
+    return old + new
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = '') -> str:
+    parts = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _pid_alive(pid: int) -> bool:
+    """进程是否存活; Windows下os.kill会结束进程, 且只以单进程运行, 直接视为存活"""
+    if os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RequestMetrics:
+    """
+    API请求指标
+
+    init_app注册请求钩子, 自动记录每个路由的请求数、耗时、响应体积、错误数和并发请求数;
+    路由内用phase()记录各阶段耗时; add_collector注册抓取时读取的外部统计(如缓存命中)。
+    """
+
+    def __init__(self, snapshot_dir: str = None, flush_interval: float = FLUSH_INTERVAL):
+        """
+        初始化请求指标
+
+        Args:
+            snapshot_dir: 多进程共享的快照目录, None表示只输出本进程的指标
+            flush_interval: 写入快照的最小间隔(秒)
+        """
+        self.snapshot_dir = Path(snapshot_dir) if snapshot_dir else None
+        if self.snapshot_dir:
+            self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Dict[Tuple[str, Tuple[str, ...]], float]]] = []
+        self._lock = threading.Lock()
+        self._flushed_at = 0.0
+
+        self.requests = self.define('api_requests_total', COUNTER, 'API请求数',
+                                    ('route', 'method', 'status'))
+        self.errors = self.define('api_request_errors_total', COUNTER, 'API请求错误数(5xx或未处理异常)',
+                                  ('route',))
+        self.in_flight = self.define('api_requests_in_flight', GAUGE, '正在处理的API请求数')
+        self.latency = self.define('api_request_duration_seconds', HISTOGRAM, 'API请求耗时(秒)',
+                                   ('route', 'method'), LATENCY_BUCKETS)
+        self.phases = self.define('api_request_phase_seconds', HISTOGRAM, 'API请求各阶段耗时(秒)',
+                                  ('route', 'phase'), LATENCY_BUCKETS)
+        self.sizes = self.define('api_response_bytes', HISTOGRAM, 'API响应体积(字节)',
+                                 ('route',), SIZE_BUCKETS)
+
+    def define(self, name: str, kind: str, help_text: str, labels: Tuple[str, ...] = (),
+               buckets: Tuple[float, ...] = ()) -> _Metric:
+        """定义指标, 外部统计也需先定义再由collector提供取值"""
+        metric = _Metric(name, kind, help_text, tuple(labels), tuple(buckets))
+        self._metrics[name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], Dict[Tuple[str, Tuple[str, ...]], float]]) -> None:
+        """
+        注册抓取时调用的外部统计
+
+        Args:
+            collector: 返回{(指标名, 标签值): 数值}的函数, 指标需先用define定义
+        """
+        self._collectors.append(collector)
+
+    def init_app(self, app: Flask) -> None:
+        """注册请求钩子"""
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    @contextmanager
+    def phase(self, name: str):
+        """记录请求中一个阶段的耗时, 同一阶段多次进入时累加; 不在请求中时不记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if has_request_context() and hasattr(g, '_metrics_phases'):
+                phases = g._metrics_phases
+                phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+    @staticmethod
+    def _route() -> str:
+        return request.url_rule.rule if request.url_rule else 'unmatched'
+
+    def _before_request(self) -> None:
+        g._metrics_start = time.perf_counter()
+        g._metrics_phases = {}
+        with self._lock:
+            self.in_flight.inc((), 1)
+
+    def _after_request(self, response: Response) -> Response:
+        g._metrics_status = response.status_code
+        # 流式响应(如SSE)没有确定的长度, 不计入体积
+        if not response.is_streamed:
+            g._metrics_size = response.calculate_content_length()
+        return response
+
+    def _teardown_request(self, exc: Optional[BaseException]) -> None:
+        if not hasattr(g, '_metrics_start'):
+            return
+        elapsed = time.perf_counter() - g._metrics_start
+        route = self._route()
+        status = 500 if exc is not None else g.get('_metrics_status', 500)
+        size = g.get('_metrics_size')
+
+        with self._lock:
+            self.in_flight.inc((), -1)
+            self.requests.inc((route, request.method, str(status)))
+            if status >= 500:
+                self.errors.inc((route,))
+            self.latency.observe((route, request.method), elapsed)
+            for name, seconds in g._metrics_phases.items():
+                self.phases.observe((route, name), seconds)
+            if size is not None:
+                self.sizes.observe((route,), size)
+
+        if self.snapshot_dir and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def _snapshot(self) -> Dict[str, Dict[str, object]]:
+        """本进程的指标快照, 标签值编码为JSON字符串作为键"""
+        with self._lock:
+            snapshot = {
+                name: {json.dumps(labels): sample for labels, sample in metric.samples.items()}
+                for name, metric in self._metrics.items()
+            }
+        for collector in self._collectors:
+            try:
+                values = collector()
+            except Exception as e:
+                print(f"❌ 读取指标统计失败: {e}")
+                continue
+            for (name, labels), value in values.items():
+                key = json.dumps(list(labels))
+                samples = snapshot.setdefault(name, {})
+                samples[key] = _merge_sample(samples.get(key), value)
+        return snapshot
+
+    def flush(self) -> None:
+        """把本进程的指标快照写入共享目录, 先写临时文件再替换"""
+        if not self.snapshot_dir:
+            return
+        self._flushed_at = time.monotonic()
+        path = self.snapshot_dir / f'{os.getpid()}.json'
+        tmp_path = self.snapshot_dir / f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _merged_snapshot(self) -> Dict[str, Dict[str, object]]:
+        """合并所有存活服务进程的快照, 删除已退出进程的快照"""
+        if not self.snapshot_dir:
+            return self._snapshot()
+
+        self.flush()
+        merged: Dict[str, Dict[str, object]] = {}
+        for path in self.snapshot_dir.glob('*.json'):
+            try:
+                pid = int(path.stem)
+            except ValueError:
+                continue
+            if pid != os.getpid() and not _pid_alive(pid):
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                with open(path, encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            for name, samples in snapshot.items():
+                target = merged.setdefault(name, {})
+                for key, sample in samples.items():
+                    target[key] = _merge_sample(target.get(key), sample)
+        return merged
+
+    def render(self) -> str:
+        """以Prometheus文本格式输出全部指标"""
+        snapshot = self._merged_snapshot()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f'# HELP {name} {metric.help_text}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for key, sample in sorted(snapshot.get(name, {}).items()):
+                labels = json.loads(key)
+                if metric.kind != HISTOGRAM:
+                    lines.append(f'{name}{_format_labels(metric.labels, labels)} {_format_value(sample)}')
+                    continue
+                for bound, count in zip(metric.buckets + (float('inf'),), sample[:-2] + [sample[-1]]):
+                    le = 'le="' + _format_value(float(bound)) + '"'
+                    lines.append(f'{name}_bucket{_format_labels(metric.labels, labels, le)} {count}')
+                lines.append(f'{name}_sum{_format_labels(metric.labels, labels)} {_format_value(float(sample[-2]))}')
+                lines.append(f'{name}_count{_format_labels(metric.labels, labels)} {sample[-1]}')
+        return '\n'.join(lines) + '\n'
+
+    def response(self) -> Response:
+        return Response(self.render(), mimetype=PROMETHEUS_MIME)
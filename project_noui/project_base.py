@@ -8,8 +8,8 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
-import requests
 import json
+import time
 
 class ProjectBase:
     """基础项目管理类"""
@@ -40,6 +40,12 @@ class ProjectBase:
 
         self.custom_data = {}
         
+        # 运行进度回调 progress_callback(done, total, message), 由任务队列设置
+        self.progress_callback = None
+        # 中间结果回调 partial_callback(payload), 由任务队列设置, 用于实时推送
+        self.partial_callback = None
+        self._partial_pnl = None
+        
     def register(self, register_dict: Dict[str, 'ProjectBase']):
         """
         向注册表中注册项目
@@ -61,6 +67,86 @@ class ProjectBase:
         """
         pass
         
+    def report_progress(self, done: int, total: int, message: str = ''):
+        """
+        上报运行进度（子类在run中按阶段调用）
+        
+        Args:
+            done: 已完成的步数
+            total: 总步数
+            message: 进度说明
+        """
+        if self.progress_callback:
+            self.progress_callback(done, total, message)
+
+    def report_partial(self, daily_results: List[pd.DataFrame] = (), final_before: Optional[datetime] = None):
+        """
+        上报运行中的中间结果（子类在run中每完成一个阶段调用）
+
+        新完成的逐日结果先按日期累加net_pnl, 早于final_before的日期不会再被后续阶段修改,
+        这部分日期的资金曲线、回撤和上次上报之后新增的成交记录通过partial_callback推送。
+        资金曲线和回撤的算法与apply_run_result一致。
+
+        Args:
+            daily_results: 本阶段新完成的逐日结果, 包含net_pnl列, 以日期为索引
+            final_before: 早于该日期的结果已确定, None表示全部确定(运行结束)
+        """
+        if not self.partial_callback:
+            return
+        if self._partial_pnl is None:
+            self._partial_pnl = {}
+            self._partial_balance = self.initial_capital
+            self._partial_peak = None
+            self._partial_trades = 0
+
+        for df in daily_results:
+            if df is None or df.empty:
+                continue
+            for date, net_pnl in df['net_pnl'].items():
+                date = pd.Timestamp(date)
+                self._partial_pnl[date] = self._partial_pnl.get(date, 0.0) + float(net_pnl)
+
+        if final_before is not None:
+            final_before = pd.Timestamp(final_before)
+        dates = sorted(date for date in self._partial_pnl
+                       if final_before is None or date < final_before)
+        payload = {'time': [], 'daily_pnl': [], 'balance': [], 'drawdown': []}
+        for date in dates:
+            net_pnl = self._partial_pnl.pop(date)
+            self._partial_balance += net_pnl
+            if self._partial_peak is None or self._partial_balance > self._partial_peak:
+                self._partial_peak = self._partial_balance
+            payload['time'].append(int(time.mktime(date.timetuple())))
+            payload['daily_pnl'].append(net_pnl)
+            payload['balance'].append(self._partial_balance)
+            payload['drawdown'].append(self._partial_balance - self._partial_peak)
+        payload['trades'] = self.trades[self._partial_trades:]
+        self._partial_trades = len(self.trades)
+        if final_before is None:
+            self._partial_pnl = None
+
+        if payload['time'] or payload['trades']:
+            self.partial_callback(payload)
+        
+    def apply_run_result(self, record_df: pd.DataFrame, summary: Dict[str, Any]):
+        """
+        根据run返回的逐日结果和统计指标更新项目时序数据
+        
+        Args:
+            record_df: 逐日结果, 包含net_pnl和drawdown列
+            summary: 统计指标
+        """
+        date_list = record_df.index.tolist()
+        self.time = [int(time.mktime(date.timetuple())) for date in date_list]
+        self.end_balance = summary['end_balance'].item()
+        self.max_drawdown = summary['max_drawdown'].item()
+        self.max_drawdown_duration = summary['max_drawdown_duration'].item()
+        self.total_net_pnl = summary['total_net_pnl'].item()
+        self.sharpe_ratio = summary['sharpe_ratio'].item()
+        self.daily_pnl = record_df['net_pnl'].tolist()
+        self.balance = (record_df['net_pnl'].cumsum() + self.initial_capital).tolist()
+        self.drawdown = record_df['drawdown'].tolist()
+        
     def add_trade(self, symbol: str, direction: str, price: float, volume: float, 
                   timestamp: datetime, offset: str = "OPEN"):
         """
@@ -84,23 +170,43 @@ class ProjectBase:
         }
         self.trades.append(trade)
             
+    def get_tech_data(self) -> Dict[str, List[Any]]:
+        """
+        获取项目时序数据
+        """
+        return {
+            'time': self.time,
+            'daily_pnl': self.daily_pnl,
+            'balance': self.balance,
+            'drawdown': self.drawdown
+        }
+        
+    def publish_data(self):
+        """
+        发布项目时序数据
+        
+        与API服务器同进程时直接写入结果存储, 否则通过HTTP上传
+        """
+        if _local_result_store is None:
+            return self.upload_data()
+        
+        _local_result_store.publish(self.name, self.get_tech_data(), self.trades, self.get_summary())
+        print(f"✅ 项目 {self.name} 数据已发布: {len(self.time)} 天, {len(self.trades)} 笔交易")
+        return True
+            
     def upload_data(self):
         """
-        上传项目时序数据
+        通过HTTP上传项目时序数据（项目与API服务器不在同一进程时使用）
         """
         try:
             upload_data = {
                 'project_name': self.name,
-                'tech_data': {
-                    'time': self.time,
-                    'daily_pnl': self.daily_pnl,
-                    'balance': self.balance,
-                    'drawdown': self.drawdown
-                },
+                'tech_data': self.get_tech_data(),
                 'trade_data': self.trades
             }
             
-            print(f"upload_data: {upload_data}")
+            print(f"upload_data: {len(self.time)} 天, {len(self.trades)} 笔交易")
+            import requests
             response = requests.post(
                 f"{self.api_url}/update_strategy_data",
                 json=upload_data,
@@ -163,18 +269,49 @@ class ProjectBase:
 # 全局注册表
 PROJECT_REGISTER = {}
 
+# 同进程的结果存储, 由API服务器设置
+_local_result_store = None
+
+# 项目延迟加载器, 由API服务器设置
+_project_loader = None
+
+def set_local_result_store(store):
+    """设置同进程的结果存储, 设置后publish_data直接写入而不走HTTP"""
+    global _local_result_store
+    _local_result_store = store
+
+def set_project_loader(loader):
+    """设置项目延迟加载器, 设置后注册表中没有的项目由加载器在第一次使用时实例化"""
+    global _project_loader
+    _project_loader = loader
+
 def register_project(project: ProjectBase):
     """注册项目到全局注册表"""
     project.register(PROJECT_REGISTER)
 
+def unregister_project(name: str):
+    """从全局注册表移除项目"""
+    PROJECT_REGISTER.pop(name, None)
+
 def get_project(name: str) -> Optional[ProjectBase]:
-    """从注册表获取项目"""
-    return PROJECT_REGISTER.get(name)
+    """从注册表获取项目, 延迟加载的项目在第一次获取时导入并实例化"""
+    project = PROJECT_REGISTER.get(name)
+    if project is None and _project_loader is not None:
+        project = _project_loader.get(name)
+    return project
+
+def has_project(name: str) -> bool:
+    """项目是否存在, 不导入延迟加载的项目"""
+    return name in PROJECT_REGISTER or (_project_loader is not None and _project_loader.has(name))
 
 def list_projects() -> List[str]:
-    """列出所有注册的项目"""
-    return list(PROJECT_REGISTER.keys())
+    """列出所有注册的项目, 包括尚未加载的项目"""
+    names = list(PROJECT_REGISTER.keys())
+    if _project_loader is not None:
+        names += [name for name in _project_loader.names() if name not in PROJECT_REGISTER]
+    return names
 
 def get_all_projects() -> Dict[str, ProjectBase]:
-    """获取所有项目"""
-    return PROJECT_REGISTER.copy()
+    """获取所有项目, 会实例化全部延迟加载的项目"""
+    projects = {name: get_project(name) for name in list_projects()}
+    return {name: project for name, project in projects.items() if project is not None}
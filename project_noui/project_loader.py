@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+项目延迟加载
+扫描项目目录时只解析源码的语法树找出项目类和项目名称, 不执行模块,
+项目第一次被使用时才导入模块并实例化, 避免只提供行情接口时导入vnpy和回测引擎。
+
+重新扫描时按文件修改时间增量处理: 未修改的文件保留已实例化的项目,
+只有新增、修改和删除的文件会更新, 启动和重新加载的耗时不再随项目数量增长。
+
+项目类需要直接继承ProjectBase(或同一文件中的其他项目类), 项目名称取自
+__init__中name参数的默认值、super().__init__的第一个字符串参数或类属性name;
+无法静态确定名称的文件在扫描时直接导入。
+"""
+
+import ast
+import importlib.util
+import inspect
+import sys
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+BASE_CLASS_NAME = 'ProjectBase'
+
+
+class ProjectEntry:
+    """扫描得到的一个项目: 所在文件、类名和项目名称"""
+
+    def __init__(self, name: str, source_file: Path, class_name: str):
+        self.name = name
+        self.source_file = source_file
+        self.class_name = class_name
+
+
+def _base_names(node: ast.ClassDef) -> List[str]:
+    names = []
+    for base in node.bases:
+        if isinstance(base, ast.Name):
+            names.append(base.id)
+        elif isinstance(base, ast.Attribute):
+            names.append(base.attr)
+    return names
+
+
+def _string_constant(node: Optional[ast.AST]) -> Optional[str]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    return None
+
+
+def _static_project_name(node: ast.ClassDef) -> Optional[str]:
+    """从类定义中静态读取项目名称, 无法确定时返回None"""
+    for item in node.body:
+        if isinstance(item, ast.FunctionDef) and item.name == '__init__':
+            # def __init__(self, name: str = "xxx", ...)
+            args = item.args.args + item.args.kwonlyargs
+            defaults = [None] * (len(item.args.args) - len(item.args.defaults)) + item.args.defaults \
+                + item.args.kw_defaults
+            for arg, default in zip(args, defaults):
+                if arg.arg == 'name':
+                    return _string_constant(default)
+            # super().__init__("xxx")
+            for call in ast.walk(item):
+                if (isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute)
+                        and call.func.attr == '__init__' and call.args):
+                    return _string_constant(call.args[0])
+            return None
+
+    for item in node.body:
+        if isinstance(item, ast.Assign) and any(
+                isinstance(target, ast.Name) and target.id == 'name' for target in item.targets):
+            return _string_constant(item.value)
+    return None
+
+
+def discover_projects(source_file: Path) -> Tuple[List[ProjectEntry], bool]:
+    """
+    解析源文件中的项目类
+
+    Returns:
+        (项目列表, 是否存在无法静态确定名称的项目类)
+    """
+    tree = ast.parse(source_file.read_bytes(), filename=str(source_file))
+    classes = {node.name: node for node in tree.body if isinstance(node, ast.ClassDef)}
+
+    project_classes = {}
+    for name, node in classes.items():
+        bases = _base_names(node)
+        if BASE_CLASS_NAME in bases or any(base in project_classes for base in bases):
+            project_classes[name] = node
+
+    entries = []
+    unresolved = False
+    for class_name, node in project_classes.items():
+        project_name = _static_project_name(node)
+        # 没有定义__init__时沿用同一文件中父类的名称
+        parent = next((base for base in _base_names(node) if base in project_classes), None)
+        if project_name is None and parent and not any(
+                isinstance(item, ast.FunctionDef) and item.name == '__init__' for item in node.body):
+            project_name = _static_project_name(project_classes[parent])
+        if project_name is None:
+            unresolved = True
+            continue
+        entries.append(ProjectEntry(project_name, source_file, class_name))
+    return entries, unresolved
+
+
+class ProjectLoader:
+    """
+    项目目录的延迟加载器
+
+    scan()增量扫描目录, get()在项目第一次被使用时导入模块并实例化,
+    实例化的项目通过register回调加入注册表, 文件修改或删除时通过unregister回调移除。
+    """
+
+    def __init__(self, directory: str, register: Callable, unregister: Callable[[str], None],
+                 base_class: type = None, recursive: bool = True):
+        """
+        初始化加载器
+
+        Args:
+            directory: 项目目录
+            register: 注册项目对象的函数, 如register_project
+            unregister: 按名称移除已注册项目的函数
+            base_class: 项目基类, 导入后校验
+            recursive: 是否扫描子目录
+        """
+        self.directory = Path(directory).resolve()
+        self.register = register
+        self.unregister = unregister
+        self.base_class = base_class
+        self.recursive = recursive
+
+        # 文件 -> (修改时间, 文件大小, 项目名称列表)
+        self._files: Dict[Path, Tuple[int, int, List[str]]] = {}
+        self._entries: Dict[str, ProjectEntry] = {}
+        self._modules: Dict[Path, object] = {}
+        self._instances: Dict[str, object] = {}
+        self._lock = threading.RLock()
+
+    def scan(self) -> int:
+        """
+        增量扫描项目目录
+
+        Returns:
+            新增、修改或删除的文件数
+        """
+        pattern = "**/*.py" if self.recursive else "*.py"
+        with self._lock:
+            seen = set()
+            changed = 0
+            for file in sorted(self.directory.glob(pattern)):
+                if file.name.startswith("_"):
+                    continue
+                seen.add(file)
+                stat = file.stat()
+                state = self._files.get(file)
+                if state and state[:2] == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                changed += 1
+                self._forget(file)
+                self._files[file] = (stat.st_mtime_ns, stat.st_size, self._discover(file))
+
+            for file in list(self._files):
+                if file not in seen:
+                    changed += 1
+                    self._forget(file)
+            return changed
+
+    def _discover(self, file: Path) -> List[str]:
+        """解析文件并登记其中的项目, 返回项目名称"""
+        try:
+            entries, unresolved = discover_projects(file)
+        except (SyntaxError, ValueError, OSError) as e:
+            print(f"[WARN] 解析 {file} 失败: {e}")
+            return []
+
+        names = []
+        for entry in entries:
+            if entry.name in self._entries:
+                print(f"[WARN] 项目 {entry.name} 重复定义于 {file}, 跳过")
+                continue
+            self._entries[entry.name] = entry
+            names.append(entry.name)
+
+        if unresolved:
+            # 无法静态确定名称, 立即导入该文件的全部项目
+            names.extend(self._load_file(file))
+        return names
+
+    def _forget(self, file: Path) -> None:
+        """移除文件中的项目及已实例化的对象"""
+        _, _, names = self._files.pop(file, (None, None, []))
+        for name in names:
+            self._entries.pop(name, None)
+            if self._instances.pop(name, None) is not None:
+                self.unregister(name)
+        module = self._modules.pop(file, None)
+        if module is not None:
+            sys.modules.pop(module.__name__, None)
+
+    def _import(self, file: Path):
+        module = self._modules.get(file)
+        if module is not None:
+            return module
+
+        stat = file.stat()
+        module_name = f"_auto_{file.stem}_{stat.st_ino}_{stat.st_mtime_ns}"
+        spec = importlib.util.spec_from_file_location(module_name, file)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        if str(self.directory) not in sys.path:
+            sys.path.insert(0, str(self.directory))
+        try:
+            spec.loader.exec_module(module)
+        except Exception:
+            sys.modules.pop(module_name, None)
+            raise
+        self._modules[file] = module
+        return module
+
+    def _instantiate(self, cls) -> Optional[object]:
+        if self.base_class is not None and not issubclass(cls, self.base_class):
+            print(f"[WARN] {cls} 不是 {self.base_class} 的子类, 跳过")
+            return None
+        try:
+            project = cls()
+        except TypeError as e:
+            print(f"[WARN] 实例化 {cls} 失败: {e}")
+            return None
+        self.register(project)
+        self._instances[project.name] = project
+        return project
+
+    def _load_file(self, file: Path) -> List[str]:
+        """导入文件并实例化其中的全部项目类, 返回项目名称"""
+        try:
+            module = self._import(file)
+        except Exception as e:
+            print(f"[WARN] 加载 {file} 失败: {e}")
+            return []
+
+        names = []
+        for _, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            project = self._instantiate(cls)
+            if project is not None:
+                self._entries[project.name] = ProjectEntry(project.name, file, cls.__name__)
+                names.append(project.name)
+        return list(dict.fromkeys(names))
+
+    def names(self) -> List[str]:
+        """已发现的项目名称, 不导入项目"""
+        with self._lock:
+            return list(self._entries.keys())
+
+    def has(self, name: str) -> bool:
+        with self._lock:
+            return name in self._entries
+
+    def get(self, name: str) -> Optional[object]:
+        """
+        获取项目, 第一次使用时导入模块并实例化
+
+        Returns:
+            项目对象, 项目不存在或加载失败时返回None
+        """
+        with self._lock:
+            if name in self._instances:
+                return self._instances[name]
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+            try:
+                module = self._import(entry.source_file)
+            except Exception as e:
+                print(f"[WARN] 加载 {entry.source_file} 失败: {e}")
+                return None
+
+            cls = getattr(module, entry.class_name, None)
+            if cls is None:
+                print(f"[WARN] {entry.source_file} 中没有 {entry.class_name}")
+                return None
+            project = self._instantiate(cls)
+            if project is not None and project.name != name:
+                print(f"[WARN] {entry.class_name} 的项目名称为 {project.name}, 与静态解析的 {name} 不一致")
+                self.unregister(project.name)
+                self._instances.pop(project.name, None)
+                return None
+            return project
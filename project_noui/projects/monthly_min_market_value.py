@@ -4,10 +4,9 @@
 保持原有的vnpy engine框架实现
 """
 
-import mysql.connector
 import pandas as pd
 from collections import defaultdict
-from datetime import datetime
+from datetime import datetime, timedelta
 import sys
 import os
 
@@ -16,17 +15,48 @@ parent_dir = os.path.abspath(os.path.join(os.getcwd(), ".."))
 sys.path.append(parent_dir)
 
 from vnpy_ctastrategy.backtesting import BacktestingEngine
-from strategies.monthly_min_market_value_strategy import MonthlyMinMarketValueStrategy
+from strategies.monthly_min_market_value_strategy import MonthlyMinMarketValueStrategy, MonthlyMinMarketValueVectorStrategy
 from tools.common import sum_specified_keep_others
+from tools.db_pool import get_connection
+from tools.market_value_snapshot import SelectionCache, report_month_for, snapshot_versions
 from project_base import ProjectBase, register_project
-from vnpy.trader.constant import Direction, Offset
+from backtest_pool import BacktestPool, BacktestTask
+from backtest_bars import BarStore
+from vector_backtest import PriceCube, VectorBacktestEngine, trade_offset
+from vnpy.trader.constant import Direction
+
+# 策略on_init中load_bar回看的天数, 预加载K线时向前多取
+WARMUP_DAYS = 20
+
+# 每次选股并预加载K线的月数, 只有这些月份的候选标的K线同时保存在内存中
+PRELOAD_MONTHS = 12
+
+# 选股结果缓存, 与运行结果一起保存在results目录下, 日线或财报重新导入后对应月份自动失效
+SELECTION_CACHE = SelectionCache(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                              "..", "results", "_selections.json"))
+
+# 回测引擎参数, vnpy回测和向量化回测共用
+BACKTEST_PARAMETERS = {
+    "rate": 0.3/10000,
+    "slippage": 0.2,
+    "size": 100,
+    "pricetick": 0.2,
+}
+
+
+def end_of_day(dt: datetime) -> datetime:
+    """与BacktestingEngine.set_parameters对结束时间的处理一致"""
+    return dt.replace(hour=23, minute=59, second=59)
+
 
 class MonthlyMinMarketValueProject(ProjectBase):
     """每月市值最低策略项目"""
     
     def __init__(self, name: str = "monthly_min_market_value", 
                  initial_capital: float = 1000000,
-                 top_n: int = 10):
+                 top_n: int = 10,
+                 max_workers: int = None,
+                 vectorized: bool = False):
         """
         初始化策略
         
@@ -34,79 +64,31 @@ class MonthlyMinMarketValueProject(ProjectBase):
             name: 项目名称
             initial_capital: 初始资金
             top_n: 选择市值最低的前N只股票
+            max_workers: 并行回测的进程数, 默认为CPU核数, 1表示在当前进程中串行运行
+            vectorized: 使用向量化回测引擎, 每月的全部候选标的一次算完, 结果与vnpy回测在浮点误差内一致
         """
         super().__init__(name)
         self.initial_capital = initial_capital
         self.current_capital = initial_capital
         self.top_n = top_n
+        self.max_workers = max_workers
+        self.vectorized = vectorized
         
-    def create_connection(self):
-        """创建MySQL连接"""
-        try:
-            connection = mysql.connector.connect(
-                host='localhost',
-                port=3306,
-                user='root',
-                password='123456',
-                database='ASTOCK'
-            )
-            return connection
-        except mysql.connector.Error as e:
-            print(f"连接MySQL失败: {e}")
-            return None
-            
-    def get_min_market_value(self, year: int, month: int) -> list:
-        """获取指定年月市值最低的股票"""
-        connection = self.create_connection()
-        if not connection:
-            return []
-            
+    def get_min_market_value(self, year: int, month: int, versions: dict = None) -> list:
+        """
+        获取指定年月市值最低的股票, 从月末市值快照表中按索引查询
+
+        结果按财报月份缓存, 数据版本不变时直接返回缓存; versions为snapshot_versions的结果,
+        选多个月份时先查询一次传入
+        """
         try:
-            finance_report_months = ['12', '03', '06', '09']
-            year_of_interest = year - 1 if month < 4 else year
-            report_month_of_interest = f"{year_of_interest}-{finance_report_months[(month - 1) // 3]}"
-            
-            cursor = connection.cursor()
-            sql = f'''SELECT 
-                    a.symbol, a.name, a.update_time, (a.total_shares * b.close_price) AS market_value
-                    FROM finance a
-                    JOIN (
-                        SELECT 
-                            symbol,
-                            datetime,
-                            close_price,
-                            ROW_NUMBER() OVER (
-                                PARTITION BY symbol, YEAR(datetime), MONTH(datetime) 
-                                ORDER BY datetime DESC
-                            ) as rn
-                        FROM daily
-                        WHERE exchange = 'SZSE'
-                            AND datetime like '{report_month_of_interest}-%'
-                    ) b 
-                    ON a.symbol = b.symbol 
-                        AND YEAR(a.update_time) = YEAR(b.datetime)
-                        AND MONTH(a.update_time) = MONTH(b.datetime)
-                        AND b.rn = 1
-                    WHERE a.market = '深市'
-                        AND a.update_time like '{report_month_of_interest}-%'
-                        AND a.symbol like '00%'
-                        AND a.name not like '%ST%'
-                        AND a.name not like '%退'
-                    ORDER BY market_value ASC
-                    LIMIT {self.top_n};'''
-                    
-            cursor.execute(sql)
-            rows = cursor.fetchall()
-            
-            # 将查询结果转换为字典列表
-            values = [{"symbol": row[0], "name": row[1], "market_value": row[3]} for row in rows]
-            return values
+            with get_connection() as connection:
+                return SELECTION_CACHE.select(connection, report_month_for(year, month), self.top_n,
+                                              versions=versions)
             
         except Exception as e:
             print(f"获取市值数据失败: {e}")
             return []
-        finally:
-            connection.close()
             
     def convert_list_to_df(self, list_data) -> pd.DataFrame:
         df = pd.DataFrame()
@@ -118,6 +100,115 @@ class MonthlyMinMarketValueProject(ProjectBase):
             df = pd.DataFrame.from_dict(results).set_index('datetime')
         return df
         
+    def prepare_months(self, windows: list, versions=None):
+        """
+        选出各月的候选标的, 并按每个标的各自回测区间(含预热)的并集批量预加载K线
+
+        回测引擎会把结束时间设为当日23:59:59, 预加载范围也覆盖到结束日的最后一秒
+
+        Args:
+            windows: 各月的(开始时间, 下月开始时间, 结束时间)
+            versions: 市值快照的数据版本, None表示不使用选股缓存
+
+        Returns:
+            (各月的候选标的列表, BarStore)
+        """
+        hits = SELECTION_CACHE.hits
+        candidates = [self.get_min_market_value(start.year, start.month, versions) for start, _, _ in windows]
+        print(f"🗂️ 选股缓存命中 {SELECTION_CACHE.hits - hits}/{len(windows)} 个月")
+
+        # 标的只在入选月份的回测区间内需要K线
+        ranges = {}
+        for (start, _, end), month_symbols in zip(windows, candidates):
+            window_start, window_end = start - timedelta(days=WARMUP_DAYS), end_of_day(end)
+            for symbol in month_symbols:
+                span_start, span_end = ranges.get(symbol["symbol"], (window_start, window_end))
+                ranges[symbol["symbol"]] = (min(span_start, window_start), max(span_end, window_end))
+
+        bar_store = BarStore()
+        if ranges:
+            with get_connection() as connection:
+                bar_count = bar_store.load_ranges(connection, ranges)
+            print(f"📦 预加载 {len(ranges)} 个标的的K线 {bar_count} 条, 查询 {bar_store.query_count} 次")
+        return candidates, bar_store
+    
+    def run_month_vnpy(self, pool: BacktestPool, bar_store: BarStore, symbols_candidates: list,
+                       start: datetime, end: datetime, capital: float):
+        """
+        对每只股票运行vnpy回测引擎, 结果按候选顺序返回
+
+        Returns:
+            (各标的的逐日结果列表, 各标的的总净盈亏列表)
+        """
+        tasks = [
+            BacktestTask(
+                vt_symbol=symbol["symbol"] + ".SZSE",
+                start=start,
+                end=end,
+                capital=capital,
+                strategy_class=MonthlyMinMarketValueStrategy,
+                setting={
+                    "initial_capital": capital, 
+                    "current_month": start.month
+                },
+                bar_store=bar_store.subset(symbol["symbol"], "SZSE",
+                                           start - timedelta(days=WARMUP_DAYS), end_of_day(end)),
+                interval="d",
+                **BACKTEST_PARAMETERS
+            )
+            for symbol in symbols_candidates
+        ]
+        results = pool.run(tasks)
+        
+        month_profits = []
+        month_dfs = []
+        for symbol, result in zip(symbols_candidates, results):
+            month_dfs.append(result.daily_df)
+            
+            # 上传trade数据, 回测中卖出也按开仓委托成交, 开平方向按持仓变化确定
+            pos = 0
+            for trade in result.trades:
+                change = trade.volume if trade.direction == Direction.LONG else -trade.volume
+                self.add_trade(
+                    symbol=symbol['symbol'],
+                    direction='LONG' if trade.direction == Direction.LONG else 'SHORT',
+                    price=trade.price,
+                    volume=trade.volume,
+                    timestamp=trade.datetime,
+                    offset=trade_offset(pos, change)
+                )
+                pos += change
+            
+            month_profits.append(result.statistics["total_net_pnl"])
+        return month_dfs, month_profits
+    
+    def run_month_vectorized(self, bar_store: BarStore, symbols_candidates: list,
+                             start: datetime, end: datetime, capital: float):
+        """
+        用向量化回测引擎一次回测当月全部候选标的, 返回值与run_month_vnpy相同,
+        逐日结果已按日期合并为一个DataFrame
+        """
+        cube = PriceCube.from_bar_store(bar_store, [
+            (symbol["symbol"], "SZSE", start - timedelta(days=WARMUP_DAYS), start, end_of_day(end))
+            for symbol in symbols_candidates
+        ])
+        engine = VectorBacktestEngine(**BACKTEST_PARAMETERS)
+        strategy = MonthlyMinMarketValueVectorStrategy(capital, start.month, BACKTEST_PARAMETERS["size"])
+        result = engine.run(cube, strategy)
+        
+        for trade in result.trades:
+            self.add_trade(
+                symbol=symbols_candidates[trade.row]['symbol'],
+                direction=trade.direction,
+                price=trade.price,
+                volume=trade.volume,
+                timestamp=trade.datetime,
+                offset=trade.offset
+            )
+        print(f"📈 成交 {len(result.trades)} 笔")
+        
+        return [result.daily_frame()], list(result.row_net_pnl())
+        
     def run(self, start_date: str, end_date: str, **kwargs) -> pd.DataFrame:
         """
         运行策略
@@ -125,7 +216,7 @@ class MonthlyMinMarketValueProject(ProjectBase):
         Args:
             start_date: 开始日期 (YYYY-MM-DD)
             end_date: 结束日期 (YYYY-MM-DD)
-            **kwargs: 其他参数
+            **kwargs: 其他参数, max_workers覆盖并行回测的进程数, vectorized覆盖是否使用向量化回测
         """
         # 设置项目运行时间
         self.start_time = datetime.strptime(start_date, '%Y-%m-%d')
@@ -157,80 +248,74 @@ class MonthlyMinMarketValueProject(ProjectBase):
         
         print(f"📅 月份列表: {month_first_list}")
         
+        # 每月的回测区间: 当月1日到下下月9日
+        windows = []
+        for i, start in enumerate(month_first_list):
+            next_start = month_first_list[i + 1] if i + 1 < len(month_first_list) else None
+            end = next_start or end_day
+            end = end.replace(month=end.month + 1, day=9) if end.month < 12 else end.replace(year=end.year+1, month=1, day=9)
+            windows.append((start, next_start, end))
+        
+        # 选股数据版本在整个运行中只查询一次
+        try:
+            with get_connection() as connection:
+                versions = snapshot_versions(connection)
+        except Exception as e:
+            print(f"获取市值快照版本失败: {e}")
+            versions = None
+        
         # 初始化变量
         capital = self.initial_capital / 10
         dfs = []
+        max_workers = kwargs.get('max_workers', self.max_workers)
+        vectorized = kwargs.get('vectorized', self.vectorized)
+        if vectorized:
+            print(f"⚡ 使用向量化回测引擎")
         
-        # 按月份运行策略
-        for i in range(len(month_first_list)):
-            if i > 0:
-                capital += total_profits[i - 1] / 10  # add profit
-                            
-            start = month_first_list[i]
-            end = month_first_list[i + 1] if i + 1 < len(month_first_list) else end_day
-            end = end.replace(month=end.month + 1, day=9) if end.month < 12 else end.replace(year=end.year+1, month=1, day=9)
-            
-            print(f"\n📅 处理 {start.year}-{start.month:02d}")
-            
-            # 获取当月市值最低的股票
-            min_market_symbols = self.get_min_market_value(start.year, start.month)
-            symbols_candidates = min_market_symbols[:]
-            
-            if not symbols_candidates:
-                print(f"⚠️  {start.year}-{start.month:02d} 未找到符合条件的股票")
-                total_profits.append(0)
-                continue
+        # 按月份运行策略; 每月的资金取决于之前各月的盈亏, 月份依次运行,
+        # 同一个月的候选标的互相独立, 在进程池中并行回测
+        with BacktestPool(max_workers) as pool:
+            for i in range(len(month_first_list)):
+                if i > 0:
+                    capital += total_profits[i - 1] / 10  # add profit
+                                
+                # 选股与资金无关, 每PRELOAD_MONTHS个月先确定各月的候选标的并批量预加载K线
+                if i % PRELOAD_MONTHS == 0:
+                    self.report_progress(i, len(month_first_list), "选股并预加载K线")
+                    candidates, bar_store = self.prepare_months(windows[i:i + PRELOAD_MONTHS], versions)
                 
-            print(f"📈 候选标的: {symbols_candidates}")
-            
-            month_profits = []
-            month_profit = 0
-            
-            # 对每只股票运行vnpy回测引擎
-            for symbol in symbols_candidates:
-                engine = BacktestingEngine()
-                vt_symbol = symbol["symbol"] + ".SZSE"
+                start, next_start, end = windows[i]
                 
-                engine.set_parameters(
-                    vt_symbol=vt_symbol,
-                    interval="d",
-                    start=start,
-                    end=end,
-                    rate=0.3/10000,
-                    slippage=0.2,
-                    size=100,
-                    pricetick=0.2,
-                    capital=capital,
-                )
-                engine.add_strategy(MonthlyMinMarketValueStrategy, {
-                    "initial_capital": capital, 
-                    "current_month": start.month
-                })
+                print(f"\n📅 处理 {start.year}-{start.month:02d}")
+                self.report_progress(i, len(month_first_list), f"{start.year}-{start.month:02d}")
                 
-                engine.load_data()
-                engine.run_backtesting()
-                df = engine.calculate_result()
-                dfs.append(df)                
-                res = engine.calculate_statistics(output=False)
+                # 当月市值最低的股票
+                symbols_candidates = candidates[i % PRELOAD_MONTHS][:]
                 
-                # 上传trade数据
-                all_trades = engine.get_all_trades()
-                print(f"📈 交易记录: {all_trades}")
-                for trade in all_trades:
-                    self.add_trade(
-                        symbol=symbol['symbol'],
-                        direction='LONG' if trade.direction == Direction.LONG else 'SHORT',
-                        price=trade.price,
-                        volume=trade.volume,
-                        timestamp=trade.datetime,
-                        offset='OPEN' if trade.offset == Offset.OPEN else 'CLOSE'
-                    )
+                if not symbols_candidates:
+                    print(f"⚠️  {start.year}-{start.month:02d} 未找到符合条件的股票")
+                    total_profits.append(0)
+                    self.report_partial(final_before=next_start)
+                    continue
+                    
+                print(f"📈 候选标的: {symbols_candidates}")
                 
-                month_profits.append(res["total_net_pnl"])                
-            
-            month_profit = sum(month_profits)
-            total_profits.append(month_profit)
-            print(f"📈 {start.year}-{start.month}月总净利润: {month_profit}")
+                if vectorized:
+                    month_dfs, month_profits = self.run_month_vectorized(
+                        bar_store, symbols_candidates, start, end, capital)
+                else:
+                    month_dfs, month_profits = self.run_month_vnpy(
+                        pool, bar_store, symbols_candidates, start, end, capital)
+                dfs.extend(month_dfs)
+                
+                month_profit = sum(month_profits)
+                total_profits.append(month_profit)
+                print(f"📈 {start.year}-{start.month}月总净利润: {month_profit}")
+
+                # 之后的月份从下月1日开始回测, 下月1日之前的逐日结果已确定, 推送给前端
+                self.report_partial(month_dfs, final_before=next_start)
+        
+        self.report_progress(len(month_first_list), len(month_first_list), "汇总结果")
         
         # 计算综合结果
         record_df = sum_specified_keep_others(
@@ -245,7 +330,6 @@ class MonthlyMinMarketValueProject(ProjectBase):
         print(f"💰 总净利润: {sum(total_profits)}")
         print(f"📊 综合统计: {summary}")
                 
-        print(f"\n📤 上传数据到API服务器...")
         return record_df, summary
 
 
@@ -262,11 +346,15 @@ def main():
     register_project(strategy)
     
     # 运行策略
-    strategy.run(
+    record_df, summary = strategy.run(
         start_date="2024-01-01",
         end_date="2024-12-31"
     )
     
+    # 独立运行时不与API服务器同进程, 通过HTTP上传结果
+    strategy.apply_run_result(record_df, summary)
+    strategy.publish_data()
+    
 
 
 if __name__ == "__main__":
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+K线和指标接口的响应格式
+支持按请求协商返回格式, 减少多年历史数据的序列化开销和传输体积:
+
+- rows:    [{'time': ..., 'open': ...}, ...], 默认格式, 与旧接口兼容
+- columns: 按列组织的JSON, 每个字段一个数组
+- binary:  小端序int64/float64数组依次拼接, 字段布局在响应头X-Fields中说明
+- arrow:   Arrow IPC stream, 需要安装pyarrow
+"""
+
+import json
+import math
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from flask import Request, Response
+
+from downsample import aggregate_ohlc
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+FORMAT_ROWS = 'rows'
+FORMAT_COLUMNS = 'columns'
+FORMAT_BINARY = 'binary'
+FORMAT_ARROW = 'arrow'
+
+MIME_JSON = 'application/json'
+MIME_BINARY = 'application/octet-stream'
+MIME_ARROW = 'application/vnd.apache.arrow.stream'
+
+# Accept头到格式的映射, 按优先级排列
+_ACCEPT_FORMATS = [
+    (MIME_ARROW, FORMAT_ARROW),
+    (MIME_BINARY, FORMAT_BINARY),
+]
+
+# K线接口字段: (输出字段名, DataFrame列名)
+BAR_FIELDS = [
+    ('open', 'open_price'),
+    ('high', 'high_price'),
+    ('low', 'low_price'),
+    ('close', 'close_price'),
+    ('volume', 'volume'),
+]
+
+
+class UnsupportedFormat(ValueError):
+    """请求的响应格式不可用"""
+    pass
+
+
+def negotiate_format(request: Request) -> str:
+    """
+    根据format参数或Accept头确定响应格式
+
+    Args:
+        request: Flask请求对象
+
+    Returns:
+        rows/columns/binary/arrow之一
+    """
+    fmt = request.args.get('format')
+    if fmt:
+        fmt = fmt.lower()
+        if fmt not in (FORMAT_ROWS, FORMAT_COLUMNS, FORMAT_BINARY, FORMAT_ARROW):
+            raise UnsupportedFormat(f'不支持的响应格式: {fmt}')
+    else:
+        fmt = FORMAT_ROWS
+        for mime, accept_fmt in _ACCEPT_FORMATS:
+            if request.accept_mimetypes[mime] and request.accept_mimetypes[mime] >= request.accept_mimetypes[MIME_JSON]:
+                fmt = accept_fmt
+                break
+
+    if fmt == FORMAT_ARROW and pa is None:
+        raise UnsupportedFormat('服务器未安装pyarrow, 不支持arrow格式')
+    return fmt
+
+
+def df_times(df: pd.DataFrame) -> np.ndarray:
+    """DataFrame的datetime索引转换为秒级时间戳数组"""
+    return df.index.values.astype('datetime64[s]').astype(np.int64)
+
+
+def json_response(payload, status: int = 200) -> Response:
+    """
+    JSON响应, 安装了orjson时使用orjson直接序列化numpy数组
+
+    两条路径输出一致: NaN/inf输出为null, 不写入标准JSON不支持的NaN
+    """
+    if orjson is not None:
+        body = orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        body = json.dumps(_finite(payload), ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+    return Response(body, status=status, mimetype=MIME_JSON)
+
+
+def _finite(obj):
+    """递归转换numpy类型, 非有限浮点数替换为None, 与orjson的输出保持一致"""
+    if isinstance(obj, dict):
+        return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(value) for value in obj]
+    if isinstance(obj, np.ndarray):
+        if np.issubdtype(obj.dtype, np.floating):
+            values = obj.astype(object)
+            values[~np.isfinite(obj)] = None
+            return values.tolist()
+        return _finite(obj.tolist())
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float) and not math.isfinite(obj):
+        return None
+    return obj
+
+
+def columns_to_rows(columns: Dict[str, np.ndarray]) -> List[dict]:
+    """按列数组组装为逐行字典列表"""
+    keys = list(columns.keys())
+    values = [columns[key].tolist() for key in keys]
+    return [dict(zip(keys, row)) for row in zip(*values)]
+
+
+def binary_response(columns: Dict[str, np.ndarray]) -> Response:
+    """
+    打包为小端序二进制: 各列依次拼接, 整数列为int64, 其余为float64
+
+    响应头:
+        X-Count: 行数
+        X-Fields: 字段布局, 如"time:i8,open:f8,high:f8"
+    """
+    fields = []
+    buffers = []
+    for key, array in columns.items():
+        if np.issubdtype(array.dtype, np.integer):
+            buffers.append(np.ascontiguousarray(array, dtype='<i8').tobytes())
+            fields.append(f'{key}:i8')
+        else:
+            buffers.append(np.ascontiguousarray(array, dtype='<f8').tobytes())
+            fields.append(f'{key}:f8')
+
+    response = Response(b''.join(buffers), mimetype=MIME_BINARY)
+    response.headers['X-Count'] = str(len(next(iter(columns.values()))) if columns else 0)
+    response.headers['X-Fields'] = ','.join(fields)
+    response.headers['Access-Control-Expose-Headers'] = 'X-Count, X-Fields'
+    return response
+
+
+def arrow_response(columns: Dict[str, np.ndarray]) -> Response:
+    """打包为Arrow IPC stream"""
+    table = pa.table({key: pa.array(array) for key, array in columns.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(sink.getvalue().to_pybytes(), mimetype=MIME_ARROW)
+
+
+def columns_payload(columns: Dict[str, np.ndarray], fmt: str):
+    """按rows/columns格式组织一组等长的列, 返回可JSON序列化的对象"""
+    if fmt == FORMAT_COLUMNS:
+        return columns
+    return columns_to_rows(columns)
+
+
+def columns_response(key: str, columns: Dict[str, np.ndarray], fmt: str) -> Response:
+    """
+    按协商格式输出一组等长的列
+
+    Args:
+        key: JSON格式下的外层字段名, 如'bars'
+        columns: 字段名 -> numpy数组
+        fmt: 响应格式
+    """
+    if fmt == FORMAT_BINARY:
+        return binary_response(columns)
+    if fmt == FORMAT_ARROW:
+        return arrow_response(columns)
+    return json_response({key: columns_payload(columns, fmt)})
+
+
+def bars_columns(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """K线DataFrame转换为接口字段的列数组"""
+    columns = {'time': df_times(df)}
+    for field, column in BAR_FIELDS:
+        columns[field] = np.ascontiguousarray(df[column].to_numpy(dtype=np.float64))
+    return columns
+
+
+def make_bars_response(df: pd.DataFrame, fmt: str, max_points: Optional[int] = None) -> Response:
+    """
+    K线接口响应
+
+    Args:
+        df: K线DataFrame
+        fmt: 响应格式
+        max_points: 最多返回的K线数, 超出时合并相邻K线, None表示不限制
+    """
+    columns = bars_columns(df)
+    if max_points:
+        columns = aggregate_ohlc(columns, max_points)
+    return columns_response('bars', columns, fmt)
+
+
+def indicator_payload(times: np.ndarray, series: Dict[str, np.ndarray], fmt: str,
+                      single: Optional[str] = None):
+    """
+    按rows/columns格式组织指标数据, 返回可JSON序列化的对象
+
+    Args:
+        times: 时间戳数组
+        series: 指标名 -> 指标值数组
+        fmt: 响应格式
+        single: 只返回一个指标时的指标名, 直接返回该指标的序列
+    """
+    if single:
+        return columns_payload({'time': times, 'value': series[single]}, fmt)
+    return {key: columns_payload({'time': times, 'value': values}, fmt) for key, values in series.items()}
+
+
+def make_indicator_response(times: np.ndarray, series: Dict[str, np.ndarray], fmt: str,
+                            single: Optional[str] = None) -> Response:
+    """
+    指标接口响应
+
+    Args:
+        times: 时间戳数组
+        series: 指标名 -> 指标值数组
+        fmt: 响应格式
+        single: 只返回一个指标时的指标名, rows/columns格式下直接返回该指标的序列
+    """
+    if fmt in (FORMAT_BINARY, FORMAT_ARROW):
+        columns = {'time': times}
+        columns.update(series)
+        return columns_response('indicator', columns, fmt)
+
+    return json_response({'indicator': indicator_payload(times, series, fmt, single)})
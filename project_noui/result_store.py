@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+项目运行结果存储
+与API服务器同进程运行的项目直接调用publish写入结果, 不再通过HTTP回传给自身。
+
+每次发布的结果按列保存为.npy文件, 服务重启后仍可读取:
+    <root_dir>/<project_name>/CURRENT            当前版本号
+    <root_dir>/<project_name>/<version>/*.npy    时序数据和交易记录的各列
+    <root_dir>/<project_name>/<version>/meta.json
+
+读取时按需以内存映射方式加载, 内存中的结果超过上限时淘汰最久未使用的项目。
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+# 列名 -> dtype
+TECH_COLUMNS = {
+    'time': np.int64,
+    'daily_pnl': np.float64,
+    'balance': np.float64,
+    'drawdown': np.float64,
+}
+
+TRADE_COLUMNS = {
+    'time': np.int64,
+    'price': np.float64,
+    'volume': np.float64,
+    'symbol': str,
+    'direction': str,
+    'offset': str,
+}
+
+CURRENT_FILENAME = 'CURRENT'
+META_FILENAME = 'meta.json'
+
+# 还原出的每笔交易记录(含索引中的副本)大致占用的内存(字节), 用于估算内存占用
+TRADE_OBJECT_BYTES = 1200
+
+
+class TradeIndex:
+    """
+    单个项目的交易索引
+
+    发布时按标的分组并按时间排序, 预先生成接口输出格式和标的列表,
+    查询时按时间范围二分查找。
+    """
+
+    def __init__(self, trade_data: List[Dict[str, Any]]):
+        grouped = defaultdict(list)
+        for rec in trade_data:
+            grouped[rec['symbol']].append({
+                'time': int(rec['time']),
+                'price': float(rec['price']),
+                'volume': float(rec['volume']),
+                'direction': str(rec['direction']),
+                'offset': str(rec['offset'])
+            })
+
+        self._trades: Dict[str, List[Dict[str, Any]]] = {}
+        self._times: Dict[str, List[int]] = {}
+        for symbol, trades in grouped.items():
+            trades.sort(key=lambda trade: trade['time'])
+            self._trades[symbol] = trades
+            self._times[symbol] = [trade['time'] for trade in trades]
+
+        self.symbol_list: List[str] = sorted(self._trades.keys())
+
+    def query(self, symbol: str, start_time: Optional[int] = None,
+              end_time: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        查询标的在[start_time, end_time)内的交易
+
+        Args:
+            symbol: 标的代码
+            start_time: 开始时间戳(秒), None表示不限制
+            end_time: 结束时间戳(秒), None表示不限制
+        """
+        times = self._times.get(symbol)
+        if not times:
+            return []
+        left = bisect_left(times, start_time) if start_time is not None else 0
+        right = bisect_left(times, end_time) if end_time is not None else len(times)
+        return self._trades[symbol][left:right]
+
+
+_EMPTY_TRADE_INDEX = TradeIndex([])
+
+
+def _trade_datetime(timestamp: int) -> str:
+    """可读的成交时间(UTC), 与原先通过pandas转换的结果一致"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _json_default(obj):
+    """摘要中的numpy标量转换为Python类型, 其他无法序列化的对象转为字符串"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+
+class _Run:
+    """
+    一个项目某个版本的运行结果
+
+    列数据为numpy数组或内存映射, 交易记录列表和交易索引在首次访问时生成
+    """
+
+    def __init__(self, version: str, tech: Dict[str, np.ndarray], trades: Dict[str, np.ndarray],
+                 summary: Optional[Dict[str, Any]] = None, trade_list: Optional[List[Dict[str, Any]]] = None):
+        self.version = version
+        self.tech = tech
+        self.trades = trades
+        self.summary = summary
+        self._trade_list = trade_list
+        self._trade_index = None
+        self._lock = threading.Lock()
+
+    @property
+    def trade_list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            if self._trade_list is None:
+                columns = [self.trades[key].tolist() for key in TRADE_COLUMNS]
+                self._trade_list = [
+                    {
+                        'time': t,
+                        'symbol': symbol,
+                        'direction': direction,
+                        'price': price,
+                        'volume': volume,
+                        'offset': offset,
+                        'datetime': _trade_datetime(t)
+                    }
+                    for t, price, volume, symbol, direction, offset in zip(*columns)
+                ]
+            return self._trade_list
+
+    @property
+    def trade_index(self) -> TradeIndex:
+        trade_list = self.trade_list
+        with self._lock:
+            if self._trade_index is None:
+                self._trade_index = TradeIndex(trade_list)
+            return self._trade_index
+
+    @property
+    def nbytes(self) -> int:
+        """估算占用的内存, 内存映射的列按文件大小计算"""
+        size = sum(array.nbytes for array in self.tech.values())
+        size += sum(array.nbytes for array in self.trades.values())
+        if self._trade_list is not None:
+            size += len(self._trade_list) * TRADE_OBJECT_BYTES
+        return size
+
+
+class ResultStore:
+    """
+    项目时序数据和交易记录的持久化存储
+
+    - 单写多读: 发布串行执行, 新版本写完后原子替换CURRENT, 读取不会看到写了一半的结果
+    - 按需加载: 首次读取时以内存映射方式加载; 磁盘上的版本更新后(如其他进程发布)自动重新加载
+    - 内存上限: 已加载的结果超过max_bytes时按LRU淘汰, 再次访问时从磁盘加载
+    """
+
+    def __init__(self, root_dir: str = None, max_bytes: int = 256 * 1024 * 1024):
+        """
+        初始化结果存储
+
+        Args:
+            root_dir: 存储目录, 默认为本文件所在目录下的results
+            max_bytes: 内存中保留的运行结果占用上限(字节)
+        """
+        self.root_dir = Path(root_dir) if root_dir else Path(__file__).resolve().parent / 'results'
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+        self._runs: 'OrderedDict[str, _Run]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        self.loads = 0
+        self.evictions = 0
+
+    def publish(self, project_name: str, tech_data: Optional[Dict[str, List[Any]]] = None,
+                trade_data: Optional[List[Dict[str, Any]]] = None,
+                summary: Optional[Dict[str, Any]] = None) -> None:
+        """
+        发布项目运行结果, 写入磁盘并替换当前版本
+
+        Args:
+            project_name: 项目名称
+            tech_data: 时序数据 {'time': [...], 'daily_pnl': [...], 'balance': [...], 'drawdown': [...]}
+            trade_data: 交易记录列表, 每条记录包含time/symbol/direction/price/volume/offset
+            summary: 项目摘要, 服务重启后项目尚未运行时用于展示
+
+        为None的部分沿用上一版本的结果
+        """
+        with self._write_lock:
+            previous = self._get_run(project_name)
+
+            if tech_data is not None:
+                tech = {key: np.asarray(tech_data.get(key, []), dtype=dtype) for key, dtype in TECH_COLUMNS.items()}
+            elif previous:
+                tech = previous.tech
+            else:
+                tech = {key: np.empty(0, dtype=dtype) for key, dtype in TECH_COLUMNS.items()}
+
+            if trade_data is not None:
+                for rec in trade_data:
+                    if 'datetime' not in rec:
+                        rec['datetime'] = _trade_datetime(rec['time'])
+                trades = {key: np.asarray([rec[key] for rec in trade_data], dtype=dtype)
+                          for key, dtype in TRADE_COLUMNS.items()}
+            elif previous:
+                trades = previous.trades
+                trade_data = previous.trade_list
+            else:
+                trades = {key: np.asarray([], dtype=dtype) for key, dtype in TRADE_COLUMNS.items()}
+                trade_data = []
+
+            if summary is None and previous:
+                summary = previous.summary
+
+            version = self._write_run(project_name, tech, trades, summary)
+            with self._lock:
+                self._runs[project_name] = _Run(version, tech, trades, summary, trade_data)
+                self._runs.move_to_end(project_name)
+                self._evict()
+
+    def _write_run(self, project_name: str, tech: Dict[str, np.ndarray], trades: Dict[str, np.ndarray],
+                   summary: Optional[Dict[str, Any]]) -> str:
+        """写入新版本目录, 原子替换CURRENT后清理旧版本, 返回版本号"""
+        project_dir = self.root_dir / project_name
+        project_dir.mkdir(parents=True, exist_ok=True)
+
+        version = f"{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+        tmp_dir = project_dir / f".{version}.tmp"
+        tmp_dir.mkdir()
+        for key, array in tech.items():
+            np.save(tmp_dir / f"tech_{key}.npy", array)
+        for key, array in trades.items():
+            np.save(tmp_dir / f"trade_{key}.npy", array)
+        with open(tmp_dir / META_FILENAME, 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'published_at': time.time(), 'summary': summary},
+                      f, ensure_ascii=False, default=_json_default)
+        os.replace(tmp_dir, project_dir / version)
+
+        current_tmp = project_dir / f".{CURRENT_FILENAME}.{version}.tmp"
+        current_tmp.write_text(version, encoding='utf-8')
+        os.replace(current_tmp, project_dir / CURRENT_FILENAME)
+
+        # 已映射旧版本的读取方不受影响(POSIX); 删除失败时留待下次发布清理
+        for path in project_dir.iterdir():
+            if path.is_dir() and path.name != version:
+                shutil.rmtree(path, ignore_errors=True)
+        return version
+
+    def _current_version(self, project_name: str) -> Optional[str]:
+        """读取磁盘上的当前版本号, 项目未发布过时返回None"""
+        try:
+            return (self.root_dir / project_name / CURRENT_FILENAME).read_text(encoding='utf-8').strip()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def _load_run(self, project_name: str, version: str) -> _Run:
+        """以内存映射方式加载某个版本"""
+        run_dir = self.root_dir / project_name / version
+        tech = {key: np.load(run_dir / f"tech_{key}.npy", mmap_mode='r') for key in TECH_COLUMNS}
+        trades = {key: np.load(run_dir / f"trade_{key}.npy", mmap_mode='r') for key in TRADE_COLUMNS}
+        with open(run_dir / META_FILENAME, encoding='utf-8') as f:
+            meta = json.load(f)
+        return _Run(version, tech, trades, meta.get('summary'))
+
+    def _get_run(self, project_name: str) -> Optional[_Run]:
+        """获取项目当前版本的结果, 内存中没有或已过期时从磁盘加载"""
+        for _ in range(3):
+            version = self._current_version(project_name)
+            if version is None:
+                return None
+
+            with self._lock:
+                run = self._runs.get(project_name)
+                if run is not None and run.version == version:
+                    self._runs.move_to_end(project_name)
+                    return run
+
+            try:
+                run = self._load_run(project_name, version)
+            except FileNotFoundError:
+                # 加载期间其他进程发布了新版本并清理了旧版本, 重新读取CURRENT
+                continue
+
+            with self._lock:
+                self.loads += 1
+                self._runs[project_name] = run
+                self._runs.move_to_end(project_name)
+                self._evict()
+            return run
+        return None
+
+    def _evict(self) -> None:
+        """按LRU淘汰超出内存上限的项目, 调用方需持有锁"""
+        total = sum(run.nbytes for run in self._runs.values())
+        while total > self.max_bytes and len(self._runs) > 1:
+            _, run = self._runs.popitem(last=False)
+            total -= run.nbytes
+            self.evictions += 1
+
+    def get_tech_data(self, project_name: str) -> Optional[Dict[str, List[Any]]]:
+        """获取项目时序数据"""
+        run = self._get_run(project_name)
+        if run is None:
+            return None
+        return {key: array.tolist() for key, array in run.tech.items()}
+
+    def get_trades(self, project_name: str) -> List[Dict[str, Any]]:
+        """获取项目交易记录"""
+        run = self._get_run(project_name)
+        return run.trade_list if run else []
+
+    def get_trade_index(self, project_name: str) -> TradeIndex:
+        """获取项目交易索引, 无交易时返回空索引"""
+        run = self._get_run(project_name)
+        return run.trade_index if run else _EMPTY_TRADE_INDEX
+
+    def get_summary(self, project_name: str) -> Optional[Dict[str, Any]]:
+        """获取发布时保存的项目摘要"""
+        run = self._get_run(project_name)
+        return run.summary if run else None
+
+    def stats(self) -> Dict[str, Any]:
+        """返回已加载结果的内存占用和加载统计"""
+        with self._lock:
+            return {
+                'projects': list(self._runs.keys()),
+                'bytes': sum(run.nbytes for run in self._runs.values()),
+                'max_bytes': self.max_bytes,
+                'loads': self.loads,
+                'evictions': self.evictions
+            }
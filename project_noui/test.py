@@ -1,7 +1,12 @@
 import mysql.connector
+import os
+import sys
 import pandas as pd
 from collections import defaultdict
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from tools.market_value_snapshot import report_month_for, select_market_values
+
 def create_connection():
     try:
         connection = mysql.connector.connect(
@@ -29,46 +34,10 @@ def get_market_values(year, month) -> list:
     connection = create_connection()
     if not connection:
         return []
-    
-    finance_report_months = ['12', '03', '06', '09']
-    year_of_interest = year - 1 if month < 4 else year
-    report_month_of_interest = str(year_of_interest) + "-" + finance_report_months[(month - 1) // 3]
-
-    cursor = connection.cursor()
-    sql = f'''SELECT 
-            a.symbol, a.name, a.update_time, (a.total_shares * b.close_price) AS market_value
-            FROM finance a
-            JOIN (
-                SELECT 
-                    symbol,
-                    datetime,
-                    close_price,
-                    ROW_NUMBER() OVER (
-                        PARTITION BY symbol, YEAR(datetime), MONTH(datetime) 
-                        ORDER BY datetime DESC
-                    ) as rn
-                FROM daily
-                WHERE exchange = 'SZSE'
-                    AND datetime like '{report_month_of_interest}-%'
-            ) b 
-            ON a.symbol = b.symbol 
-                AND YEAR(a.update_time) = YEAR(b.datetime)
-                AND MONTH(a.update_time) = MONTH(b.datetime)
-                AND b.rn = 1
-            WHERE a.market = '深市'
-                AND a.update_time like '{report_month_of_interest}-%'
-                AND a.symbol like '00%'
-                AND a.name not like '%ST%'
-                AND a.name not like '%退'
-            ;'''
-    # print(f"SQL查询语句: {sql}")
-    cursor.execute(sql)
-    rows = cursor.fetchall()
-    cursor.close()
-    connection.close()
 
-    # 将查询结果转换为字典列表
-    values = [{"symbol": row[0], "name": row[1], "market_value": row[3]} for row in rows]
+    # 从月末市值快照表中查询财报月份的全部候选标的
+    values = select_market_values(connection, report_month_for(year, month))
+    connection.close()
     return values
 
 def convert_list_to_df(list_data)->pd.DataFrame:
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+向量化组合回测
+把一批互相独立的回测(如某个月的全部候选标的)放在 回测行×交易日 的价格数组中,
+逐个交易日同时处理所有行, 代替逐个运行vnpy的BacktestingEngine。
+
+撮合和盈亏计算与vnpy回测引擎的K线模式一致:
+- 策略在K线收盘时设置目标仓位, 按收盘价加减tick_add并取整到pricetick挂限价单,
+  下一根K线买单价格不低于最低价(卖单不高于最高价)时成交, 成交价取限价与开盘价中更优的一个
+- 挂单未成交时再次设置目标仓位会先撤单, 下一次设置时才重新挂单, 与TargetPosTemplate一致
+- 逐日盈亏: 持仓盈亏按昨收计算, 交易盈亏按当日收盘价计算, 手续费按成交额乘rate, 滑点按成交数量乘size和slippage
+- 涨停封板(最低价等于最高价且不低于昨收的1+limit_ratio倍)时不买入, 跌停封板时不卖出
+
+输出与vnpy逐日结果中求和的各列相同, 可直接替换sum_specified_keep_others合并后的record_df。
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from vnpy.trader.utility import round_to
+
+
+# vnpy逐日结果中按日期求和的列
+DAILY_COLUMNS = ['trade_count', 'turnover', 'commission', 'slippage', 'trading_pnl', 'holding_pnl', 'total_pnl', 'net_pnl']
+
+
+class PriceCube:
+    """
+    回测行×交易日的K线数组
+
+    每行是一次独立的回测, 没有K线的位置为NaN; active标记回测区间内的K线,
+    区间之前的K线只用于策略预热, 不参与撮合和盈亏计算
+    """
+
+    def __init__(self, dates: Sequence[datetime], open_price: np.ndarray, high: np.ndarray,
+                 low: np.ndarray, close: np.ndarray, active: np.ndarray):
+        self.dates = list(dates)
+        self.open = open_price
+        self.high = high
+        self.low = low
+        self.close = close
+        self.active = active & ~np.isnan(close)
+
+        # 每行上一根K线(含预热K线)的收盘价
+        prev_close = np.full_like(close, np.nan)
+        last = np.full(close.shape[0], np.nan)
+        for t in range(close.shape[1]):
+            prev_close[:, t] = last
+            last = np.where(np.isnan(close[:, t]), last, close[:, t])
+        self.prev_close = prev_close
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.close.shape
+
+    @classmethod
+    def from_bar_store(cls, bar_store, rows: Sequence[Tuple[str, str, datetime, datetime, datetime]]) -> 'PriceCube':
+        """
+        由预加载的K线构建
+
+        Args:
+            bar_store: backtest_bars.BarStore
+            rows: 每行的(标的代码, 交易所, 预热开始时间, 回测开始时间, 回测结束时间), 区间包含两端;
+                未预加载的标的视为区间内没有K线
+        """
+        row_bars = []
+        for symbol, exchange, warmup_start, start, end in rows:
+            row_bars.append(bar_store.bars(symbol, exchange, warmup_start, end) or [])
+
+        dates = sorted({bar.datetime for bars in row_bars for bar in bars})
+        columns = {dt: i for i, dt in enumerate(dates)}
+        shape = (len(rows), len(dates))
+        arrays = {name: np.full(shape, np.nan) for name in ('open', 'high', 'low', 'close')}
+        active = np.zeros(shape, dtype=bool)
+        for i, ((_, _, _, start, _), bars) in enumerate(zip(rows, row_bars)):
+            if not bars:
+                continue
+            # K线时间带数据库时区, 回测区间按同一时区比较
+            start = start.replace(tzinfo=bars[0].datetime.tzinfo)
+            index = [columns[bar.datetime] for bar in bars]
+            arrays['open'][i, index] = [bar.open_price for bar in bars]
+            arrays['high'][i, index] = [bar.high_price for bar in bars]
+            arrays['low'][i, index] = [bar.low_price for bar in bars]
+            arrays['close'][i, index] = [bar.close_price for bar in bars]
+            active[i, index] = [bar.datetime >= start for bar in bars]
+        return cls(dates, arrays['open'], arrays['high'], arrays['low'], arrays['close'], active)
+
+
+def trade_offset(pos: float, change: float) -> str:
+    """成交的开平方向: 减少已有持仓为CLOSE, 否则为OPEN"""
+    return 'CLOSE' if pos * change < 0 else 'OPEN'
+
+
+class VectorTrade:
+    """一笔成交"""
+
+    def __init__(self, row: int, datetime: datetime, direction: str, offset: str, price: float, volume: float):
+        self.row = row
+        self.datetime = datetime
+        self.direction = direction
+        self.offset = offset
+        self.price = price
+        self.volume = volume
+
+
+class VectorBacktestResult:
+    """向量化回测结果: 每行每日的盈亏和全部成交"""
+
+    def __init__(self, cube: PriceCube, daily: Dict[str, np.ndarray], trades: List[VectorTrade]):
+        self.cube = cube
+        self.daily = daily
+        self.trades = trades
+
+    def row_net_pnl(self) -> np.ndarray:
+        """每行的总净盈亏, 对应vnpy统计结果中的total_net_pnl"""
+        return np.nansum(self.daily['net_pnl'], axis=1)
+
+    def daily_frame(self, rows: Optional[Sequence[int]] = None) -> pd.DataFrame:
+        """
+        按日期合并各行的逐日结果, 与对vnpy逐日结果调用sum_specified_keep_others相同
+
+        Args:
+            rows: 合并的行, None表示全部
+        """
+        rows = slice(None) if rows is None else list(rows)
+        active = self.cube.active[rows]
+        days = active.any(axis=0)
+        data = {column: np.nansum(np.where(active, self.daily[column][rows], 0.0), axis=0)[days]
+                for column in DAILY_COLUMNS}
+        data['trade_count'] = data['trade_count'].astype(int)
+        index = pd.Index([dt.date() for dt, keep in zip(self.cube.dates, days) if keep], name='date')
+        return pd.DataFrame(data, index=index)
+
+
+class VectorBacktestEngine:
+    """
+    向量化回测引擎
+
+    策略对象需要实现:
+        prepare(cube): 回测开始前用整个价格数组预计算指标
+        on_bars(t, pos, can_buy, can_sell) -> 目标仓位数组: 第t个交易日收盘时的决策,
+            只处理cube.active[:, t]为True的行, 不设置目标仓位的行为NaN
+    """
+
+    def __init__(self, rate: float, slippage: float, size: float, pricetick: float,
+                 tick_add: float = 1.0, limit_ratio: Optional[float] = 0.09):
+        """
+        Args:
+            rate: 手续费率
+            slippage: 每单位成交的滑点
+            size: 合约乘数(每手股数)
+            pricetick: 价格最小变动
+            tick_add: 挂单价相对收盘价的偏移, 与TargetPosTemplate.tick_add一致
+            limit_ratio: 涨跌停幅度, None表示不限制
+        """
+        self.rate = rate
+        self.slippage = slippage
+        self.size = size
+        self.pricetick = pricetick
+        self.tick_add = tick_add
+        self.limit_ratio = limit_ratio
+
+    def run(self, cube: PriceCube, strategy) -> VectorBacktestResult:
+        rows, days = cube.shape
+        size = self.size
+
+        if self.limit_ratio is None:
+            limit_up = limit_down = np.zeros(cube.shape, dtype=bool)
+        else:
+            locked = cube.low == cube.high
+            with np.errstate(invalid='ignore'):
+                limit_up = locked & (cube.prev_close * (1 + self.limit_ratio) <= cube.low)
+                limit_down = locked & (cube.prev_close * (1 - self.limit_ratio) >= cube.low)
+
+        strategy.prepare(cube)
+
+        pos = np.zeros(rows)
+        order_volume = np.zeros(rows)   # 挂单数量, 买为正卖为负, 0表示没有挂单
+        order_price = np.zeros(rows)
+        pre_close = np.zeros(rows)      # 上一根回测K线的收盘价, 第一天为0
+        daily = {column: np.full(cube.shape, np.nan) for column in DAILY_COLUMNS}
+        trades = []
+
+        for t in range(days):
+            active = cube.active[:, t]
+            open_price, high, low, close = cube.open[:, t], cube.high[:, t], cube.low[:, t], cube.close[:, t]
+
+            # 撮合上一根K线收盘时的挂单
+            with np.errstate(invalid='ignore'):
+                long_cross = active & (order_volume > 0) & (order_price >= low) & (low > 0)
+                short_cross = active & (order_volume < 0) & (order_price <= high) & (high > 0)
+            filled = long_cross | short_cross
+            trade_price = np.where(long_cross, np.minimum(order_price, open_price),
+                                   np.maximum(order_price, open_price))
+            change = np.where(filled, order_volume, 0.0)
+            for i in np.flatnonzero(filled):
+                trades.append(VectorTrade(int(i), cube.dates[t], 'LONG' if change[i] > 0 else 'SHORT',
+                                          trade_offset(pos[i], change[i]),
+                                          float(trade_price[i]), float(abs(change[i]))))
+
+            start_pos = pos.copy()
+            pos = pos + change
+            order_volume = np.where(filled, 0.0, order_volume)
+
+            # 逐日盈亏, 与vnpy的DailyResult.calculate_pnl一致
+            volume = np.abs(change)
+            turnover = np.where(filled, volume * size * trade_price, 0.0)
+            holding_pnl = start_pos * (close - np.where(pre_close != 0, pre_close, 1.0)) * size
+            trading_pnl = np.where(filled, change * (close - trade_price) * size, 0.0)
+            commission = turnover * self.rate
+            slippage = volume * size * self.slippage
+            total_pnl = trading_pnl + holding_pnl
+            values = {
+                'trade_count': filled.astype(float),
+                'turnover': turnover,
+                'commission': commission,
+                'slippage': slippage,
+                'trading_pnl': trading_pnl,
+                'holding_pnl': holding_pnl,
+                'total_pnl': total_pnl,
+                'net_pnl': total_pnl - commission - slippage,
+            }
+            for column, value in values.items():
+                daily[column][:, t] = np.where(active, value, np.nan)
+            pre_close = np.where(active, close, pre_close)
+
+            # 收盘后策略决策, 有挂单时先撤单, 否则按目标仓位挂单
+            target = strategy.on_bars(t, pos.copy(), ~limit_up[:, t], ~limit_down[:, t])
+            decided = active & ~np.isnan(target)
+            diff = np.where(decided, target - pos, 0.0)
+            blocked = ((diff > 0) & limit_up[:, t]) | ((diff < 0) & limit_down[:, t])
+            cancel = decided & (order_volume != 0)
+            send = decided & ~cancel & (diff != 0) & ~blocked
+            order_volume = np.where(cancel, 0.0, np.where(send, diff, order_volume))
+            # 挂单很少, 逐个按vnpy的Decimal方式取整, 保证挂单价完全一致
+            for i in np.flatnonzero(send):
+                price = close[i] + self.tick_add if diff[i] > 0 else close[i] - self.tick_add
+                order_price[i] = round_to(price, self.pricetick)
+
+        return VectorBacktestResult(cube, daily, trades)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+API服务器生产环境入口
+
+多个服务进程共享磁盘上的项目运行结果、任务状态和项目注册表版本,
+无论哪个进程处理请求看到的结果都一致。
+
+启动方式:
+    python wsgi.py --workers 4 --port 8800
+    或
+    gunicorn -w 4 -b 0.0.0.0:8800 --chdir project_noui wsgi:app
+
+Windows下没有gunicorn, 使用waitress单进程多线程运行
+"""
+
+import argparse
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+sys.path.append(os.path.dirname(current_dir))
+
+from api_server import app, load_projects
+
+# 每个服务进程导入时注册项目
+load_projects()
+
+application = app
+
+
+def run_gunicorn(host: str, port: int, workers: int, threads: int, timeout: int) -> None:
+    """以gunicorn多进程方式运行"""
+    from gunicorn.app.base import BaseApplication
+
+    class StandaloneApplication(BaseApplication):
+
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('timeout', timeout)
+            self.cfg.set('chdir', current_dir)
+
+        def load(self):
+            return app
+
+    StandaloneApplication().run()
+
+
+def run_waitress(host: str, port: int, threads: int) -> None:
+    """以waitress单进程多线程方式运行"""
+    from waitress import serve
+
+    serve(app, host=host, port=port, threads=threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API服务器生产环境入口')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='服务进程数')
+    parser.add_argument('--threads', type=int, default=4, help='每个进程的线程数')
+    parser.add_argument('--timeout', type=int, default=120, help='请求超时(秒)')
+    args = parser.parse_args()
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        print(f"🚀 启动API服务器 (waitress, 端口{args.port}, {args.threads}线程)...")
+        run_waitress(args.host, args.port, args.threads)
+        return
+
+    print(f"🚀 启动API服务器 (gunicorn, 端口{args.port}, {args.workers}进程 x {args.threads}线程)...")
+    run_gunicorn(args.host, args.port, args.workers, args.threads, args.timeout)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import numpy as np
 from vnpy_ctastrategy import (
     StopOrder,
     TickData,
@@ -185,4 +186,125 @@ class MonthlyMinMarketValueStrategy(TargetPosTemplate):
         rsi_signal_pos = self.rsi_signal.get_signal_pos()
 
         # print(f'ma_cross_signal_pos: {ma_cross_signal_pos}, ma_cross_10: {ma_cross_10}, ma_cross_20: {ma_cross_20}, rsi_signal_pos: {rsi_signal_pos}')
-        return ma_cross_signal_pos + rsi_signal_pos
\ No newline at end of file
+        return ma_cross_signal_pos + rsi_signal_pos
+
+def _talib_sma_tail(windows: np.ndarray, n: int):
+    """
+    talib.SMA(window, n)最后两个值, 按talib的滑动求和顺序逐列累加, 浮点结果与talib完全一致;
+    窗口长度等于n时倒数第二个值为NaN, 与talib相同(此时均线交叉永远不成立)
+
+    Args:
+        windows: K线数×窗口长度, 每行是一个ArrayManager的收盘价数组
+    """
+    length = windows.shape[1]
+    total = np.zeros(windows.shape[0])
+    for i in range(n - 1):
+        total = total + windows[:, i]
+    values = []
+    trailing = 0
+    for i in range(n - 1, length):
+        total = total + windows[:, i]
+        values.append(total / n)
+        total = total - windows[:, trailing]
+        trailing += 1
+    previous = values[-2] if len(values) > 1 else np.full(windows.shape[0], np.nan)
+    return values[-1], previous
+
+
+def _talib_rsi_tail(windows: np.ndarray, n: int) -> np.ndarray:
+    """talib.RSI(window, n)最后一个值, 按talib的Wilder平滑顺序逐列计算"""
+    gain = np.zeros(windows.shape[0])
+    loss = np.zeros(windows.shape[0])
+    for i in range(1, n + 1):
+        diff = windows[:, i] - windows[:, i - 1]
+        loss = np.where(diff < 0, loss - diff, loss)
+        gain = np.where(diff < 0, gain, gain + diff)
+    gain = gain / n
+    loss = loss / n
+    for i in range(n + 1, windows.shape[1]):
+        diff = windows[:, i] - windows[:, i - 1]
+        loss = loss * (n - 1)
+        gain = gain * (n - 1)
+        loss = np.where(diff < 0, loss - diff, loss)
+        gain = np.where(diff < 0, gain, gain + diff)
+        loss = loss / n
+        gain = gain / n
+    total = gain + loss
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where((total > -1e-8) & (total < 1e-8), 0.0, 100 * (gain / total))
+
+
+class MonthlyMinMarketValueVectorStrategy:
+    """
+    MonthlyMinMarketValueStrategy的向量化版本, 供vector_backtest.VectorBacktestEngine使用
+
+    价格数组的每行对应一次MonthlyMinMarketValueStrategy回测, 信号与原策略逐K线计算的结果一致:
+    预热K线只更新ArrayManager, RSI在不足20根时用补零的数组计算, 均线交叉在满20根后才更新。
+    """
+
+    window = 20
+
+    def __init__(self, initial_capital, current_month, size: float):
+        """
+        Args:
+            initial_capital: 每行的初始资金, 数组或标量
+            current_month: 每行的当前月份, 数组或标量
+            size: 合约乘数
+        """
+        self.initial_capital = initial_capital
+        self.current_month = current_month
+        self.size = size
+
+    def prepare(self, cube) -> None:
+        shape = cube.shape
+        rows = shape[0]
+        self.cube = cube
+        self.rsi_pos = np.zeros(shape)
+        self.cross_over = {10: np.zeros(shape, dtype=bool), 20: np.zeros(shape, dtype=bool)}
+        self.cross_below = {10: np.zeros(shape, dtype=bool), 20: np.zeros(shape, dtype=bool)}
+
+        # 每根K线时ArrayManager中的收盘价数组: 各行的K线向左压紧, 前面补零后取20根的滑动窗口
+        valid = ~np.isnan(cube.close)
+        row_index, _ = np.nonzero(valid)
+        position = (np.cumsum(valid, axis=1) - 1)[valid]
+        compact = np.zeros((rows, max(int(valid.sum(axis=1).max(initial=0)), 1)))
+        compact[row_index, position] = cube.close[valid]
+        padded = np.concatenate([np.zeros((rows, self.window - 1)), compact], axis=1)
+        windows = np.lib.stride_tricks.sliding_window_view(padded, self.window, axis=1)[row_index, position]
+
+        rsi = _talib_rsi_tail(windows, 14)
+        self.rsi_pos[valid] = np.where(rsi >= 70, 1, np.where(rsi <= 30, -1, 0))
+
+        inited = position >= self.window - 1
+        fast0, fast1 = _talib_sma_tail(windows, 5)
+        for slow_window in (10, 20):
+            slow0, slow1 = _talib_sma_tail(windows, slow_window)
+            self.cross_over[slow_window][valid] = inited & (fast0 > slow0) & (fast1 < slow1)
+            self.cross_below[slow_window][valid] = inited & (fast0 < slow0) & (fast1 > slow1)
+
+        self.capital = np.broadcast_to(np.asarray(self.initial_capital, dtype=float), (rows,))
+        self.month = np.broadcast_to(np.asarray(self.current_month), (rows,)).copy()
+        self.buyed = np.zeros(rows, dtype=bool)
+        self.ma_cross_10 = np.zeros(rows)
+        self.ma_cross_20 = np.zeros(rows)
+
+    def on_bars(self, t: int, pos: np.ndarray, can_buy: np.ndarray, can_sell: np.ndarray) -> np.ndarray:
+        active = self.cube.active[:, t]
+        close = self.cube.close[:, t]
+
+        for slow_window, signal in ((10, self.ma_cross_10), (20, self.ma_cross_20)):
+            signal[active & self.cross_over[slow_window][:, t]] = 1
+            signal[active & self.cross_below[slow_window][:, t]] = 0
+        signal = np.where(self.ma_cross_10 != 0, self.ma_cross_10, self.ma_cross_20) + self.rsi_pos[:, t]
+
+        target = np.full(len(pos), np.nan)
+        buy = active & ~self.buyed & can_buy & (signal >= 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            target[buy] = np.floor_divide(self.capital, self.size * close)[buy]
+        self.buyed |= buy
+
+        month = self.cube.dates[t].month
+        sell = active & self.buyed & (pos > 0) & can_sell & ((month > self.month) | (signal <= -1))
+        target[sell] = 0
+        self.month[sell] = month
+        return target
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 测试从仓库根目录和project_noui按模块名导入, 与各入口脚本的sys.path设置一致
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for path in (ROOT_DIR, os.path.join(ROOT_DIR, "project_noui")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
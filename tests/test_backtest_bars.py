@@ -0,0 +1,99 @@
+import contextlib
+import io
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from vnpy.trader.constant import Exchange, Interval
+from vnpy.trader.database import DB_TZ
+
+import projects.monthly_min_market_value as project_module
+from backtest_bars import BarStore
+from projects.monthly_min_market_value import MonthlyMinMarketValueProject, WARMUP_DAYS, end_of_day
+
+DATES = pd.bdate_range("2023-12-01", "2024-12-31").to_pydatetime()
+
+
+def make_rows(symbols):
+    rows = {}
+    for n, symbol in enumerate(symbols):
+        rows[symbol] = [(symbol, "SZSE", dt, 1000.0 + k, None, 0, 10.0 + n, 11.0 + n, 9.0 + n, 10.5 + n)
+                        for k, dt in enumerate(DATES)]
+    return rows
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = []
+
+    def execute(self, query, args):
+        *symbols, start, end = args
+        self.connection.queries.append((tuple(symbols), start, end))
+        self.result = [bar for symbol in symbols for bar in self.connection.rows.get(symbol, [])
+                       if start <= bar[2] <= end]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+def test_bars_match_vnpy_bar_data():
+    store = BarStore()
+    store.load(FakeConnection(make_rows(["000001"])), ["000001"], datetime(2024, 1, 1), datetime(2024, 1, 31))
+
+    bars = store.bars("000001", "SZSE", datetime(2024, 1, 2), datetime(2024, 1, 3))
+
+    assert [bar.datetime for bar in bars] == [datetime(2024, 1, 2, tzinfo=DB_TZ), datetime(2024, 1, 3, tzinfo=DB_TZ)]
+    bar = bars[0]
+    assert (bar.symbol, bar.exchange, bar.interval, bar.gateway_name) == ("000001", Exchange.SZSE, Interval.DAILY, "DB")
+    assert (bar.open_price, bar.high_price, bar.low_price, bar.close_price) == (10.0, 11.0, 9.0, 10.5)
+    assert (bar.volume, bar.turnover, bar.open_interest) == (1022.0, 0.0, 0.0)
+    assert store.bars("000001", "SZSE", datetime(2023, 12, 29), datetime(2024, 1, 3)) is None
+    assert store.subset("000001", "SZSE", datetime(2024, 1, 2), datetime(2024, 1, 3)).bars(
+        "000001", "SZSE", datetime(2024, 1, 2), datetime(2024, 1, 3)) == bars
+
+
+def test_load_ranges_groups_symbols_by_range():
+    connection = FakeConnection(make_rows(["000001", "000002", "000003"]))
+    january = (datetime(2024, 1, 1), datetime(2024, 1, 31))
+    ranges = {"000001": january, "000002": january, "000003": (datetime(2024, 6, 1), datetime(2024, 6, 30))}
+
+    store = BarStore()
+    store.load_ranges(connection, ranges)
+
+    assert sorted(connection.queries) == [
+        (("000001", "000002"),) + january,
+        (("000003",), datetime(2024, 6, 1), datetime(2024, 6, 30)),
+    ]
+    assert store.bars("000003", "SZSE", *january) is None
+
+
+def test_prepare_months_loads_each_symbol_over_its_own_windows(monkeypatch):
+    connection = FakeConnection(make_rows(["000001", "000002"]))
+    monkeypatch.setattr(project_module, "get_connection", lambda: contextlib.nullcontext(connection))
+    picks = {1: ["000001"], 2: ["000001"], 6: ["000002"]}
+    monkeypatch.setattr(MonthlyMinMarketValueProject, "get_min_market_value",
+                        lambda self, year, month, versions=None: [{"symbol": s} for s in picks.get(month, [])])
+
+    windows = [(datetime(2024, m, 1), None, datetime(2024, m + 2, 9)) for m in (1, 2, 6)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        candidates, store = MonthlyMinMarketValueProject().prepare_months(windows)
+
+    assert candidates == [[{"symbol": "000001"}], [{"symbol": "000001"}], [{"symbol": "000002"}]]
+    assert sorted(connection.queries) == [
+        (("000001",), datetime(2024, 1, 1) - timedelta(days=WARMUP_DAYS), end_of_day(datetime(2024, 4, 9))),
+        (("000002",), datetime(2024, 6, 1) - timedelta(days=WARMUP_DAYS), end_of_day(datetime(2024, 8, 9))),
+    ]
+    assert store.bars("000002", "SZSE", datetime(2024, 1, 2), datetime(2024, 1, 31)) is None
@@ -0,0 +1,43 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import backtest_pool
+from backtest_pool import BacktestPool, set_default_max_workers
+from job_manager import JobManager
+
+
+@pytest.fixture(autouse=True)
+def reset_default():
+    yield
+    set_default_max_workers(None)
+
+
+def pool_size():
+    return BacktestPool().max_workers
+
+
+def test_default_is_cpu_count():
+    assert BacktestPool().max_workers == (os.cpu_count() or 1)
+
+
+def test_default_follows_process_setting():
+    set_default_max_workers(3)
+    assert BacktestPool().max_workers == 3
+    assert BacktestPool(1).max_workers == 1
+
+
+def test_job_workers_share_cpus(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 16)
+    assert JobManager().backtest_workers == 2
+    assert JobManager(max_workers=4).backtest_workers == 4
+    assert JobManager(max_workers=32).backtest_workers == 1
+
+
+def test_initializer_applies_in_spawned_worker():
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context,
+                             initializer=backtest_pool.set_default_max_workers, initargs=(2,)) as executor:
+        assert executor.submit(pool_size).result() == 2
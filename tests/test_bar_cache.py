@@ -0,0 +1,134 @@
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bar_cache import BAR_COLUMNS, BarCache
+from response_formats import make_bars_response
+
+
+def make_frame(start, end):
+    """[start, end)内每个自然日一根K线, 价格只取决于日期, 与查询区间无关"""
+    index = pd.date_range(start, end, freq='D', inclusive='left', name='datetime')
+    close = index.dayofyear.to_numpy(dtype=np.float64)
+    return pd.DataFrame({column: close for column in BAR_COLUMNS}, index=index)
+
+
+class CountingLoader:
+    """记录每次补查区间的loader"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, table, symbol, start, end):
+        self.calls.append((start, end))
+        return make_frame(start, end)
+
+
+@pytest.mark.parametrize("start, end", [
+    (datetime(2024, 1, 5), datetime(2024, 1, 5)),
+    (datetime(2024, 1, 6), datetime(2024, 1, 5)),
+])
+def test_empty_range_keeps_bar_columns(start, end):
+    df = BarCache().get('daily_hfq', '000001', start, end, CountingLoader())
+
+    assert df.empty
+    assert list(df.columns) == BAR_COLUMNS
+    assert json.loads(make_bars_response(df, 'rows').get_data()) == {'bars': []}
+
+
+def day(n):
+    return datetime(2024, 1, n)
+
+
+def assert_frame(df, start, end):
+    pd.testing.assert_frame_equal(df, make_frame(start, end), check_freq=False)
+
+
+def test_full_hit():
+    cache, loader = BarCache(), CountingLoader()
+    cache.get('daily_hfq', '000001', day(1), day(20), loader)
+
+    df = cache.get('daily_hfq', '000001', day(5), day(10), loader)
+
+    assert_frame(df, day(5), day(10))
+    assert loader.calls == [(day(1), day(20))]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+@pytest.mark.parametrize("start, end, gap", [
+    (day(5), day(15), (day(10), day(15))),    # 右侧超出
+    (day(1), day(10), (day(1), day(5))),      # 左侧超出
+])
+def test_partial_overlap_loads_only_missing_side(start, end, gap):
+    cache, loader = BarCache(), CountingLoader()
+    cache.get('daily_hfq', '000001', day(5), day(10), loader)
+
+    df = cache.get('daily_hfq', '000001', start, end, loader)
+
+    assert_frame(df, start, end)
+    assert loader.calls[1:] == [gap]
+    assert cache.partial_hits == 1
+    assert len(cache._entries[('daily_hfq', '000001')]) == 1
+
+
+def test_gap_in_middle_is_loaded_and_merged():
+    cache, loader = BarCache(), CountingLoader()
+    cache.get('daily_hfq', '000001', day(1), day(5), loader)
+    cache.get('daily_hfq', '000001', day(10), day(15), loader)
+
+    df = cache.get('daily_hfq', '000001', day(1), day(15), loader)
+
+    assert_frame(df, day(1), day(15))
+    assert loader.calls[2:] == [(day(5), day(10))]
+    segments = cache._entries[('daily_hfq', '000001')]
+    assert [(seg.start, seg.end) for seg in segments] == [(day(1), day(15))]
+
+
+def test_adjacent_segments_merge():
+    cache, loader = BarCache(), CountingLoader()
+    cache.get('daily_hfq', '000001', day(1), day(5), loader)
+    cache.get('daily_hfq', '000001', day(5), day(9), loader)
+
+    segments = cache._entries[('daily_hfq', '000001')]
+    assert [(seg.start, seg.end) for seg in segments] == [(day(1), day(9))]
+    assert_frame(cache.get('daily_hfq', '000001', day(2), day(8), loader), day(2), day(8))
+    assert len(loader.calls) == 2
+
+
+def test_separate_segments_stay_apart():
+    cache, loader = BarCache(), CountingLoader()
+    cache.get('daily_hfq', '000001', day(1), day(5), loader)
+    cache.get('daily_hfq', '000001', day(10), day(15), loader)
+
+    segments = cache._entries[('daily_hfq', '000001')]
+    assert [(seg.start, seg.end) for seg in segments] == [(day(1), day(5)), (day(10), day(15))]
+
+
+def test_eviction_over_byte_limit_drops_least_recently_used():
+    loader = CountingLoader()
+    entry_bytes = BarCache()
+    entry_bytes.get('daily_hfq', 'probe', day(1), day(20), loader)
+    size = entry_bytes.stats()['bytes']
+
+    cache = BarCache(max_bytes=size * 2)
+    cache.get('daily_hfq', 'a', day(1), day(20), loader)
+    cache.get('daily_hfq', 'b', day(1), day(20), loader)
+    cache.get('daily_hfq', 'a', day(1), day(20), loader)   # a变为最近使用
+    cache.get('daily_hfq', 'c', day(1), day(20), loader)
+
+    assert set(cache._entries) == {('daily_hfq', 'a'), ('daily_hfq', 'c')}
+    assert cache.evictions == 1
+    assert cache.stats()['bytes'] <= cache.max_bytes
+
+
+def test_empty_range_after_cached_segment_keeps_columns():
+    cache, loader = BarCache(), CountingLoader()
+    cache.get('daily_hfq', '000001', day(1), day(5), loader)
+
+    df = cache.get('daily_hfq', '000001', day(3), day(3), loader)
+
+    assert df.empty and list(df.columns) == BAR_COLUMNS
+    assert len(loader.calls) == 1
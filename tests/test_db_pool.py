@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+from mysql.connector import errors
+
+from tools import db_pool
+
+
+class StubConnection:
+    def __init__(self):
+        self.closed = False
+
+    def ping(self, reconnect=True, attempts=1, delay=0):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class ExhaustedPool:
+    """前failures次取连接时池已耗尽"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def get_connection(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise errors.PoolError("Failed getting connection; pool exhausted")
+        return StubConnection()
+
+
+@pytest.fixture
+def stub_pool(monkeypatch):
+    def install(pool):
+        monkeypatch.setattr(db_pool, "get_pool", lambda: pool)
+        monkeypatch.setattr(db_pool, "CHECKOUT_RETRY_INTERVAL", 0.001)
+        return pool
+    return install
+
+
+def test_checkout_waits_for_exhausted_pool(stub_pool):
+    pool = stub_pool(ExhaustedPool(failures=3))
+    with db_pool.get_connection(timeout=5) as connection:
+        assert isinstance(connection, StubConnection)
+    assert pool.calls == 4
+    assert connection.closed
+
+
+def test_checkout_raises_pool_error_after_timeout(stub_pool):
+    stub_pool(ExhaustedPool(failures=10 ** 9))
+    with pytest.raises(errors.PoolError):
+        db_pool._checkout(timeout=0.02)
+
+
+def test_checkout_gets_connection_released_by_other_thread(stub_pool):
+    released = threading.Event()
+
+    class Pool:
+        def get_connection(self):
+            if not released.is_set():
+                raise errors.PoolError("pool exhausted")
+            return StubConnection()
+
+    stub_pool(Pool())
+    timer = threading.Timer(0.02, released.set)
+    timer.start()
+    try:
+        assert isinstance(db_pool._checkout(timeout=5), StubConnection)
+    finally:
+        timer.cancel()
@@ -0,0 +1,183 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from indicator_tools import compute_indicator_series, parse_indicator_spec
+from tools import indicator_store as store
+
+TABLE = "daily_hfq"
+SYMBOL = "000001"
+
+
+def make_bars(count=1000, seed=3):
+    rng = np.random.default_rng(seed)
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, count)))
+    start = datetime(2020, 1, 1)
+    return [(start + timedelta(days=k), float(c)) for k, c in enumerate(close)]
+
+
+class FakeDatabase:
+    """按indicator_store用到的语句模拟K线表、物化指标表和状态表"""
+
+    def __init__(self, bars=()):
+        self.bars = {dt: close for dt, close in bars}
+        self.values = {}    # (table, symbol, spec, datetime) -> (value1, value2, value3)
+        self.states = {}    # (table, symbol, spec) -> (version, first_date, last_date, bar_count, state)
+        self.deletes = 0
+
+    def stored_rows(self):
+        return sorted(self.values.items())
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.result = []
+
+    def execute(self, sql, args=()):
+        db = self.db
+        sql = " ".join(sql.split())
+        if sql.startswith("CREATE"):
+            self.result = []
+        elif sql.startswith("SELECT spec, version, first_date, last_date, bar_count, state"):
+            table, symbol = args
+            self.result = [(k[2],) + v for k, v in db.states.items() if k[:2] == (table, symbol)]
+        elif sql.startswith("SELECT spec, version, first_date, last_date FROM"):
+            table, symbol, *specs = args
+            self.result = [(k[2],) + v[:3] for k, v in db.states.items() if k[:2] == (table, symbol) and k[2] in specs]
+        elif sql.startswith("DELETE"):
+            db.deletes += 1
+            for key in [k for k in db.values if k[:3] == tuple(args)]:
+                del db.values[key]
+        elif sql.startswith("SELECT datetime, close_price"):
+            since = args[1] if len(args) > 1 else None
+            self.result = [(dt, c) for dt, c in sorted(db.bars.items()) if since is None or dt > since]
+        elif sql.startswith("SELECT datetime FROM"):
+            table, symbol, spec, offset = args
+            dates = sorted(k[3] for k in db.values if k[:3] == (table, symbol, spec))
+            self.result = [(dates[offset],)] if offset < len(dates) else []
+        elif sql.startswith("SELECT spec, datetime, value1"):
+            table, symbol, *specs, begin, end = args
+            self.result = sorted((k[2], k[3]) + v for k, v in db.values.items()
+                                 if k[:2] == (table, symbol) and k[2] in specs and begin <= k[3] < end)
+            self.result.sort(key=lambda row: row[1])
+        else:
+            raise AssertionError(f"unexpected SQL: {sql}")
+
+    def executemany(self, sql, records):
+        db = self.db
+        for record in records:
+            if sql.lstrip().startswith(f"INSERT INTO {store.STORE_TABLE} "):
+                db.values[record[:4]] = record[4:]
+            elif sql.lstrip().startswith(f"INSERT INTO {store.STATE_TABLE} "):
+                db.states[record[:3]] = record[3:]
+            else:
+                raise AssertionError(f"unexpected SQL: {sql}")
+
+    def fetchall(self):
+        return self.result
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def reset_tables_checked(monkeypatch):
+    monkeypatch.setattr(store, "_tables_checked", False)
+
+
+def full_build(bars):
+    db = FakeDatabase(bars)
+    store.refresh_indicators(FakeConnection(db), TABLE, SYMBOL)
+    return db
+
+
+def stored_states(db):
+    """状态表中除流式状态外的字段"""
+    return {key: value[:4] for key, value in db.states.items()}
+
+
+def test_incremental_import_matches_full_build():
+    bars = make_bars()
+    db = FakeDatabase(bars[:600])
+    connection = FakeConnection(db)
+    store.refresh_indicators(connection, TABLE, SYMBOL)
+    deletes = db.deletes
+
+    db.bars.update(bars[600:])
+    store.refresh_indicators(connection, TABLE, SYMBOL, since=bars[600][0])
+
+    expected = full_build(bars)
+    assert db.deletes == deletes
+    assert db.stored_rows() == expected.stored_rows()
+    assert stored_states(db) == stored_states(expected)
+
+
+@pytest.mark.parametrize("offset", [0, 1])
+def test_write_at_or_before_last_date_rebuilds(offset):
+    bars = make_bars()
+    db = FakeDatabase(bars)
+    connection = FakeConnection(db)
+    store.refresh_indicators(connection, TABLE, SYMBOL)
+
+    # 修改已处理区间内的K线(最后一根或更早), 增量计算会漏掉这次修改
+    changed = bars[-1 - offset][0]
+    db.bars[changed] *= 1.05
+    store.refresh_indicators(connection, TABLE, SYMBOL, since=changed)
+
+    expected = full_build(sorted(db.bars.items()))
+    assert db.stored_rows() == expected.stored_rows()
+    assert stored_states(db) == stored_states(expected)
+
+
+@pytest.mark.parametrize("text", ["ma5", "rsi", "macd", "all_ma", "ma5;rsi:6", "ma:30", "macd:12,26,9", "boll:20,2"])
+@pytest.mark.parametrize("start_index", [0, 300])
+def test_load_indicators_matches_compute(text, start_index):
+    bars = make_bars()
+    db = full_build(bars)
+    specs = parse_indicator_spec(text)
+    start, end = bars[start_index][0], bars[900][0]
+
+    loaded = store.load_indicators(FakeConnection(db), TABLE, SYMBOL, specs, start, end, last_bar=bars[-1][0])
+
+    times = np.array([dt for dt, _ in bars], dtype="datetime64[s]").astype(np.int64)
+    close = np.array([c for _, c in bars])
+    expected_times, expected, single = compute_indicator_series(
+        times, close, specs, start_time=np.datetime64(start, "s").astype(np.int64),
+        end_time=np.datetime64(end, "s").astype(np.int64))
+    if loaded is None:
+        # 旧版MACD在物化数据开始之前就有输出, 这部分只能从K线计算
+        assert text == "macd" and start_index == 0
+        return
+    out_times, series, out_single = loaded
+    np.testing.assert_array_equal(out_times, expected_times)
+    assert out_single == single
+    assert list(series) == list(expected)
+    for key in expected:
+        np.testing.assert_allclose(series[key], expected[key], rtol=1e-9)
+
+
+def test_stale_store_falls_back_with_warning(capsys):
+    bars = make_bars()
+    db = full_build(bars[:600])
+    db.bars.update(bars[600:])
+    specs = parse_indicator_spec("ma:5")
+
+    assert store.load_indicators(FakeConnection(db), TABLE, SYMBOL, specs, bars[0][0], bars[900][0],
+                                 last_bar=bars[-1][0]) is None
+    assert "[WARN] 物化指标落后于K线" in capsys.readouterr().out
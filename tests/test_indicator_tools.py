@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from indicator_tools import (
+    INDICATOR_KEYS, INDICATOR_WARMUP_BARS, calculate_indicator_arrays, compute_indicator_series,
+    indicator_warmup_bars, parse_indicator_spec
+)
+
+
+def make_bars(count=1500, seed=7):
+    rng = np.random.default_rng(seed)
+    times = np.arange(count, dtype=np.int64) * 86400 + 1262304000
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, count)))
+    return times, close
+
+
+@pytest.mark.parametrize("text", ["ma5", "rsi", "macd", "all_ma", "ma5;rsi;macd"])
+def test_legacy_names_keep_100_bar_start(text):
+    times, close = make_bars()
+    out_times, series, _ = compute_indicator_series(times, close, parse_indicator_spec(text))
+
+    assert len(out_times) == 1500 - INDICATOR_WARMUP_BARS
+    assert all(len(values) == 1400 for values in series.values())
+
+
+def test_legacy_names_match_calculate_indicator_arrays():
+    times, close = make_bars()
+    expected_times, expected = calculate_indicator_arrays(times, close)
+    for key in INDICATOR_KEYS:
+        out_times, series, _ = compute_indicator_series(times, close, parse_indicator_spec(key))
+
+        np.testing.assert_array_equal(out_times, expected_times)
+        # MACD信号线的平滑初值与talib.MACD不同, 只在开头有微小残余
+        np.testing.assert_allclose(series[key], expected[key], rtol=1e-10, atol=1e-5)
+
+
+def test_parameterized_specs_start_after_own_warmup():
+    times, close = make_bars()
+    specs = parse_indicator_spec("ma:5")
+    out_times, series, single = compute_indicator_series(times, close, specs)
+
+    assert single == "ma:5"
+    assert len(out_times) == 1500 - specs[0].warmup_bars
+
+
+def test_legacy_warmup_covers_output_start_and_stable_values():
+    assert indicator_warmup_bars(parse_indicator_spec("ma5")) == INDICATOR_WARMUP_BARS
+    macd = parse_indicator_spec("macd")
+    assert indicator_warmup_bars(macd) == macd[0].warmup_bars > INDICATOR_WARMUP_BARS
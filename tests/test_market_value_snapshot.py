@@ -0,0 +1,232 @@
+from datetime import date, datetime
+from itertools import count
+
+import pytest
+
+from tools import market_value_snapshot as snapshot
+
+FINANCE = [
+    ("000001", "平安银行", "深市", datetime(2024, 3, 29), 1000.0),
+    ("000002", "万科A", "深市", datetime(2024, 3, 29), 2000.0),
+    ("000004", "ST国华", "深市", datetime(2024, 3, 29), 100.0),
+    ("000005", "世纪星源", "深市", datetime(2024, 3, 29), 500.0),
+    ("000001", "平安银行", "深市", datetime(2024, 6, 28), 1000.0),
+    ("000002", "万科A", "深市", datetime(2024, 6, 28), 2000.0),
+]
+
+DAILY = [
+    ("000001", "SZSE", datetime(2024, 3, 28), 10.0),
+    ("000001", "SZSE", datetime(2024, 3, 29), 11.0),
+    ("000002", "SZSE", datetime(2024, 3, 29), 8.0),
+    ("000004", "SZSE", datetime(2024, 3, 29), 3.0),
+    ("000005", "SZSE", datetime(2024, 3, 29), 4.0),
+    ("000001", "SZSE", datetime(2024, 6, 28), 12.0),
+    ("000002", "SZSE", datetime(2024, 6, 28), 5.0),
+]
+
+
+def as_datetime(value):
+    """MySQL按时间比较DATE和DATETIME"""
+    return value if isinstance(value, datetime) else datetime(value.year, value.month, value.day)
+
+
+class FakeDatabase:
+    """按market_value_snapshot用到的语句模拟finance、daily、快照表和状态表"""
+
+    def __init__(self):
+        self.snapshots = {}     # (symbol, report_month) -> 行
+        self.states = {}        # report_month -> updated_at
+        self.clock = count(1)
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.result = []
+
+    @staticmethod
+    def _since(sql, args, column):
+        return args[-1] if f"{column} >=" in sql else None
+
+    def execute(self, sql, args=()):
+        db = self.db
+        self.result = []
+        args = tuple(as_datetime(a) if isinstance(a, date) else a for a in args)
+        if sql.lstrip().startswith("CREATE"):
+            return
+        if "FROM finance" in sql:
+            rows = FINANCE
+            if "WHERE symbol" in sql:
+                since = self._since(sql, args, "update_time")
+                rows = [r for r in rows if r[0] == args[0] and (since is None or r[3] >= since)]
+            else:
+                rows = [r for r in rows if args[0] <= r[3] < args[1]]
+            self.result = list(rows)
+        elif f"FROM `{snapshot.DAILY_TABLE}`" in sql:
+            rows = DAILY
+            if "WHERE symbol" in sql:
+                since = self._since(sql, args, "datetime")
+                rows = [r for r in rows if r[0] == args[0] and (since is None or r[2] >= since)]
+            else:
+                rows = [r for r in rows if args[0] <= r[2] < args[1]]
+            self.result = list(rows)
+        elif sql.startswith("SELECT DISTINCT report_month"):
+            since = args[1] if len(args) > 1 else None
+            self.result = sorted({(month,) for symbol, month in db.snapshots
+                                  if symbol == args[0] and (since is None or as_datetime(month) >= since)})
+        elif sql.startswith("DELETE"):
+            if "WHERE symbol" in sql:
+                since = args[1] if len(args) > 1 else None
+                keys = [k for k in db.snapshots if k[0] == args[0] and (since is None or as_datetime(k[1]) >= since)]
+            else:
+                keys = [k for k in db.snapshots if as_datetime(k[1]) == args[0]]
+            for key in keys:
+                del db.snapshots[key]
+        elif sql.startswith("SELECT 1"):
+            self.result = [(1,)] if args[0].date() in db.states else []
+        elif sql.startswith("SELECT report_month, updated_at"):
+            self.result = list(db.states.items())
+        elif "ORDER BY market_value" in sql:
+            month, market, exchange, prefix = args[:4]
+            rows = [r for r in db.snapshots.values()
+                    if as_datetime(r[1]) == month and r[3] == market and r[4] == exchange and not r[10] and not r[11]
+                    and r[0].startswith(prefix[:-1])]
+            self.result = [(r[0], r[2], r[9]) for r in sorted(rows, key=lambda r: r[9])]
+            if "LIMIT" in sql:
+                self.result = self.result[:args[4]]
+        else:
+            raise AssertionError(f"unexpected SQL: {sql}")
+
+    def executemany(self, sql, records):
+        db = self.db
+        for record in records:
+            if sql.lstrip().startswith(f"INSERT INTO `{snapshot.SNAPSHOT_TABLE}`"):
+                db.snapshots[record[:2]] = record
+            elif sql.startswith(f"INSERT INTO `{snapshot.STATE_TABLE}`"):
+                db.states[record[0]] = next(db.clock)
+            elif sql.startswith(f"UPDATE `{snapshot.STATE_TABLE}`"):
+                if record[0] in db.states:
+                    db.states[record[0]] = next(db.clock)
+            else:
+                raise AssertionError(f"unexpected SQL: {sql}")
+
+    def fetchall(self):
+        return self.result
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    monkeypatch.setattr(snapshot, "_table_created", False)
+    monkeypatch.setattr(snapshot, "_checked_months", set())
+    return FakeConnection(FakeDatabase())
+
+
+MARCH = date(2024, 3, 1)
+JUNE = date(2024, 6, 1)
+
+
+def test_symbol_refresh_does_not_mark_unbuilt_month(connection):
+    snapshot.refresh_symbol_snapshots(connection, "000001", since=datetime(2024, 3, 1))
+
+    assert set(connection.db.snapshots) == {("000001", MARCH), ("000001", JUNE)}
+    assert MARCH not in snapshot.snapshot_versions(connection)
+
+    # 该月份从未全量生成, 选股时生成全部标的而不是只返回增量导入的标的
+    selected = snapshot.select_market_values(connection, MARCH)
+    assert [row["symbol"] for row in selected] == ["000005", "000001", "000002"]
+    assert MARCH in snapshot.snapshot_versions(connection)
+
+
+def test_symbol_refresh_bumps_built_month(connection):
+    snapshot.refresh_month_snapshots(connection, [MARCH])
+    before = snapshot.snapshot_versions(connection)[MARCH]
+
+    snapshot.refresh_symbol_snapshots(connection, "000001", since=datetime(2024, 3, 1))
+
+    assert snapshot.snapshot_versions(connection)[MARCH] != before
+    assert connection.db.snapshots[("000001", MARCH)][6] == datetime(2024, 3, 29)
+
+
+def symbols(values):
+    return [value["symbol"] for value in values]
+
+
+def test_selection_cache_hits_while_version_unchanged(connection):
+    snapshot.refresh_month_snapshots(connection, [MARCH])
+    cache = snapshot.SelectionCache()
+
+    first = cache.select(connection, MARCH, top_n=2)
+    second = cache.select(connection, MARCH, top_n=2, versions=snapshot.snapshot_versions(connection))
+
+    assert symbols(first) == symbols(second) == ["000005", "000001"]
+    assert (cache.hits, cache.misses) == (1, 1)
+    # 不同选股参数是不同的缓存条目
+    cache.select(connection, MARCH, top_n=3)
+    assert cache.misses == 2
+
+
+@pytest.mark.parametrize("refresh", [
+    lambda connection: snapshot.refresh_symbol_snapshots(connection, "000001", since=datetime(2024, 6, 1)),
+    lambda connection: snapshot.refresh_month_snapshots(connection, [datetime(2024, 6, 15)]),
+])
+def test_selection_cache_invalidates_only_refreshed_month(connection, refresh):
+    snapshot.refresh_month_snapshots(connection, [MARCH, JUNE])
+    cache = snapshot.SelectionCache()
+    cache.select(connection, MARCH)
+    cache.select(connection, JUNE)
+
+    refresh(connection)
+    versions = snapshot.snapshot_versions(connection)
+    cache.select(connection, MARCH, versions=versions)
+    cache.select(connection, JUNE, versions=versions)
+
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_selection_cache_resolves_version_of_unbuilt_month(connection):
+    cache = snapshot.SelectionCache()
+    versions = snapshot.snapshot_versions(connection)
+    assert MARCH not in versions
+
+    selected = cache.select(connection, MARCH, versions=versions)
+
+    assert symbols(selected) == ["000005", "000001", "000002"]
+    assert versions[MARCH] == snapshot.snapshot_versions(connection)[MARCH]
+    cache.select(connection, MARCH, versions=versions)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_selection_cache_persists_across_instances(connection, tmp_path):
+    path = str(tmp_path / "selections.json")
+    snapshot.refresh_month_snapshots(connection, [MARCH])
+    versions = snapshot.snapshot_versions(connection)
+    expected = snapshot.SelectionCache(path).select(connection, MARCH, versions=versions)
+
+    # 命中时不使用数据库连接
+    cache = snapshot.SelectionCache(path)
+    assert cache.select(None, MARCH, versions=versions) == expected
+    assert (cache.hits, cache.misses) == (1, 0)
+
+    # 版本变化后磁盘上的结果同样失效
+    snapshot.refresh_month_snapshots(connection, [MARCH])
+    snapshot.SelectionCache(path).select(connection, MARCH, versions=snapshot.snapshot_versions(connection))
+    stale = snapshot.SelectionCache(path)
+    stale.select(connection, MARCH, versions=versions)
+    assert stale.misses == 1
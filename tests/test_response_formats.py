@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+import response_formats
+
+PAYLOAD = {
+    'symbol': '平安银行',
+    'times': np.array([1, 2, 3], dtype=np.int64),
+    'ma5': np.array([np.nan, 1.5, np.inf]),
+    'rows': [{'value': float('nan'), 'count': np.int64(3)}, {'value': np.float64(-np.inf), 'count': 0}],
+    'single': True,
+    'last': np.float32(0.5),
+}
+
+
+def fallback_body(monkeypatch, payload):
+    monkeypatch.setattr(response_formats, 'orjson', None)
+    return response_formats.json_response(payload).get_data()
+
+
+def test_fallback_writes_null_for_non_finite(monkeypatch):
+    body = fallback_body(monkeypatch, PAYLOAD)
+
+    assert b'NaN' not in body and b'Infinity' not in body
+    assert b'"ma5":[null,1.5,null]' in body
+
+
+@pytest.mark.skipif(response_formats.orjson is None, reason='需要安装orjson')
+def test_fallback_matches_orjson(monkeypatch):
+    expected = response_formats.json_response(PAYLOAD).get_data()
+
+    assert fallback_body(monkeypatch, PAYLOAD) == expected
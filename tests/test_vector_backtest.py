@@ -0,0 +1,112 @@
+import contextlib
+import io
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest_bars import BarStore
+from backtest_pool import BacktestPool
+from projects.monthly_min_market_value import MonthlyMinMarketValueProject
+from vector_backtest import trade_offset
+
+SYMBOLS = [f"{i:06d}" for i in range(1, 21)]
+
+
+def make_rows(seed=5):
+    """随机日线, 含停牌和涨跌停封板"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2023-11-01", "2024-06-30").to_pydatetime()
+    rows = {}
+    for symbol in SYMBOLS:
+        close = np.round(10 * np.exp(np.cumsum(rng.normal(0, 0.04, len(dates)))), 2)
+        open_price = np.round(close * rng.uniform(0.97, 1.03, len(close)), 2)
+        high = np.maximum(open_price, close) * 1.01
+        low = np.minimum(open_price, close) * 0.99
+        bars = []
+        for k, dt in enumerate(dates):
+            if rng.random() < 0.05:
+                continue
+            o, h, l, c = open_price[k], high[k], low[k], close[k]
+            if k > 0 and rng.random() < 0.04:
+                c = o = h = l = close[k] = round(close[k - 1] * 1.1, 2)
+            elif k > 0 and rng.random() < 0.04:
+                c = o = h = l = close[k] = round(close[k - 1] * 0.9, 2)
+            bars.append((symbol, "SZSE", dt, 1e5, 1e6, 0, o, h, l, c))
+        rows[symbol] = bars
+    return rows
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.result = []
+
+    def execute(self, query, args):
+        *symbols, start, end = args
+        self.result = [bar for symbol in symbols for bar in self.rows[symbol] if start <= bar[2] <= end]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return FakeCursor(self.rows)
+
+
+@pytest.fixture(scope="module")
+def bar_store():
+    store = BarStore()
+    store.load(FakeConnection(make_rows()), SYMBOLS, datetime(2023, 12, 1), datetime(2024, 6, 30, 23, 59, 59))
+    return store
+
+
+def run_month(bar_store, vectorized, start, end, capital):
+    project = MonthlyMinMarketValueProject(max_workers=1, vectorized=vectorized)
+    candidates = [{"symbol": symbol} for symbol in SYMBOLS]
+    with contextlib.redirect_stdout(io.StringIO()):
+        if vectorized:
+            dfs, profits = project.run_month_vectorized(bar_store, candidates, start, end, capital)
+        else:
+            with BacktestPool(max_workers=1) as pool:
+                dfs, profits = project.run_month_vnpy(pool, bar_store, candidates, start, end, capital)
+    return project.trades, dfs, profits
+
+
+def trade_key(trade):
+    return trade["symbol"], trade["time"], trade["direction"], trade["offset"], trade["price"], trade["volume"]
+
+
+def test_trade_offset():
+    assert trade_offset(0, 100) == "OPEN"
+    assert trade_offset(100, 100) == "OPEN"
+    assert trade_offset(100, -100) == "CLOSE"
+    assert trade_offset(-100, 100) == "CLOSE"
+
+
+@pytest.mark.parametrize("month", [1, 2, 3])
+def test_vectorized_matches_vnpy(bar_store, month):
+    start = datetime(2024, month, 1)
+    end = datetime(2024, month + 2, 9)
+    capital = 100000 + month * 1000
+
+    vnpy_trades, vnpy_dfs, vnpy_profits = run_month(bar_store, False, start, end, capital)
+    vector_trades, vector_dfs, vector_profits = run_month(bar_store, True, start, end, capital)
+
+    assert sorted(map(trade_key, vnpy_trades)) == sorted(map(trade_key, vector_trades))
+    assert {trade["offset"] for trade in vector_trades} == {"OPEN", "CLOSE"}
+    np.testing.assert_allclose(vector_profits, vnpy_profits, atol=1e-6)
+
+    columns = list(vector_dfs[0].columns)
+    expected = pd.concat(vnpy_dfs)[columns].astype(float).groupby(level=0).sum()
+    expected = expected.loc[vector_dfs[0].index]
+    np.testing.assert_allclose(vector_dfs[0].to_numpy(dtype=float), expected.to_numpy(), atol=1e-6)
+
@@ -0,0 +1,236 @@
+"""
+周线/月线汇总表
+由日线表汇总生成<日线表>_weekly和<日线表>_monthly, 供缩小查看多年行情时直接查询:
+    datetime     周期内第一个交易日
+    period       周期开始日期(周一/每月1日), 与symbol组成主键
+    open_price   周期内第一根日线的开盘价
+    high_price   最高价
+    low_price    最低价
+    close_price  周期内最后一根日线的收盘价
+    volume       成交量合计
+    turnover     成交额合计
+    bar_count    周期内日线数量
+
+导入工具写入日线后只重新汇总受影响的周期, 首次使用时全量生成:
+    python tools/bar_rollup.py daily_hfq zh_index
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+import pandas as pd
+
+INTERVAL_DAILY = "daily"
+INTERVAL_WEEKLY = "weekly"
+INTERVAL_MONTHLY = "monthly"
+
+ROLLUP_INTERVALS = (INTERVAL_WEEKLY, INTERVAL_MONTHLY)
+INTERVALS = (INTERVAL_DAILY,) + ROLLUP_INTERVALS
+
+# 可以汇总的日线表, 表名会拼接进SQL
+DAILY_TABLES = ("daily", "daily_hfq", "zh_index")
+
+CREATE_ROLLUP_SQL = """
+CREATE TABLE IF NOT EXISTS `{table}` (
+    symbol VARCHAR(32) NOT NULL,
+    exchange VARCHAR(16),
+    period DATE NOT NULL,
+    datetime DATETIME NOT NULL,
+    open_price DOUBLE,
+    high_price DOUBLE,
+    low_price DOUBLE,
+    close_price DOUBLE,
+    volume DOUBLE,
+    turnover DOUBLE,
+    bar_count INT NOT NULL,
+    PRIMARY KEY (symbol, period),
+    KEY idx_symbol_datetime (symbol, datetime)
+)
+"""
+
+UPSERT_ROLLUP_SQL = """
+INSERT INTO `{table}` (symbol, exchange, period, datetime, open_price, high_price, low_price,
+                       close_price, volume, turnover, bar_count)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE exchange = VALUES(exchange), datetime = VALUES(datetime),
+    open_price = VALUES(open_price), high_price = VALUES(high_price), low_price = VALUES(low_price),
+    close_price = VALUES(close_price), volume = VALUES(volume), turnover = VALUES(turnover),
+    bar_count = VALUES(bar_count)
+"""
+
+_created_tables = set()
+
+
+def rollup_table(table: str, interval: str) -> str:
+    """
+    日线表在指定周期下对应的表名
+
+    Raises:
+        ValueError: 未知的表或周期
+    """
+    if table not in DAILY_TABLES:
+        raise ValueError(f"未知的K线表: {table}")
+    if interval not in INTERVALS:
+        raise ValueError(f"不支持的K线周期: {interval}, 可选: {', '.join(INTERVALS)}")
+    if interval == INTERVAL_DAILY:
+        return table
+    return f"{table}_{interval}"
+
+
+def parse_interval(value: Optional[str]) -> str:
+    """
+    解析K线周期参数, 为空时返回日线
+
+    Raises:
+        ValueError: 不支持的周期
+    """
+    interval = (value or INTERVAL_DAILY).lower()
+    if interval not in INTERVALS:
+        raise ValueError(f"不支持的K线周期: {value}, 可选: {', '.join(INTERVALS)}")
+    return interval
+
+
+def period_start(dt: datetime, interval: str) -> datetime:
+    """dt所在周期的开始日期"""
+    day = datetime(dt.year, dt.month, dt.day)
+    if interval == INTERVAL_WEEKLY:
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def _ensure_rollup_table(cursor, table: str) -> None:
+    if table in _created_tables:
+        return
+    cursor.execute(CREATE_ROLLUP_SQL.format(table=table))
+    _created_tables.add(table)
+
+
+def aggregate_bars(df: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """
+    把一个标的的日线汇总为周线或月线
+
+    Args:
+        df: 以datetime为索引、按时间排序的日线, 包含exchange和OHLCV列
+        interval: weekly或monthly
+
+    Returns:
+        以period为索引的汇总结果
+    """
+    index = df.index.normalize()
+    if interval == INTERVAL_WEEKLY:
+        periods = index - pd.to_timedelta(index.weekday, unit="D")
+    else:
+        periods = index.to_period("M").to_timestamp()
+
+    grouped = df.assign(datetime=df.index).groupby(periods.values, sort=True)
+    result = grouped.agg(
+        exchange=("exchange", "last"),
+        datetime=("datetime", "first"),
+        open_price=("open_price", "first"),
+        high_price=("high_price", "max"),
+        low_price=("low_price", "min"),
+        close_price=("close_price", "last"),
+        volume=("volume", "sum"),
+        turnover=("turnover", "sum"),
+        bar_count=("close_price", "size"),
+    )
+    result.index.name = "period"
+    return result
+
+
+def refresh_rollups(connection, table: str, symbol: str, since: Optional[datetime] = None) -> None:
+    """
+    重新汇总一个标的从since所在周期开始的周线和月线, 导入工具写入日线后调用
+
+    Args:
+        connection: 数据库连接
+        table: 日线表名
+        symbol: 标的代码
+        since: 本次写入的最早日期, None表示全部重新汇总
+    """
+    rollup_table(table, INTERVAL_DAILY)
+
+    # 从受影响的最早周期开始读取日线; 周一可能早于月初, 两者取较早的一个
+    start = None
+    if since is not None:
+        start = min(period_start(since, interval) for interval in ROLLUP_INTERVALS)
+
+    cursor = connection.cursor()
+    query = f"""
+    SELECT datetime, exchange, open_price, high_price, low_price, close_price, volume, turnover
+    FROM `{table}`
+    WHERE symbol = %s {"AND datetime >= %s" if start else ""}
+    ORDER BY datetime
+    """
+    cursor.execute(query, (symbol, start) if start else (symbol,))
+    rows = cursor.fetchall()
+    if not rows:
+        cursor.close()
+        return
+
+    df = pd.DataFrame(rows, columns=["datetime", "exchange", "open_price", "high_price", "low_price",
+                                     "close_price", "volume", "turnover"])
+    df["datetime"] = pd.to_datetime(df["datetime"])
+    df.set_index("datetime", inplace=True)
+    numeric = ["open_price", "high_price", "low_price", "close_price", "volume", "turnover"]
+    df[numeric] = df[numeric].astype(float)
+
+    for interval in ROLLUP_INTERVALS:
+        target = rollup_table(table, interval)
+        _ensure_rollup_table(cursor, target)
+        bars = aggregate_bars(df, interval)
+        # 周线可能从上个月开始读取, 只写入完整读取的周期
+        if start is not None:
+            bars = bars[bars.index >= pd.Timestamp(period_start(since, interval))]
+        records = [
+            (symbol, row.exchange, period.date(), row.datetime.to_pydatetime(), row.open_price, row.high_price,
+             row.low_price, row.close_price, row.volume, row.turnover, int(row.bar_count))
+            for period, row in zip(bars.index, bars.itertuples(index=False))
+        ]
+        cursor.executemany(UPSERT_ROLLUP_SQL.format(table=target), records)
+
+    connection.commit()
+    cursor.close()
+
+
+def rebuild_rollups(connection, table: str, symbols: Optional[Iterable[str]] = None) -> int:
+    """
+    全量重新汇总一张日线表
+
+    Args:
+        connection: 数据库连接
+        table: 日线表名
+        symbols: 标的列表, None表示表中的全部标的
+
+    Returns:
+        汇总的标的数量
+    """
+    rollup_table(table, INTERVAL_DAILY)
+    if symbols is None:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT DISTINCT symbol FROM `{table}`")
+        symbols = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+
+    count = 0
+    for symbol in symbols:
+        refresh_rollups(connection, table, symbol)
+        count += 1
+    return count
+
+
+def main():
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+    from tools.db_pool import get_connection
+
+    tables = sys.argv[1:] or list(DAILY_TABLES)
+    with get_connection() as connection:
+        for table in tables:
+            count = rebuild_rollups(connection, table)
+            print(f"{table}: 汇总 {count} 个标的")
+
+
+if __name__ == "__main__":
+    main()
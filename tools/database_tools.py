@@ -14,22 +14,10 @@ sys.path.append(parent_dir)
 from akshare.akshare.stock.stock_board_concept_em import stock_board_concept_hist_em
 from akshare.akshare.index.index_stock_zh import stock_zh_index_daily_em
 
-import mysql.connector
-
-def create_connection():
-    """创建MySQL连接"""
-    try:
-        connection = mysql.connector.connect(
-            host='localhost',
-            port=3306,
-            user='root',
-            password='123456',
-            database='ASTOCK'  
-        )
-        return connection
-    except mysql.connector.Error as e:
-        print(f"连接MySQL失败: {e}")
-        return None
+from tools.db_pool import get_connection
+from tools.symbol_catalog import refresh_symbols
+from tools.bar_rollup import refresh_rollups
+from tools.indicator_store import refresh_indicators
 
 def convert_list_to_df(list_data: list)->pd.DataFrame:
     results = defaultdict(list)
@@ -64,7 +52,6 @@ def insert_index_from_akshare(symbol: str, df: pd.DataFrame):
         'amount': 'turnover'
     }
 
-    connection = create_connection()
     # 数据清洗和转换
     for origin_column in df.columns:
         column = df[origin_column]
@@ -84,7 +71,6 @@ def insert_index_from_akshare(symbol: str, df: pd.DataFrame):
     df_clean = df[columns_to_insert]
     
     # 插入数据到MySQL
-    cursor = connection.cursor()
     insert_query = """
     INSERT INTO zh_index (symbol, exchange, datetime, `interval`, volume, 
                                 turnover, open_price, high_price, 
@@ -92,11 +78,18 @@ def insert_index_from_akshare(symbol: str, df: pd.DataFrame):
     VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
     """
     
-    for index, row in df_clean.iterrows():
-        cursor.execute(insert_query, tuple(row))
-    
-    connection.commit()
-    cursor.close()
+    with get_connection() as connection:
+        cursor = connection.cursor()
+        for index, row in df_clean.iterrows():
+            cursor.execute(insert_query, tuple(row))
+        
+        connection.commit()
+        cursor.close()
+
+        # 更新标的目录、周线/月线汇总和物化指标
+        refresh_symbols(connection, 'zh_index', [symbol])
+        refresh_rollups(connection, 'zh_index', symbol, df_clean['datetime'].min())
+        refresh_indicators(connection, 'zh_index', symbol, df_clean['datetime'].min())
 
 if __name__ == '__main__':
     start_date='20150101'
@@ -0,0 +1,125 @@
+"""
+MySQL连接池
+统一的数据访问入口, 连接参数从vt_setting.json读取, 替代各模块中重复的create_connection
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import mysql.connector
+from mysql.connector import errors, pooling
+
+
+SETTING_FILENAME = "vt_setting.json"
+
+DEFAULT_SETTING = {
+    "database.host": "localhost",
+    "database.port": 3306,
+    "database.user": "root",
+    "database.password": "123456",
+    "database.database": "ASTOCK",
+    "database.pool_size": 8,
+}
+
+# 连接池耗尽时等待空闲连接的最长时间(秒)
+CHECKOUT_TIMEOUT = 10
+CHECKOUT_RETRY_INTERVAL = 0.05
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def find_setting_file() -> Path:
+    """
+    查找vt_setting.json, 与vnpy的查找顺序一致:
+    当前目录 -> 当前目录/.vntrader -> 用户目录/.vntrader -> 仓库根目录
+    """
+    candidates = [
+        Path.cwd() / SETTING_FILENAME,
+        Path.cwd() / ".vntrader" / SETTING_FILENAME,
+        Path.home() / ".vntrader" / SETTING_FILENAME,
+        Path(__file__).resolve().parent.parent / SETTING_FILENAME,
+    ]
+    for path in candidates:
+        if path.exists():
+            return path
+    return None
+
+
+def load_database_setting() -> dict:
+    """读取数据库配置, 缺失的字段使用默认值"""
+    setting = dict(DEFAULT_SETTING)
+    path = find_setting_file()
+    if path:
+        with open(path, encoding="utf-8") as f:
+            setting.update({k: v for k, v in json.load(f).items() if k.startswith("database.")})
+    return setting
+
+
+def get_pool() -> pooling.MySQLConnectionPool:
+    """获取全局连接池, 首次调用时创建"""
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+
+    with _pool_lock:
+        # fork出的子进程不能复用父进程的连接
+        if _pool is None or _pool_pid != os.getpid():
+            setting = load_database_setting()
+            _pool = pooling.MySQLConnectionPool(
+                pool_name=f"astock_{os.getpid()}",
+                pool_size=int(setting["database.pool_size"]),
+                pool_reset_session=True,
+                host=setting["database.host"],
+                port=int(setting["database.port"]),
+                user=setting["database.user"],
+                password=setting["database.password"],
+                database=setting["database.database"],
+            )
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def _checkout(timeout: float = CHECKOUT_TIMEOUT):
+    """从连接池取出连接, 池耗尽时等待, 并确保连接可用"""
+    pool = get_pool()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            connection = pool.get_connection()
+            break
+        except errors.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(CHECKOUT_RETRY_INTERVAL)
+
+    # 健康检查, 服务端断开的连接自动重连
+    try:
+        connection.ping(reconnect=True, attempts=3, delay=1)
+    except mysql.connector.Error:
+        connection.close()
+        raise
+    return connection
+
+
+@contextmanager
+def get_connection(timeout: float = CHECKOUT_TIMEOUT):
+    """
+    以上下文管理器方式借出连接, 退出时自动归还连接池
+
+    Example:
+        with get_connection() as connection:
+            cursor = connection.cursor()
+            ...
+    """
+    connection = _checkout(timeout)
+    try:
+        yield connection
+    finally:
+        connection.close()
+
@@ -1,26 +1,23 @@
 import pandas as pd
 import os
 from datetime import datetime
+import sys
 
-import mysql.connector
+# 添加项目根目录到路径
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_dir)
+from tools.db_pool import get_connection
+from tools.symbol_catalog import refresh_symbols
+from tools.bar_rollup import refresh_rollups
+from tools.indicator_store import refresh_indicators
+from tools.market_value_snapshot import DAILY_TABLE, refresh_symbol_snapshots
+
+# 可导入的日线表, 表名会拼接进SQL
+TABLES = ("daily", "daily_hfq")
 
-def create_connection():
-    """创建MySQL连接"""
-    try:
-        connection = mysql.connector.connect(
-            host='localhost',
-            port=3306,
-            user='root',
-            password='123456',
-            database='ASTOCK'  # 请替换为实际数据库名
-        )
-        return connection
-    except mysql.connector.Error as e:
-        print(f"连接MySQL失败: {e}")
-        return None
 
-def import_csv_to_mysql(csv_file_path, connection):
-    """导入单个CSV文件到MySQL"""
+def import_csv_to_mysql(csv_file_path, connection, table="daily"):
+    """导入单个CSV文件到MySQL的日线表(daily不复权, daily_hfq后复权)"""
     try:
         # 读取CSV文件
         df = pd.read_csv(csv_file_path, encoding='utf-8', dtype={'股票代码': str})
@@ -47,8 +44,8 @@ def import_csv_to_mysql(csv_file_path, connection):
         
         # 插入数据到MySQL
         cursor = connection.cursor()
-        insert_query = """
-        INSERT INTO daily (symbol, exchange, datetime, `interval`, volume, 
+        insert_query = f"""
+        INSERT INTO `{table}` (symbol, exchange, datetime, `interval`, volume, 
                                    turnover, open_interest, open_price, high_price, 
                                    low_price, close_price)
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
@@ -59,20 +56,26 @@ def import_csv_to_mysql(csv_file_path, connection):
         
         connection.commit()
         cursor.close()
+
+        # 更新标的目录、周线/月线汇总、物化指标和市值快照(只由不复权日线计算)
+        refresh_symbols(connection, table, df_clean['symbol'].unique())
+        for symbol in df_clean['symbol'].unique():
+            refresh_rollups(connection, table, symbol, df_clean['datetime'].min())
+            refresh_indicators(connection, table, symbol, df_clean['datetime'].min())
+            if table == DAILY_TABLE:
+                refresh_symbol_snapshots(connection, symbol, df_clean['datetime'].min())
         print(f"成功导入文件: {csv_file_path}")
         
     except Exception as e:
         print(f"导入文件失败 {csv_file_path}: {e}")
 
 def main():
-    """主函数"""
-    # 连接数据库
-    connection = create_connection()
-    if not connection:
+    """主函数, 参数为目标表(daily或daily_hfq), CSV文件放在与表同名的目录中"""
+    table = sys.argv[1] if len(sys.argv) > 1 else "daily"
+    if table not in TABLES:
+        print(f"不支持的表: {table}, 可选: {', '.join(TABLES)}")
         return
-    
-    # daily_hfq目录路径
-    csv_directory = "daily"
+    csv_directory = table
     
     # 检查目录是否存在
     if not os.path.exists(csv_directory):
@@ -92,14 +95,13 @@ def main():
     cnt = 0
     for csv_file in csv_files:
         csv_path = os.path.join(csv_directory, csv_file)
-        import_csv_to_mysql(csv_path, connection)
+        with get_connection() as connection:
+            import_csv_to_mysql(csv_path, connection, table)
         cnt += 1        
                 
         # 其余代码保持不变...
         print(f"已导入 {cnt}/{len(csv_files)} 个文件")
 
-    # 关闭连接
-    connection.close()
     print("所有文件导入完成")
 
 if __name__ == "__main__":
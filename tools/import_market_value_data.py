@@ -1,21 +1,13 @@
 import pandas as pd
 import os
-import mysql.connector
+import sys
+
+# 添加项目根目录到路径
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_dir)
+from tools.db_pool import get_connection
+from tools.market_value_snapshot import refresh_month_snapshots
 
-def create_connection():
-    """创建MySQL连接"""
-    try:
-        connection = mysql.connector.connect(
-            host='localhost',
-            port=3306,
-            user='root',
-            password='123456',
-            database='ASTOCK'
-        )
-        return connection
-    except mysql.connector.Error as e:
-        print(f"连接MySQL失败: {e}")
-        return None
 
 def import_xlsx_to_mysql(xlsx_file_path, connection):
     """导入单个xlsx文件到MySQL"""
@@ -47,6 +39,9 @@ def import_xlsx_to_mysql(xlsx_file_path, connection):
         
         connection.commit()
         cursor.close()
+
+        # 重新生成财报所在月份的市值快照
+        refresh_month_snapshots(connection, pd.to_datetime(df['update_time']).dropna())
         print(f"成功导入文件: {xlsx_file_path}")
         
     except Exception as e:
@@ -54,11 +49,6 @@ def import_xlsx_to_mysql(xlsx_file_path, connection):
 
 def main():
     """主函数"""
-    # 连接数据库
-    connection = create_connection()
-    if not connection:
-        return
-    
     # xlsx文件目录路径
     xlsx_directory = "data"
     
@@ -80,13 +70,12 @@ def main():
     cnt = 0
     for xlsx_file in xlsx_files:
         xlsx_path = os.path.join(xlsx_directory, xlsx_file)
-        import_xlsx_to_mysql(xlsx_path, connection)
+        with get_connection() as connection:
+            import_xlsx_to_mysql(xlsx_path, connection)
         cnt += 1        
                 
         print(f"已导入 {cnt}/{len(xlsx_files)} 个文件")
 
-    # 关闭连接
-    connection.close()
     print("所有文件导入完成")
 
 if __name__ == "__main__":
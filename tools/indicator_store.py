@@ -0,0 +1,361 @@
+"""
+物化技术指标
+常用指标按标的预先计算并保存在indicator_store表中, 行情接口请求的区间被覆盖时直接读取,
+不再每次从K线重新计算:
+    table_name   K线表
+    symbol       标的代码
+    spec         指标规范写法, 如ma:5、macd:12,26,9
+    datetime     K线时间
+    value1~3     指标值, 多输出指标按分量顺序存放(macd/signal/histogram, upper/middle/lower)
+
+indicator_store_state表记录每个指标的定义版本、已处理到的K线和流式计算状态,
+导入工具(import_daily_bar_data.py的daily/daily_hfq、database_tools.py的zh_index)写入新K线后
+从保存的状态继续计算, 只追加新K线的指标值, 结果与全量计算一致。
+指标定义版本变化或写入了已处理区间内的K线时, 该标的的指标全量重建。
+K线表由其他途径写入时物化数据不会更新, 读取时发现落后会提示并回退到从K线计算。
+
+首次使用、修改指标定义或K线由其他途径写入后全量重建:
+    python tools/indicator_store.py daily_hfq zh_index
+"""
+
+import os
+import pickle
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "project_noui"))
+from indicator_tools import (  # noqa: E402
+    INDICATOR_DEFS, IndicatorSpec, assemble_series, new_streaming_indicator, parse_indicator_spec
+)
+
+STORE_TABLE = "indicator_store"
+STATE_TABLE = "indicator_store_state"
+
+# 允许物化的K线表, 表名会拼接进SQL
+BAR_TABLES = ("daily", "daily_hfq", "zh_index")
+
+# 物化的指标, 覆盖前端默认和常用的指标
+STORE_SPECS = [
+    "ma:5", "ma:10", "ma:20", "ma:30", "ma:60",
+    "ema:12", "ema:26",
+    "rsi:6", "rsi:14",
+    "macd:12,26,9",
+    "boll:20,2",
+]
+
+MAX_COMPONENTS = 3
+
+_ONE_SECOND = timedelta(seconds=1)
+
+CREATE_STORE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {STORE_TABLE} (
+    `table_name` VARCHAR(64) NOT NULL,
+    symbol VARCHAR(32) NOT NULL,
+    spec VARCHAR(64) NOT NULL,
+    datetime DATETIME NOT NULL,
+    value1 DOUBLE,
+    value2 DOUBLE,
+    value3 DOUBLE,
+    PRIMARY KEY (`table_name`, symbol, spec, datetime)
+)
+"""
+
+CREATE_STATE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+    `table_name` VARCHAR(64) NOT NULL,
+    symbol VARCHAR(32) NOT NULL,
+    spec VARCHAR(64) NOT NULL,
+    version VARCHAR(64) NOT NULL,
+    first_date DATETIME,
+    last_date DATETIME,
+    bar_count INT NOT NULL DEFAULT 0,
+    state LONGBLOB,
+    PRIMARY KEY (`table_name`, symbol, spec)
+)
+"""
+
+UPSERT_VALUE_SQL = f"""
+INSERT INTO {STORE_TABLE} (`table_name`, symbol, spec, datetime, value1, value2, value3)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE value1 = VALUES(value1), value2 = VALUES(value2), value3 = VALUES(value3)
+"""
+
+UPSERT_STATE_SQL = f"""
+INSERT INTO {STATE_TABLE} (`table_name`, symbol, spec, version, first_date, last_date, bar_count, state)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE version = VALUES(version), first_date = VALUES(first_date),
+    last_date = VALUES(last_date), bar_count = VALUES(bar_count), state = VALUES(state)
+"""
+
+_tables_checked = False
+
+
+def _check_table_name(table: str) -> None:
+    if table not in BAR_TABLES:
+        raise ValueError(f"未知的K线表: {table}")
+
+
+def ensure_store_tables(connection) -> None:
+    """创建物化指标表(如不存在), 每个进程只执行一次"""
+    global _tables_checked
+    if _tables_checked:
+        return
+    cursor = connection.cursor()
+    cursor.execute(CREATE_STORE_SQL)
+    cursor.execute(CREATE_STATE_SQL)
+    connection.commit()
+    cursor.close()
+    _tables_checked = True
+
+
+def store_specs() -> List[IndicatorSpec]:
+    """物化的指标规格"""
+    return [parse_indicator_spec(text)[0] for text in STORE_SPECS]
+
+
+def _row_values(spec: IndicatorSpec, value) -> Tuple:
+    """流式计算结果转换为value1~3"""
+    components = INDICATOR_DEFS[spec.name][1]
+    values = [value] if components is None else [value[component] for component in components]
+    return tuple(values) + (None,) * (MAX_COMPONENTS - len(values))
+
+
+def _load_states(cursor, table: str, symbol: str) -> Dict[str, tuple]:
+    cursor.execute(
+        f"SELECT spec, version, first_date, last_date, bar_count, state FROM {STATE_TABLE} "
+        f"WHERE `table_name` = %s AND symbol = %s",
+        (table, symbol),
+    )
+    return {row[0]: row[1:] for row in cursor.fetchall()}
+
+
+def refresh_indicators(connection, table: str, symbol: str, since: Optional[datetime] = None) -> int:
+    """
+    更新一个标的的物化指标, 导入工具写入K线后调用
+
+    从保存的流式状态继续计算last_date之后的K线; 没有状态、定义版本变化、
+    since为None或since不晚于已处理的最后一根K线时全量重建该指标。
+
+    Args:
+        connection: 数据库连接
+        table: K线表名
+        symbol: 标的代码
+        since: 本次写入的最早日期, None表示全量重建
+
+    Returns:
+        写入的指标值行数
+    """
+    _check_table_name(table)
+    ensure_store_tables(connection)
+
+    cursor = connection.cursor()
+    saved = _load_states(cursor, table, symbol)
+
+    # 每个指标: [spec, 流式状态, 已处理的K线数, 首个输出日期, 已处理到的日期]
+    tasks = []
+    for spec in store_specs():
+        state = saved.get(spec.canonical)
+        rebuild = (state is None or state[0] != spec.version or since is None
+                   or state[2] is None or since <= state[2])
+        if rebuild:
+            cursor.execute(
+                f"DELETE FROM {STORE_TABLE} WHERE `table_name` = %s AND symbol = %s AND spec = %s",
+                (table, symbol, spec.canonical),
+            )
+            tasks.append([spec, new_streaming_indicator(spec), 0, None, None])
+        else:
+            _, first_date, last_date, bar_count, blob = state
+            tasks.append([spec, pickle.loads(blob), bar_count, first_date, last_date])
+
+    # 各指标从已处理到的日期之后开始, 一次读取所需的全部K线
+    starts = [task[4] for task in tasks]
+    start = None if any(s is None for s in starts) else min(starts)
+    query = f"SELECT datetime, close_price FROM `{table}` WHERE symbol = %s "
+    query += "AND datetime > %s ORDER BY datetime" if start else "ORDER BY datetime"
+    cursor.execute(query, (symbol, start) if start else (symbol,))
+    bars = [(dt, float(close)) for dt, close in cursor.fetchall()]
+
+    rows = []
+    for task in tasks:
+        spec, state, bar_count, first_date, last_date = task
+        for dt, close in bars:
+            if last_date is not None and dt <= last_date:
+                continue
+            value = state.update(close)
+            bar_count += 1
+            last_date = dt
+            # 与批量计算一致, 开头预热期内的值不输出
+            if value is None or bar_count <= spec.warmup_bars:
+                continue
+            if first_date is None:
+                first_date = dt
+            rows.append((table, symbol, spec.canonical, dt) + _row_values(spec, value))
+        task[2:] = [bar_count, first_date, last_date]
+
+    if rows:
+        cursor.executemany(UPSERT_VALUE_SQL, rows)
+    cursor.executemany(UPSERT_STATE_SQL, [
+        (table, symbol, spec.canonical, spec.version, first_date, last_date, bar_count, pickle.dumps(state))
+        for spec, state, bar_count, first_date, last_date in tasks
+    ])
+    connection.commit()
+    cursor.close()
+    return len(rows)
+
+
+def rebuild_indicators(connection, table: str, symbols: Optional[Iterable[str]] = None) -> int:
+    """
+    全量重建一张K线表的物化指标
+
+    Returns:
+        重建的标的数量
+    """
+    _check_table_name(table)
+    if symbols is None:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT DISTINCT symbol FROM `{table}`")
+        symbols = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+
+    count = 0
+    for symbol in symbols:
+        refresh_indicators(connection, table, symbol)
+        count += 1
+    return count
+
+
+# 已提示过落后的(表, 标的, 指标, 已处理到的日期), 每种情况只提示一次
+_stale_warned = set()
+
+
+def _warn_stale(table: str, symbol: str, canonical: str, last_date: datetime, required: datetime) -> None:
+    key = (table, symbol, canonical, last_date)
+    if key in _stale_warned:
+        return
+    _stale_warned.add(key)
+    print(f"[WARN] 物化指标落后于K线, 改为从K线计算: {table} {symbol} {canonical} "
+          f"已处理到{last_date:%Y-%m-%d}, 需要{required:%Y-%m-%d}; "
+          f"请运行 python tools/indicator_store.py {table}")
+
+
+def load_indicators(connection, table: str, symbol: str, specs: List[IndicatorSpec],
+                    start: datetime, end: datetime,
+                    last_bar: Optional[datetime] = None) -> Optional[Tuple[np.ndarray, Dict[str, np.ndarray], Optional[str]]]:
+    """
+    从物化指标中读取[start, end)区间的指标, 返回格式与compute_indicator_series相同
+
+    Args:
+        connection: 数据库连接
+        table: K线表名
+        symbol: 标的代码
+        specs: parse_indicator_spec的结果
+        start: 开始时间
+        end: 结束时间
+        last_bar: 该标的最新K线的时间, 用于判断物化数据是否已更新到最新
+
+    Returns:
+        (时间戳数组, 输出字段名 -> 指标值数组, 单输出字段名或None);
+        有指标未物化、定义版本不一致或未覆盖请求区间时返回None
+    """
+    if table not in BAR_TABLES:
+        return None
+    stored = {spec.canonical for spec in store_specs()}
+    canonicals = list(dict.fromkeys(spec.canonical for spec in specs))
+    if any(canonical not in stored for canonical in canonicals):
+        return None
+
+    ensure_store_tables(connection)
+    cursor = connection.cursor()
+    placeholders = ", ".join(["%s"] * len(canonicals))
+    cursor.execute(
+        f"SELECT spec, version, first_date, last_date FROM {STATE_TABLE} "
+        f"WHERE `table_name` = %s AND symbol = %s AND spec IN ({placeholders})",
+        (table, symbol, *canonicals),
+    )
+    states = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    # 物化数据需要处理到请求区间内的最后一根K线; 不知道最新K线时要求处理到区间末尾
+    required = end - _ONE_SECOND if last_bar is None else min(last_bar, end - _ONE_SECOND)
+    versions = {spec.canonical: spec.version for spec in specs}
+    for canonical in canonicals:
+        state = states.get(canonical)
+        if state is None or state[0] != versions[canonical] or state[2] is None or state[2] < required:
+            cursor.close()
+            if state is not None and state[2] is not None and state[2] < required:
+                _warn_stale(table, symbol, canonical, state[2], required)
+            return None
+
+    # 多个指标共用时间轴, 从所有指标都有值的日期开始
+    first_dates = [states[canonical][1] for canonical in canonicals]
+    if any(first_date is None for first_date in first_dates):
+        cursor.close()
+        return None
+    begin = max([start] + first_dates)
+
+    # 旧版指标名固定从第100根K线开始输出(first_output_bar), 物化数据从第warmup_bars根开始逐根保存
+    stored_warmup = {spec.canonical: spec.warmup_bars for spec in store_specs()}
+    for spec in specs:
+        if not spec.legacy:
+            continue
+        skip = spec.first_output_bar - stored_warmup[spec.canonical]
+        if skip < 0:
+            # 旧版输出区间早于物化数据的第一根, 请求区间覆盖这部分时只能现算
+            if start < states[spec.canonical][1]:
+                cursor.close()
+                return None
+            continue
+        cursor.execute(
+            f"SELECT datetime FROM {STORE_TABLE} WHERE `table_name` = %s AND symbol = %s AND spec = %s "
+            f"ORDER BY datetime LIMIT 1 OFFSET %s",
+            (table, symbol, spec.canonical, skip),
+        )
+        row = cursor.fetchone()
+        begin = max(begin, row[0] if row else end)
+
+    cursor.execute(
+        f"SELECT spec, datetime, value1, value2, value3 FROM {STORE_TABLE} "
+        f"WHERE `table_name` = %s AND symbol = %s AND spec IN ({placeholders}) "
+        f"AND datetime >= %s AND datetime < %s ORDER BY datetime",
+        (table, symbol, *canonicals, begin, end),
+    )
+    rows = cursor.fetchall()
+    cursor.close()
+
+    by_spec: Dict[str, Dict[datetime, tuple]] = {canonical: {} for canonical in canonicals}
+    for canonical, dt, *values in rows:
+        by_spec[canonical][dt] = values
+    dates = sorted(by_spec[canonicals[0]])
+    if any(len(values) != len(dates) for values in by_spec.values()):
+        return None
+
+    # 与df_times一致, 按UTC转换为秒级时间戳
+    times = np.array(dates, dtype='datetime64[s]').astype(np.int64)
+    results = []
+    for spec in specs:
+        columns = np.array([by_spec[spec.canonical][dt] for dt in dates], dtype=np.float64).reshape(-1, MAX_COMPONENTS)
+        components = INDICATOR_DEFS[spec.name][1]
+        if components is None:
+            results.append(columns[:, 0])
+        else:
+            results.append({component: columns[:, i] for i, component in enumerate(components)})
+    series = assemble_series(specs, results)
+    single = next(iter(series)) if len(series) == 1 else None
+    return times, series, single
+
+
+def main():
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+    from tools.db_pool import get_connection
+
+    tables = sys.argv[1:] or list(BAR_TABLES)
+    with get_connection() as connection:
+        for table in tables:
+            count = rebuild_indicators(connection, table)
+            print(f"{table}: 重建 {count} 个标的的指标")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+"""
+月末市值快照表
+由finance和daily生成market_value_snapshot, 每个标的每个财报月一行, 供按市值选股时直接查询:
+    symbol        标的代码, 与report_month组成主键
+    report_month  财报月份(当月1日)
+    name          股票名称
+    market        市场(深市/沪市)
+    exchange      日线所在交易所
+    update_time   财报更新时间, 同一月份有多条时取最新一条
+    close_time    当月最后一根日线的时间
+    close_price   当月最后一根日线的收盘价(不复权)
+    total_shares  总股本
+    market_value  总市值 = total_shares * close_price
+    is_st         名称含ST
+    is_delisting  名称以"退"结尾
+
+按(report_month, market, exchange, is_st, is_delisting, market_value)建索引, 选股是一次索引范围查找。
+导入工具写入日线或财报后只重新生成受影响的月份, 首次使用时全量生成:
+    python tools/market_value_snapshot.py
+
+每次重新生成都会更新market_value_snapshot_state中该月份的updated_at, 作为数据版本;
+状态表只记录全量生成过的月份, 只更新部分标的时不会新增月份, 未全量生成的月份在选股时生成;
+SelectionCache按财报月份和选股参数缓存选股结果(内存+磁盘), 数据版本不变时不再查询。
+"""
+
+import json
+import os
+import sys
+import threading
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+
+SNAPSHOT_TABLE = "market_value_snapshot"
+STATE_TABLE = "market_value_snapshot_state"
+
+# 计算市值使用的日线表(不复权)
+DAILY_TABLE = "daily"
+
+# 每个季度选股参考的财报月份: 1-3月用上年12月, 4-6月用3月, 以此类推
+FINANCE_REPORT_MONTHS = (12, 3, 6, 9)
+
+CREATE_SNAPSHOT_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{SNAPSHOT_TABLE}` (
+    symbol VARCHAR(32) NOT NULL,
+    report_month DATE NOT NULL,
+    name VARCHAR(64),
+    market VARCHAR(16),
+    exchange VARCHAR(16),
+    update_time DATETIME,
+    close_time DATETIME,
+    close_price DOUBLE,
+    total_shares DOUBLE,
+    market_value DOUBLE,
+    is_st TINYINT NOT NULL DEFAULT 0,
+    is_delisting TINYINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (symbol, report_month),
+    KEY idx_month_value (report_month, market, exchange, is_st, is_delisting, market_value)
+)
+"""
+
+CREATE_STATE_SQL = f"""
+CREATE TABLE IF NOT EXISTS `{STATE_TABLE}` (
+    report_month DATE NOT NULL PRIMARY KEY,
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
+)
+"""
+
+UPSERT_SNAPSHOT_SQL = f"""
+INSERT INTO `{SNAPSHOT_TABLE}` (symbol, report_month, name, market, exchange, update_time, close_time,
+                                close_price, total_shares, market_value, is_st, is_delisting)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE name = VALUES(name), market = VALUES(market), exchange = VALUES(exchange),
+    update_time = VALUES(update_time), close_time = VALUES(close_time), close_price = VALUES(close_price),
+    total_shares = VALUES(total_shares), market_value = VALUES(market_value), is_st = VALUES(is_st),
+    is_delisting = VALUES(is_delisting)
+"""
+
+_table_created = False
+# 本进程中已确认生成过快照的月份
+_checked_months = set()
+
+
+def ensure_snapshot_table(cursor) -> None:
+    global _table_created
+    if _table_created:
+        return
+    cursor.execute(CREATE_SNAPSHOT_SQL)
+    cursor.execute(CREATE_STATE_SQL)
+    _table_created = True
+
+
+def month_start(dt) -> date:
+    """dt所在月份的1日"""
+    return date(dt.year, dt.month, 1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + 1, 1, 1) if month.month == 12 else date(month.year, month.month + 1, 1)
+
+
+def _touch_months(cursor, months: Iterable[date], create: bool = True) -> None:
+    """
+    更新月份的数据版本
+
+    Args:
+        cursor: 数据库游标
+        months: 月份(当月1日)
+        create: 月份没有状态行时是否新建; 状态行表示该月份已全量生成,
+            只更新了部分标的时为False, 未全量生成的月份留给select_market_values生成
+    """
+    records = [(month,) for month in sorted(set(months))]
+    if not records:
+        return
+    if create:
+        cursor.executemany(
+            f"INSERT INTO `{STATE_TABLE}` (report_month, updated_at) VALUES (%s, NOW(6)) "
+            f"ON DUPLICATE KEY UPDATE updated_at = NOW(6)",
+            records,
+        )
+    else:
+        cursor.executemany(f"UPDATE `{STATE_TABLE}` SET updated_at = NOW(6) WHERE report_month = %s", records)
+
+
+def snapshot_versions(connection) -> Dict[date, str]:
+    """
+    各财报月份快照的数据版本
+
+    Returns:
+        财报月份 -> 最后一次重新生成的时间, 未生成过的月份不在其中
+    """
+    cursor = connection.cursor()
+    ensure_snapshot_table(cursor)
+    cursor.execute(f"SELECT report_month, updated_at FROM `{STATE_TABLE}`")
+    rows = cursor.fetchall()
+    cursor.close()
+    return {month_start(month): str(updated_at) for month, updated_at in rows}
+
+
+def report_month_for(year: int, month: int) -> date:
+    """
+    选股月份参考的财报月份
+
+    Args:
+        year: 选股年份
+        month: 选股月份
+
+    Returns:
+        财报月份的1日
+    """
+    report_year = year - 1 if month < 4 else year
+    return date(report_year, FINANCE_REPORT_MONTHS[(month - 1) // 3], 1)
+
+
+def _snapshot_records(finance_rows, bar_rows) -> List[tuple]:
+    """
+    按月份合并财报和当月最后一根日线
+
+    Args:
+        finance_rows: (symbol, name, market, update_time, total_shares), 按update_time排序
+        bar_rows: (symbol, exchange, datetime, close_price), 按datetime排序
+
+    Returns:
+        UPSERT_SNAPSHOT_SQL的参数列表
+    """
+    # 排序后逐行覆盖, 留下每个月最新的财报和最后一根日线
+    finance: Dict[tuple, tuple] = {}
+    for symbol, name, market, update_time, total_shares in finance_rows:
+        finance[(symbol, month_start(update_time))] = (name, market, update_time, total_shares)
+    last_bars: Dict[tuple, tuple] = {}
+    for symbol, exchange, dt, close_price in bar_rows:
+        last_bars[(symbol, month_start(dt))] = (exchange, dt, close_price)
+
+    records = []
+    for (symbol, month), (name, market, update_time, total_shares) in finance.items():
+        bar = last_bars.get((symbol, month))
+        if bar is None or total_shares is None:
+            continue
+        exchange, dt, close_price = bar
+        name = name or ""
+        records.append((
+            symbol, month, name, market, exchange, update_time, dt, float(close_price), float(total_shares),
+            float(total_shares) * float(close_price), int("ST" in name.upper()), int(name.endswith("退")),
+        ))
+    return records
+
+
+def refresh_symbol_snapshots(connection, symbol: str, since: Optional[datetime] = None) -> int:
+    """
+    重新生成一个标的从since所在月份开始的快照, 日线导入工具写入日线后调用
+
+    Args:
+        connection: 数据库连接
+        symbol: 标的代码
+        since: 本次写入的最早日期, None表示全部重新生成
+
+    Returns:
+        写入的快照行数
+    """
+    start = month_start(since) if since is not None else None
+    cursor = connection.cursor()
+    ensure_snapshot_table(cursor)
+
+    condition = "AND update_time >= %s" if start else ""
+    cursor.execute(
+        f"SELECT symbol, name, market, update_time, total_shares FROM finance "
+        f"WHERE symbol = %s {condition} ORDER BY update_time",
+        (symbol, start) if start else (symbol,),
+    )
+    finance_rows = cursor.fetchall()
+    records = []
+    if finance_rows:
+        condition = "AND datetime >= %s" if start else ""
+        cursor.execute(
+            f"SELECT symbol, exchange, datetime, close_price FROM `{DAILY_TABLE}` "
+            f"WHERE symbol = %s {condition} ORDER BY datetime",
+            (symbol, start) if start else (symbol,),
+        )
+        records = _snapshot_records(finance_rows, cursor.fetchall())
+
+    # 原有和新生成快照所在的月份都要更新数据版本, 未全量生成过的月份仍留给选股时生成
+    condition = "AND report_month >= %s" if start else ""
+    cursor.execute(f"SELECT DISTINCT report_month FROM `{SNAPSHOT_TABLE}` WHERE symbol = %s {condition}",
+                   (symbol, start) if start else (symbol,))
+    months = {month_start(row[0]) for row in cursor.fetchall()} | {record[1] for record in records}
+    cursor.execute(f"DELETE FROM `{SNAPSHOT_TABLE}` WHERE symbol = %s {condition}",
+                   (symbol, start) if start else (symbol,))
+    if records:
+        cursor.executemany(UPSERT_SNAPSHOT_SQL, records)
+    _touch_months(cursor, months, create=False)
+    connection.commit()
+    cursor.close()
+    return len(records)
+
+
+def refresh_month_snapshots(connection, months: Iterable) -> int:
+    """
+    重新生成指定月份全部标的的快照, 财报导入工具写入财报后调用
+
+    Args:
+        connection: 数据库连接
+        months: 月份内的任意日期
+
+    Returns:
+        写入的快照行数
+    """
+    cursor = connection.cursor()
+    ensure_snapshot_table(cursor)
+    count = 0
+    for month in sorted({month_start(month) for month in months}):
+        end = next_month(month)
+        cursor.execute(
+            "SELECT symbol, name, market, update_time, total_shares FROM finance "
+            "WHERE update_time >= %s AND update_time < %s ORDER BY update_time",
+            (month, end),
+        )
+        finance_rows = cursor.fetchall()
+        cursor.execute(
+            f"SELECT symbol, exchange, datetime, close_price FROM `{DAILY_TABLE}` "
+            f"WHERE datetime >= %s AND datetime < %s ORDER BY datetime",
+            (month, end),
+        )
+        records = _snapshot_records(finance_rows, cursor.fetchall())
+
+        cursor.execute(f"DELETE FROM `{SNAPSHOT_TABLE}` WHERE report_month = %s", (month,))
+        if records:
+            cursor.executemany(UPSERT_SNAPSHOT_SQL, records)
+        _touch_months(cursor, [month])
+        connection.commit()
+        _checked_months.add(month)
+        count += len(records)
+    cursor.close()
+    return count
+
+
+def rebuild_snapshots(connection) -> int:
+    """
+    全量重新生成快照表, 月份取finance中出现过的全部月份
+
+    Returns:
+        写入的快照行数
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT DISTINCT DATE_FORMAT(update_time, '%Y-%m-01') FROM finance")
+    months = [datetime.strptime(str(row[0]), "%Y-%m-%d") for row in cursor.fetchall() if row[0]]
+    cursor.close()
+    return refresh_month_snapshots(connection, months)
+
+
+def select_market_values(connection, report_month: date, top_n: Optional[int] = None,
+                         market: str = "深市", exchange: str = "SZSE", symbol_prefix: str = "00") -> List[dict]:
+    """
+    按市值从低到高选出财报月份的股票, 排除ST和退市股
+
+    该月份从未生成过快照时先生成一次, 之后在本进程中不再检查
+
+    Args:
+        connection: 数据库连接
+        report_month: 财报月份
+        top_n: 返回数量, None表示全部
+        market: finance中的市场
+        exchange: 日线所在交易所
+        symbol_prefix: 标的代码前缀
+
+    Returns:
+        [{"symbol", "name", "market_value"}], 按市值升序
+    """
+    report_month = month_start(report_month)
+    cursor = connection.cursor()
+    ensure_snapshot_table(cursor)
+    if report_month not in _checked_months:
+        cursor.execute(f"SELECT 1 FROM `{STATE_TABLE}` WHERE report_month = %s", (report_month,))
+        exists = cursor.fetchone() is not None
+        if not exists:
+            refresh_month_snapshots(connection, [report_month])
+        _checked_months.add(report_month)
+
+    cursor.execute(
+        f"""SELECT symbol, name, market_value FROM `{SNAPSHOT_TABLE}`
+        WHERE report_month = %s AND market = %s AND exchange = %s AND is_st = 0 AND is_delisting = 0
+            AND symbol LIKE %s
+        ORDER BY market_value ASC {"LIMIT %s" if top_n is not None else ""}""",
+        (report_month, market, exchange, symbol_prefix + "%") + ((int(top_n),) if top_n is not None else ()),
+    )
+    rows = cursor.fetchall()
+    cursor.close()
+    return [{"symbol": row[0], "name": row[1], "market_value": row[2]} for row in rows]
+
+
+class SelectionCache:
+    """
+    选股结果缓存
+
+    按(财报月份, top_n, 市场, 交易所, 代码前缀)保存选股结果和当时的数据版本, 同一季度的各月共用一条;
+    内存中的结果在进程内共享, 同时写入磁盘上的JSON文件, 重新运行和其他进程也能直接使用。
+    日线或财报重新导入后对应月份的数据版本变化, 缓存失效并重新查询。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: 缓存文件路径, None表示只缓存在内存中
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, dict]] = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(report_month: date, top_n: Optional[int], market: str, exchange: str, symbol_prefix: str) -> str:
+        return f"{report_month.isoformat()}|{top_n}|{market}|{exchange}|{symbol_prefix}"
+
+    def _load(self) -> Dict[str, dict]:
+        if self._entries is None:
+            self._entries = {}
+            if self.path and os.path.exists(self.path):
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        self._entries = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"[WARN] 选股缓存读取失败, 忽略: {e}")
+        return self._entries
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        # 先合并其他进程写入的结果, 再原子替换文件
+        entries = dict(self._entries)
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = {**json.load(f), **entries}
+        except (OSError, ValueError):
+            pass
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def select(self, connection, report_month: date, top_n: Optional[int] = None,
+               market: str = "深市", exchange: str = "SZSE", symbol_prefix: str = "00",
+               versions: Optional[Dict[date, str]] = None) -> List[dict]:
+        """
+        带缓存的select_market_values
+
+        Args:
+            connection: 数据库连接, 缓存命中时不使用
+            versions: snapshot_versions的结果, 一次运行中选多个月份时先查询一次传入; None表示查询全部版本
+            其他参数同select_market_values
+
+        Returns:
+            [{"symbol", "name", "market_value"}], 按市值升序
+        """
+        report_month = month_start(report_month)
+        if versions is None:
+            versions = snapshot_versions(connection)
+        version = versions.get(report_month)
+        key = self._key(report_month, top_n, market, exchange, symbol_prefix)
+
+        with self._lock:
+            entry = self._load().get(key)
+            if version is not None and entry is not None and entry["version"] == version:
+                self.hits += 1
+                return [dict(value) for value in entry["values"]]
+
+        values = select_market_values(connection, report_month, top_n, market, exchange, symbol_prefix)
+        self.misses += 1
+        if version is None:
+            # 本次查询时才生成该月份的快照, 重新读取生成后的版本
+            version = snapshot_versions(connection).get(report_month)
+            versions[report_month] = version
+        if version is not None:
+            with self._lock:
+                self._load()[key] = {"version": version, "values": values}
+                self._save()
+        return [dict(value) for value in values]
+
+
+def main():
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+    from tools.db_pool import get_connection
+
+    with get_connection() as connection:
+        count = rebuild_snapshots(connection)
+    print(f"{SNAPSHOT_TABLE}: 生成 {count} 条快照")
+
+
+if __name__ == "__main__":
+    main()
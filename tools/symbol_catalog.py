@@ -0,0 +1,270 @@
+"""
+标的目录
+symbol_catalog表记录每个标的所在的数据表、交易所、首末K线日期和K线数量,
+由导入工具在写入K线后更新, API服务器从内存中读取, 不再对K线表做SELECT DISTINCT。
+
+首次使用或K线表由其他途径写入时, 可以全量重建:
+    python tools/symbol_catalog.py daily_hfq zh_index
+"""
+
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+CATALOG_TABLE = "symbol_catalog"
+
+# 允许登记的K线表, 表名会拼接进SQL
+BAR_TABLES = ("daily", "daily_hfq", "zh_index")
+
+# API服务器检查目录是否有更新的最小间隔(秒)
+CHECK_INTERVAL = 30
+
+CREATE_CATALOG_SQL = f"""
+CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} (
+    `table_name` VARCHAR(64) NOT NULL,
+    symbol VARCHAR(32) NOT NULL,
+    exchange VARCHAR(16),
+    first_date DATETIME,
+    last_date DATETIME,
+    bar_count INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    PRIMARY KEY (`table_name`, symbol),
+    KEY idx_symbol (symbol)
+)
+"""
+
+UPSERT_SQL = f"""
+INSERT INTO {CATALOG_TABLE} (`table_name`, symbol, exchange, first_date, last_date, bar_count)
+VALUES (%s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE exchange = VALUES(exchange), first_date = VALUES(first_date),
+    last_date = VALUES(last_date), bar_count = VALUES(bar_count)
+"""
+
+_table_checked = False
+
+
+def _check_table_name(table: str) -> None:
+    if table not in BAR_TABLES:
+        raise ValueError(f"未知的K线表: {table}")
+
+
+def ensure_catalog_table(connection) -> None:
+    """创建symbol_catalog表(如不存在), 每个进程只执行一次"""
+    global _table_checked
+    if _table_checked:
+        return
+    cursor = connection.cursor()
+    cursor.execute(CREATE_CATALOG_SQL)
+    connection.commit()
+    cursor.close()
+    _table_checked = True
+
+
+def refresh_symbols(connection, table: str, symbols: Iterable[str]) -> None:
+    """
+    重新统计指定标的并写入目录, 导入工具写入K线后调用
+
+    Args:
+        connection: 数据库连接
+        table: K线表名
+        symbols: 本次写入的标的代码
+    """
+    _check_table_name(table)
+    ensure_catalog_table(connection)
+
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return
+
+    cursor = connection.cursor()
+    placeholders = ", ".join(["%s"] * len(symbols))
+    cursor.execute(
+        f"SELECT symbol, MAX(exchange), MIN(datetime), MAX(datetime), COUNT(*) "
+        f"FROM {table} WHERE symbol IN ({placeholders}) GROUP BY symbol",
+        symbols,
+    )
+    rows = [(table,) + tuple(row) for row in cursor.fetchall()]
+    if rows:
+        cursor.executemany(UPSERT_SQL, rows)
+    connection.commit()
+    cursor.close()
+
+
+def rebuild_catalog(connection, table: str) -> int:
+    """
+    全量重建某张K线表的目录, 需要扫描整张表
+
+    Returns:
+        登记的标的数量
+    """
+    _check_table_name(table)
+    ensure_catalog_table(connection)
+
+    cursor = connection.cursor()
+    cursor.execute(
+        f"SELECT symbol, MAX(exchange), MIN(datetime), MAX(datetime), COUNT(*) "
+        f"FROM {table} GROUP BY symbol"
+    )
+    rows = [(table,) + tuple(row) for row in cursor.fetchall()]
+    cursor.execute(f"DELETE FROM {CATALOG_TABLE} WHERE `table_name` = %s", (table,))
+    if rows:
+        cursor.executemany(UPSERT_SQL, rows)
+    connection.commit()
+    cursor.close()
+    return len(rows)
+
+
+class SymbolCatalog:
+    """
+    内存中的标的目录
+
+    全部条目常驻内存, 标的列表预先排好序。读取时最多每check_interval秒
+    查询一次目录的更新时间, 导入工具更新目录后重新加载, 并对K线有变化的标的
+    调用on_change(table, symbol), 用于清理K线缓存。
+    """
+
+    def __init__(self, connection_factory: Callable, tables: Iterable[str],
+                 on_change: Callable[[str, str], None] = None,
+                 check_interval: float = CHECK_INTERVAL):
+        """
+        初始化标的目录
+
+        Args:
+            connection_factory: 返回数据库连接上下文管理器的函数, 如db_pool.get_connection
+            tables: 服务的K线表, 按路由优先级排列; 目录中没有某张表时自动全量重建
+            on_change: 标的K线有变化时的回调
+            check_interval: 检查目录更新的最小间隔(秒)
+        """
+        self.connection_factory = connection_factory
+        self.tables = list(tables)
+        self.on_change = on_change
+        self.check_interval = check_interval
+
+        self._entries: Dict[tuple, Dict] = {}
+        self._symbols: Dict[str, List[str]] = {}
+        self._tables_of: Dict[str, List[str]] = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fetch_version(self, cursor):
+        cursor.execute(f"SELECT MAX(updated_at), COUNT(*) FROM {CATALOG_TABLE}")
+        return tuple(cursor.fetchone())
+
+    def _refresh(self) -> None:
+        """目录有更新时重新加载, 调用方需持有锁"""
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+
+        with self.connection_factory() as connection:
+            ensure_catalog_table(connection)
+            cursor = connection.cursor()
+            version = self._fetch_version(cursor)
+            if version == self._version:
+                cursor.close()
+                return
+
+            cursor.execute(
+                f"SELECT `table_name`, symbol, exchange, first_date, last_date, bar_count FROM {CATALOG_TABLE}"
+            )
+            rows = cursor.fetchall()
+            loaded_tables = {row[0] for row in rows}
+            missing = [table for table in self.tables if table not in loaded_tables]
+            cursor.close()
+
+            if missing:
+                for table in missing:
+                    print(f"📚 标的目录中没有{table}, 全量重建...")
+                    rebuild_catalog(connection, table)
+                cursor = connection.cursor()
+                version = self._fetch_version(cursor)
+                cursor.execute(
+                    f"SELECT `table_name`, symbol, exchange, first_date, last_date, bar_count FROM {CATALOG_TABLE}"
+                )
+                rows = cursor.fetchall()
+                cursor.close()
+
+        entries = {}
+        for table, symbol, exchange, first_date, last_date, bar_count in rows:
+            if table not in self.tables:
+                continue
+            entries[(table, symbol)] = {
+                'table': table,
+                'symbol': symbol,
+                'exchange': exchange,
+                'first_date': first_date.strftime('%Y-%m-%d') if first_date else None,
+                'last_date': last_date.strftime('%Y-%m-%d') if last_date else None,
+                'bar_count': int(bar_count)
+            }
+
+        changed = []
+        if self._version is not None:
+            changed = [key for key in entries.keys() | self._entries.keys()
+                       if entries.get(key) != self._entries.get(key)]
+
+        symbols = {table: [] for table in self.tables}
+        tables_of = {}
+        for table, symbol in entries:
+            symbols[table].append(symbol)
+            tables_of.setdefault(symbol, []).append(table)
+        for table_symbols in symbols.values():
+            table_symbols.sort()
+        for symbol_tables in tables_of.values():
+            symbol_tables.sort(key=self.tables.index)
+
+        self._entries = entries
+        self._symbols = symbols
+        self._tables_of = tables_of
+        self._version = version
+
+        if self.on_change:
+            for table, symbol in changed:
+                self.on_change(table, symbol)
+
+    def invalidate(self) -> None:
+        """下次读取时立即检查目录是否有更新, 不等待check_interval"""
+        with self._lock:
+            self._checked_at = float('-inf')
+
+    def symbols(self, table: str) -> List[str]:
+        """某张表的全部标的, 已排序"""
+        with self._lock:
+            self._refresh()
+            return self._symbols.get(table, [])
+
+    def table_of(self, symbol: str) -> Optional[str]:
+        """
+        标的所在的K线表, 同时出现在多张表时按tables的顺序取第一张
+
+        Returns:
+            表名, 目录中没有该标的时返回None
+        """
+        with self._lock:
+            self._refresh()
+            tables = self._tables_of.get(symbol)
+            return tables[0] if tables else None
+
+    def get(self, symbol: str) -> List[Dict]:
+        """标的在各张表中的目录信息"""
+        with self._lock:
+            self._refresh()
+            return [self._entries[(table, symbol)] for table in self._tables_of.get(symbol, [])]
+
+
+def main():
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+    from tools.db_pool import get_connection
+
+    tables = sys.argv[1:] or list(BAR_TABLES)
+    with get_connection() as connection:
+        for table in tables:
+            count = rebuild_catalog(connection, table)
+            print(f"{table}: 登记 {count} 个标的")
+
+
+if __name__ == "__main__":
+    main()